@@ -1,16 +1,39 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, abort, make_response
 from flask_sqlalchemy import SQLAlchemy
+from flask_mail import Mail
 from sqlalchemy.sql import func, case
-from sqlalchemy import or_
+from sqlalchemy import or_, and_, type_coerce
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from collections import defaultdict
 from datetime import date, datetime, timedelta
 import os
 import io
+import csv
+import json
+import hashlib
+import mimetypes
+import bisect
+import heapq
+import secrets
+import threading
+import time
+import traceback
+import openpyxl
 import pandas as pd
+import numpy as np
 from werkzeug.utils import secure_filename
+from itsdangerous import URLSafeSerializer, BadData
+from jinja2 import FileSystemBytecodeCache
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import cloudinary
-import cloudinary.uploader
-from flask import send_file
+from armazenamento import criar_armazenamento
+from instrumentacao import Instrumentacao
+from cache import criar_cache
+from perfil_banco import opcoes_engine, configurar_conexoes
+from flask import send_file, send_from_directory, Response, stream_with_context
+from werkzeug.security import safe_join
 app = Flask(__name__)
 
 # --- CONFIGURAÇÕES GERAIS ---
@@ -22,7 +45,13 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'uma-chave-secreta-local
 database_uri = os.environ.get('DATABASE_URL_PYTHONANYWHERE', 'sqlite:///quiz.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool, pre-ping, reciclagem e timeouts conforme o banco (perfil_banco.py)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opcoes_engine(database_uri)
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'xls', 'xlsx'}
+# Com TAREFAS_EM_SEGUNDO_PLANO=1, exportações, importações e e-mails vão para a fila e são
+# executados pelo worker.py. Sem ela, as tarefas rodam na própria requisição.
+app.config['TAREFAS_EM_SEGUNDO_PLANO'] = os.environ.get('TAREFAS_EM_SEGUNDO_PLANO') == '1'
+app.config['PASTA_RESULTADOS_TAREFAS'] = os.path.join(app.instance_path, 'tarefas')
 
 # --- CONFIGURAÇÃO DO CLOUDINARY (Lê das Variáveis de Ambiente) ---
 cloudinary.config(
@@ -31,14 +60,57 @@ cloudinary.config(
     api_secret = os.environ.get('CLOUDINARY_API_SECRET')
 )
 
+# --- ARMAZENAMENTO DE ARQUIVOS (armazenamento.py) ---
+# Sem credenciais do Cloudinary, os arquivos ficam em static/uploads
+app.config['ARMAZENAMENTO'] = os.environ.get('ARMAZENAMENTO', 'cloudinary' if os.environ.get('CLOUDINARY_CLOUD_NAME') else 'local')
+app.config['PASTA_UPLOADS_LOCAL'] = os.path.join(app.root_path, 'static', 'uploads')
+app.config['PASTA_UPLOADS_PENDENTES'] = os.path.join(app.instance_path, 'uploads_pendentes')
+app.config['THREADS_DE_ARQUIVOS'] = int(os.environ.get('THREADS_DE_ARQUIVOS', 4))
+armazenamento = criar_armazenamento(app.config['ARMAZENAMENTO'], app.config['PASTA_UPLOADS_LOCAL'])
+
+# --- CONFIGURAÇÃO DE E-MAIL (usada pelo enviar_notificacoes.py) ---
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'localhost')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 25))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS') == '1'
+app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
+app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'quiz@empresa.com')
+
+# --- INSTRUMENTAÇÃO (instrumentacao.py) ---
+# Com INSTRUMENTACAO=1, mede latência e consultas SQL de cada rota (/metrics e /admin/desempenho).
+# METRICS_TOKEN permite que o Prometheus leia /metrics sem a sessão de admin.
+app.config['INSTRUMENTACAO'] = os.environ.get('INSTRUMENTACAO') == '1'
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+
+# --- CACHE (cache.py) ---
+# Com mais de um worker no gunicorn use 'sqlite' (padrão), que é compartilhado entre eles.
+app.config['CACHE'] = os.environ.get('CACHE', 'sqlite')
+app.config['CACHE_ARQUIVO'] = os.environ.get('CACHE_ARQUIVO', os.path.join(app.instance_path, 'cache.sqlite3'))
+app.config['CACHE_VALIDADE'] = int(os.environ.get('CACHE_VALIDADE', 300)) # segundos
+# Templates já compilados ficam em disco: um worker novo do gunicorn não recompila nenhum (vazio desliga)
+app.config['JINJA_CACHE'] = os.environ.get('JINJA_CACHE', os.path.join(app.instance_path, 'jinja_cache'))
+
 # --- INICIALIZAÇÕES ---
 db = SQLAlchemy(app)
+with app.app_context():
+    configurar_conexoes(db.engine)
+cache = criar_cache(app.config['CACHE'], app.config['CACHE_ARQUIVO'], app.config['CACHE_VALIDADE'])
+cache.vincular_sessoes()
+if app.config['JINJA_CACHE']:
+    os.makedirs(app.config['JINJA_CACHE'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE'])
+mail = Mail(app)
+instrumentacao = Instrumentacao()
+if app.config['INSTRUMENTACAO']:
+    instrumentacao.init_app(app)
 SENHA_ADMIN = "admin123"
 
 # --- TABELA DE LIGAÇÃO (MUITOS-PARA-MUITOS) ---
 pergunta_departamento_association = db.Table('pergunta_departamento',
     db.Column('pergunta_id', db.Integer, db.ForeignKey('pergunta.id'), primary_key=True),
-    db.Column('departamento_id', db.Integer, db.ForeignKey('departamento.id'), primary_key=True)
+    db.Column('departamento_id', db.Integer, db.ForeignKey('departamento.id'), primary_key=True),
+    # A chave primária começa por pergunta_id; este índice atende a busca "perguntas do setor X"
+    db.Index('ix_pergunta_departamento_departamento', 'departamento_id', 'pergunta_id')
 )
 
 # --- MODELOS DO BANCO DE DADOS ---
@@ -52,9 +124,11 @@ class Usuario(db.Model):
     nome = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=True)
     codigo_acesso = db.Column(db.String(4), unique=True, nullable=False)
-    departamento_id = db.Column(db.Integer, db.ForeignKey('departamento.id'), nullable=False)
+    departamento_id = db.Column(db.Integer, db.ForeignKey('departamento.id'), nullable=False, index=True)
     respostas = db.relationship('Resposta', backref='usuario', lazy=True)
 
+    __table_args__ = (db.Index('ix_usuario_nome_id', 'nome', 'id'),) # paginação da lista do admin
+
 class Pergunta(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     tipo = db.Column(db.String(20), nullable=False, default='multipla_escolha')
@@ -71,13 +145,18 @@ class Pergunta(db.Model):
     departamentos = db.relationship('Departamento', secondary=pergunta_departamento_association, lazy='subquery',
         backref=db.backref('perguntas', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_pergunta_tipo_data', 'tipo', 'data_liberacao'),
+        db.Index('ix_pergunta_data_id', 'data_liberacao', 'id'), # paginação da lista do admin
+    )
+
 class Resposta(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     pontos = db.Column(db.Integer, nullable=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
     pergunta_id = db.Column(db.Integer, db.ForeignKey('pergunta.id'), nullable=False)
     resposta_dada = db.Column(db.String(1), nullable=True)
-    data_resposta = db.Column(db.DateTime, default=datetime.utcnow)
+    data_resposta = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) # chave da paginação: nunca nula
     pergunta = db.relationship('Pergunta')
     texto_discursivo = db.Column(db.Text, nullable=True)
     anexo_resposta = db.Column(db.String(300), nullable=True)
@@ -85,6 +164,103 @@ class Resposta(db.Model):
     feedback_admin = db.Column(db.Text, nullable=True)
     feedback_visto = db.Column(db.Boolean, default=False, nullable=False)
 
+    # Cada usuário responde uma pergunta uma única vez; o mesmo índice sustenta
+    # o anti-join (NOT EXISTS) da consulta de perguntas pendentes.
+    __table_args__ = (
+        db.Index('uq_resposta_usuario_pergunta', 'usuario_id', 'pergunta_id', unique=True),
+        db.Index('ix_resposta_pergunta', 'pergunta_id'),
+        db.Index('ix_resposta_status_data', 'status_correcao', 'data_resposta'),
+        db.Index('ix_resposta_usuario_data', 'usuario_id', 'data_resposta'), # paginação de "Minhas Respostas"
+    )
+
+# --- PLACAR DO RANKING (mantido junto com cada resposta/correção) ---
+class PontuacaoUsuario(db.Model):
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), primary_key=True)
+    pontos_totais = db.Column(db.Integer, nullable=False, default=0)
+    total_respostas = db.Column(db.Integer, nullable=False, default=0)
+    total_acertos = db.Column(db.Integer, nullable=False, default=0)
+
+class PontuacaoDepartamento(db.Model):
+    departamento_id = db.Column(db.Integer, db.ForeignKey('departamento.id'), primary_key=True)
+    pontos_totais = db.Column(db.Integer, nullable=False, default=0)
+    num_usuarios = db.Column(db.Integer, nullable=False, default=0)
+
+# --- RESUMO DIÁRIO DO RELATÓRIO DE DESEMPENHO ---
+# Respostas, corretas e pontos de cada usuário por dia (data da resposta, em UTC), mantidos junto
+# com cada resposta gravada, corrigida ou apagada. O relatório soma estas linhas em vez de agregar
+# todas as respostas, e qualquer período sai pela chave primária (usuario_id, dia).
+class ResumoDiarioUsuario(db.Model):
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), primary_key=True)
+    dia = db.Column(db.Date, primary_key=True)
+    respostas = db.Column(db.Integer, nullable=False, default=0)
+    corretas = db.Column(db.Integer, nullable=False, default=0)
+    pontos = db.Column(db.Integer, nullable=False, default=0)
+
+# --- ENTREGA DAS PERGUNTAS DO QUIZ (cronômetro no servidor) ---
+class EntregaPergunta(db.Model):
+    # Primeira entrega de cada pergunta a cada usuário: recarregar a página não reinicia o cronômetro
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), primary_key=True)
+    pergunta_id = db.Column(db.Integer, db.ForeignKey('pergunta.id'), primary_key=True)
+    entregue_em = db.Column(db.DateTime, nullable=False)
+
+# --- NOTIFICAÇÕES POR E-MAIL (enviar_notificacoes.py) ---
+class NotificacaoEnviada(db.Model):
+    # A chave identifica o envio (ex.: 'novas-perguntas:2025-10-01'); reexecutar o envio não repete e-mails
+    id = db.Column(db.Integer, primary_key=True)
+    chave = db.Column(db.String(100), nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    enviada_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('uq_notificacao_enviada_chave_usuario', 'chave', 'usuario_id', unique=True),)
+
+class NotificacaoFalha(db.Model):
+    # "Dead letter": e-mails que falharam em todas as tentativas, para análise e reenvio
+    id = db.Column(db.Integer, primary_key=True)
+    chave = db.Column(db.String(100), nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    email = db.Column(db.String(120), nullable=False)
+    erro = db.Column(db.Text, nullable=False)
+    tentativas = db.Column(db.Integer, nullable=False)
+    criada_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# --- PRÉ-VISUALIZAÇÃO DE PLANILHAS (guardada no servidor, não no cookie da sessão) ---
+class ImportacaoPlanilha(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(64), unique=True, nullable=False) # Só o token vai para a sessão
+    cabecalhos = db.Column(db.Text, nullable=False) # JSON
+    criada_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expira_em = db.Column(db.DateTime, nullable=False, index=True)
+    linhas = db.relationship('LinhaImportacaoPlanilha', backref='importacao', lazy='dynamic', cascade='all, delete-orphan')
+
+class LinhaImportacaoPlanilha(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    importacao_id = db.Column(db.Integer, db.ForeignKey('importacao_planilha.id'), nullable=False)
+    posicao = db.Column(db.Integer, nullable=False) # Ordem da linha na planilha
+    dados = db.Column(db.Text, nullable=False) # JSON
+    erros = db.Column(db.Text, nullable=False, default='{}') # JSON
+    valida = db.Column(db.Boolean, nullable=False)
+
+    __table_args__ = (db.Index('uq_linha_importacao_posicao', 'importacao_id', 'posicao', unique=True),)
+
+# --- FILA DE TAREFAS (executadas pelo worker.py) ---
+class Tarefa(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    parametros = db.Column(db.Text, nullable=False, default='{}') # JSON
+    status = db.Column(db.String(20), nullable=False, default='pendente') # pendente, executando, concluida, falhou
+    progresso = db.Column(db.Integer, nullable=False, default=0) # 0 a 100
+    mensagem = db.Column(db.String(500), nullable=True)
+    erro = db.Column(db.Text, nullable=True)
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    max_tentativas = db.Column(db.Integer, nullable=False, default=3)
+    executar_apos = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    arquivo_resultado = db.Column(db.String(300), nullable=True)
+    nome_arquivo = db.Column(db.String(200), nullable=True)
+    criada_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    atualizada_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_tarefa_status_executar_apos', 'status', 'executar_apos'),)
+
 # --- FUNÇÕES AUXILIARES ---
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
@@ -108,44 +284,164 @@ def get_texto_da_opcao(pergunta, opcao):
     if opcao == 'f': return "Falso"
     return ""
 
+def url_pagina(**alteracoes):
+    """URL da página atual mantendo os filtros da query string; valores None removem o parâmetro."""
+    args = request.args.to_dict()
+    args.update(alteracoes)
+    return url_for(request.endpoint, **(request.view_args or {}), **{k: v for k, v in args.items() if v is not None})
+
+def _lista_departamentos():
+    """Setores (id e nome) em ordem alfabética, para os formulários e filtros."""
+    return cache.obter_ou_calcular('setores', lambda: [
+        {'id': id_, 'nome': nome} for id_, nome in db.session.query(Departamento.id, Departamento.nome).order_by(Departamento.nome)
+    ], tags=('departamento',))
+
+# --- ARQUIVOS ESTÁTICOS COM HASH (construir_assets.py) ---
+# Depois de 'python construir_assets.py', CSS, JS e áudios são servidos de static/dist/ com o
+# hash do conteúdo no nome, pré-comprimidos e com cache "imutável" de um ano: visitas seguintes
+# não baixam nada. Sem o manifesto (desenvolvimento), url_asset aponta para os originais.
+PASTA_ASSETS = os.path.join(app.static_folder, 'dist')
+VALIDADE_ASSETS = 365 * 24 * 3600 # segundos
+CODIFICACOES_ASSETS = (('br', '.br'), ('gzip', '.gz')) # em ordem de preferência
+
+def _carregar_manifesto_assets():
+    try:
+        with open(os.path.join(PASTA_ASSETS, 'manifesto.json'), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return {}
+
+manifesto_assets = _carregar_manifesto_assets()
+# Entra na chave das páginas em cache: HTML guardado antes de um novo build não aponta para assets apagados
+versao_assets = hashlib.sha1(json.dumps(manifesto_assets, sort_keys=True).encode()).hexdigest()[:8]
+
+def url_asset(caminho):
+    """URL do arquivo 'caminho' (relativo a static/): a versão com hash, se os assets foram construídos."""
+    compilado = manifesto_assets.get(caminho)
+    if compilado:
+        return url_for('asset_compilado', arquivo=compilado)
+    return url_for('static', filename=caminho)
+
+@app.route('/static/dist/<path:arquivo>')
+def asset_compilado(arquivo):
+    # A versão pré-comprimida só é escolhida se o navegador aceitar a codificação
+    for codificacao, extensao in CODIFICACOES_ASSETS:
+        comprimido = safe_join(PASTA_ASSETS, arquivo + extensao)
+        if request.accept_encodings[codificacao] and comprimido and os.path.isfile(comprimido):
+            resposta = send_from_directory(PASTA_ASSETS, arquivo + extensao, mimetype=mimetypes.guess_type(arquivo)[0],
+                                           max_age=VALIDADE_ASSETS)
+            resposta.headers['Content-Encoding'] = codificacao
+            break
+    else:
+        resposta = send_from_directory(PASTA_ASSETS, arquivo, max_age=VALIDADE_ASSETS)
+    resposta.headers['Cache-Control'] = f'public, max-age={VALIDADE_ASSETS}, immutable'
+    resposta.vary.add('Accept-Encoding')
+    return resposta
+
 @app.context_processor
 def utility_processor():
-    return dict(get_texto_da_opcao=get_texto_da_opcao)
-
-def validar_linha(row):
-    errors = {}
-    if not row.get('texto'): errors['texto'] = "O texto não pode ser vazio."
-    tipo = str(row.get('tipo') or '').lower()
-    if tipo not in ['multipla_escolha', 'verdadeiro_falso', 'discursiva']:
-        errors['tipo'] = "Tipo inválido."
-    resposta = str(row.get('resposta_correta') or '').lower()
-    if tipo == 'multipla_escolha' and resposta not in ['a', 'b', 'c', 'd']:
-        errors['resposta_correta'] = "Deve ser a, b, c ou d."
-    elif tipo == 'verdadeiro_falso' and resposta not in ['v', 'f']:
-        errors['resposta_correta'] = "Deve ser v ou f."
+    return dict(get_texto_da_opcao=get_texto_da_opcao, url_pagina=url_pagina, url_asset=url_asset)
+
+# --- PÁGINAS EM CACHE (HTML pronto, com ETag) ---
+def _chave_da_pagina():
+    argumentos = '&'.join(f'{nome}={valor}' for nome, valor in sorted(request.args.items(multi=True)))
+    return f'pagina:{versao_assets}:{request.path}?{argumentos}'
+
+def pagina_em_cache(renderizar, tags):
+    """Resposta com o HTML de 'renderizar()', guardado no cache até alguma das 'tags' (tabelas) mudar.
+
+    Visitas repetidas não passam pelo banco nem pelo Jinja. O ETag sai das versões das tags,
+    então quem já tem a versão atual (If-None-Match) recebe um 304 sem nem ler o HTML guardado.
+    Só serve para páginas iguais para todos que podem vê-las: o controle de acesso fica na
+    rota, antes da chamada. Com mensagens flash pendentes a página é renderizada na hora,
+    porque elas são só deste usuário.
+    """
+    if session.get('_flashes'):
+        return renderizar()
+    chave = _chave_da_pagina()
+    # Versões lidas antes do HTML: ele é no mínimo desta versão, nunca mais antigo que o ETag
+    etag = hashlib.sha1(f'{chave}:{cache.versoes(tags)}'.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        resposta = make_response('', 304)
+    else:
+        resposta = make_response(cache.obter_ou_calcular(chave, renderizar, tags=tags))
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'private, no-cache' # o navegador guarda, mas confere o ETag a cada visita
+    return resposta
+
+# --- PAGINAÇÃO POR CHAVE (sem OFFSET: o custo de cada página não cresce com o histórico) ---
+ITENS_POR_PAGINA = 50
+
+class PaginaPorChave:
+    def __init__(self, itens, anterior, proxima):
+        self.itens = itens
+        self.anterior = anterior # cursor para o parâmetro 'antes', ou None na primeira página
+        self.proxima = proxima   # cursor para o parâmetro 'apos', ou None na última página
+
+def _cursor(item, coluna):
+    valor = getattr(item, coluna.key)
+    return f"{valor.isoformat() if hasattr(valor, 'isoformat') else valor}_{item.id}"
+
+def _ler_cursor(cursor, coluna):
+    """'<valor>_<id>' -> (valor, id); cursores inválidos (URL editada à mão) voltam ao início."""
     try:
-        if isinstance(row.get('data_liberacao'), datetime):
-             row['data_liberacao'] = row['data_liberacao'].strftime('%d/%m/%Y')
-        datetime.strptime(str(row.get('data_liberacao', '')), '%d/%m/%Y').date()
-    except (ValueError, TypeError):
-        errors['data_liberacao'] = "Formato inválido. Use DD/MM/AAAA."
-    if tipo != 'discursiva':
-        try:
-            int(float(row.get('tempo_limite', '')))
-        except (ValueError, TypeError):
-            errors['tempo_limite'] = "Deve ser um número."
-    is_valid = not errors
-    return is_valid, errors
-
-def _gerar_dados_relatorio(departamento_id=None):
-    """Função auxiliar que busca e processa os dados para o relatório."""
+        valor, id_ = cursor.rsplit('_', 1)
+        tipo = coluna.type.python_type
+        return (tipo.fromisoformat(valor) if hasattr(tipo, 'fromisoformat') else tipo(valor)), int(id_)
+    except (AttributeError, ValueError):
+        return None
+
+def paginar_por_chave(query, coluna, coluna_id, apos=None, antes=None, decrescente=True, por_pagina=ITENS_POR_PAGINA):
+    """Pagina 'query' pela chave (coluna, coluna_id), por padrão do mais recente para o mais antigo.
+
+    'apos' e 'antes' são os cursores de PaginaPorChave.proxima/.anterior. Cada página é
+    um 'WHERE chave < cursor ORDER BY chave DESC LIMIT n', que o índice resolve direto.
+    As colunas da chave não podem ser nulas: a comparação com o cursor descartaria essas linhas.
+    """
+    limite = _ler_cursor(antes, coluna) if antes else _ler_cursor(apos, coluna)
+    voltando = bool(antes) and limite is not None
+    para_baixo = decrescente != voltando
+    if limite:
+        valor, id_ = limite
+        if para_baixo:
+            query = query.filter(or_(coluna < valor, and_(coluna == valor, coluna_id < id_)))
+        else:
+            query = query.filter(or_(coluna > valor, and_(coluna == valor, coluna_id > id_)))
+    ordem = (coluna.desc(), coluna_id.desc()) if para_baixo else (coluna.asc(), coluna_id.asc())
+    itens = query.order_by(*ordem).limit(por_pagina + 1).all()
+    tem_mais = len(itens) > por_pagina
+    itens = itens[:por_pagina]
+    if voltando:
+        itens.reverse()
+        tem_anterior, tem_proxima = tem_mais, True
+    else:
+        tem_anterior, tem_proxima = limite is not None, tem_mais
+    if not itens:
+        return PaginaPorChave([], None, None)
+    return PaginaPorChave(itens,
+                          _cursor(itens[0], coluna) if tem_anterior else None,
+                          _cursor(itens[-1], coluna) if tem_proxima else None)
+
+def _gerar_dados_relatorio(departamento_id=None, inicio=None, fim=None):
+    """Dados do relatório de desempenho, em cache até a próxima alteração de usuários, setores ou respostas."""
+    return cache.obter_ou_calcular(f'relatorio:{departamento_id or "todos"}:{inicio or ""}:{fim or ""}',
+                                   lambda: _calcular_dados_relatorio(departamento_id, inicio, fim),
+                                   tags=('usuario', 'departamento', 'resumo_diario_usuario'))
+
+def _calcular_dados_relatorio(departamento_id=None, inicio=None, fim=None):
+    """Função auxiliar que busca e processa os dados para o relatório (somando o resumo diário do período)."""
+    juncao = ResumoDiarioUsuario.usuario_id == Usuario.id
+    if inicio:
+        juncao = and_(juncao, ResumoDiarioUsuario.dia >= inicio)
+    if fim:
+        juncao = and_(juncao, ResumoDiarioUsuario.dia <= fim)
     query = db.session.query(
         Usuario.nome,
         Departamento.nome.label('setor_nome'),
-        func.count(Resposta.id).label('total_respostas'),
-        func.sum(case((or_(Resposta.pontos > 0, Resposta.status_correcao.in_(['correto', 'parcialmente_correto'])), 1), else_=0)).label('respostas_corretas'),
-        func.coalesce(func.sum(Resposta.pontos), 0).label('pontuacao_total')
-    ).select_from(Usuario).join(Departamento).outerjoin(Resposta).group_by(
+        func.coalesce(func.sum(ResumoDiarioUsuario.respostas), 0).label('total_respostas'),
+        func.coalesce(func.sum(ResumoDiarioUsuario.corretas), 0).label('respostas_corretas'),
+        func.coalesce(func.sum(ResumoDiarioUsuario.pontos), 0).label('pontuacao_total')
+    ).select_from(Usuario).join(Departamento).outerjoin(ResumoDiarioUsuario, juncao).group_by(
         # MUDANÇA: Adicionamos Departamento.nome ao GROUP BY
         Usuario.id, Departamento.nome
     )
@@ -168,6 +464,1216 @@ def _gerar_dados_relatorio(departamento_id=None):
         })
     return relatorios_finais
 
+# --- ÍNDICE DE VISIBILIDADE DAS PERGUNTAS (cache por processo) ---
+VALIDADE_INDICE_VISIBILIDADE = int(os.environ.get('VALIDADE_INDICE_VISIBILIDADE', 60)) # segundos
+TIPOS_OBJETIVOS = ('multipla_escolha', 'verdadeiro_falso')
+
+class IndiceVisibilidade:
+    """Perguntas visíveis para cada setor, separadas por tipo e ordenadas por (data_liberacao, id).
+
+    Montado com duas consultas simples e guardado em memória, para que as rotas do usuário
+    não precisem do OR com subconsulta em 'pergunta_departamento' a cada requisição.
+    É remontado quando as tags dessas tabelas mudam no cache (qualquer commit que as altere,
+    em qualquer processo, com CACHE=sqlite) ou quando a validade expira.
+    """
+    TAGS = ('departamento', 'pergunta', 'pergunta_departamento')
+
+    def __init__(self, validade):
+        self.validade = validade
+        self._trava = threading.Lock()
+        self._dados = None
+        self._versoes = None
+        self._montado_em = 0
+
+    def _obter(self):
+        # As versões são lidas antes de montar: uma alteração no meio faz a próxima chamada remontar
+        versoes = cache.versoes(self.TAGS)
+        dados = self._dados
+        if dados is not None and versoes == self._versoes and time.monotonic() - self._montado_em < self.validade:
+            return dados
+        dados = self._montar()
+        with self._trava:
+            self._dados, self._versoes, self._montado_em = dados, versoes, time.monotonic()
+        return dados
+
+    @staticmethod
+    def _montar():
+        """{departamento_id: {tipo: [(data_liberacao, id), ...]}}; a chave None guarda as 'para todos'."""
+        para_todos = defaultdict(list)
+        por_setor = defaultdict(lambda: defaultdict(list))
+        perguntas = {}
+        for id_, tipo, data_liberacao, todos in db.session.query(
+                Pergunta.id, Pergunta.tipo, Pergunta.data_liberacao, Pergunta.para_todos_setores):
+            perguntas[id_] = (tipo, data_liberacao)
+            if todos:
+                para_todos[tipo].append((data_liberacao, id_))
+        t = pergunta_departamento_association
+        for departamento_id, pergunta_id in db.session.query(t.c.departamento_id, t.c.pergunta_id):
+            if pergunta_id in perguntas:
+                tipo, data_liberacao = perguntas[pergunta_id]
+                por_setor[departamento_id][tipo].append((data_liberacao, pergunta_id))
+
+        dados = {None: {tipo: sorted(lista) for tipo, lista in para_todos.items()}}
+        for departamento_id, tipos in por_setor.items():
+            dados[departamento_id] = {tipo: sorted(para_todos.get(tipo, []) + tipos.get(tipo, []))
+                                      for tipo in set(para_todos) | set(tipos)}
+        return dados
+
+    def liberadas(self, departamento_id, tipos, hoje):
+        """IDs visíveis para o setor, dos tipos pedidos, já liberadas até 'hoje', da mais antiga para a mais nova."""
+        dados = self._obter()
+        por_tipo = dados.get(departamento_id, dados[None])
+        listas = []
+        for tipo in tipos:
+            lista = por_tipo.get(tipo, [])
+            listas.append(lista[:bisect.bisect_right(lista, (hoje, float('inf')))])
+        return [id_ for _, id_ in heapq.merge(*listas)]
+
+indice_visibilidade = IndiceVisibilidade(VALIDADE_INDICE_VISIBILIDADE)
+
+# --- CONSULTA DE PERGUNTAS PENDENTES ---
+def _setor_e_respondidas(usuario_id):
+    """Setor do usuário e o conjunto das perguntas que ele já respondeu (pelo índice único usuario/pergunta)."""
+    departamento_id = db.session.query(Usuario.departamento_id).filter(Usuario.id == usuario_id).scalar()
+    # Direto pela conexão, sem a camada do ORM: com 20 mil respostas, montar cada linha pelo ORM custava 5x mais
+    respondidas = {id_ for id_, in db.session.connection().execute(
+        db.select(Resposta.pergunta_id).where(Resposta.usuario_id == usuario_id))}
+    return departamento_id, respondidas
+
+def _contagem_pendentes(usuario_id, hoje):
+    """Retorna (quiz rápido, discursivas) pendentes do usuário: perguntas visíveis menos as respondidas."""
+    departamento_id, respondidas = _setor_e_respondidas(usuario_id)
+    objetivas = indice_visibilidade.liberadas(departamento_id, TIPOS_OBJETIVOS, hoje)
+    discursivas = indice_visibilidade.liberadas(departamento_id, ('discursiva',), hoje)
+    return (sum(1 for id_ in objetivas if id_ not in respondidas),
+            sum(1 for id_ in discursivas if id_ not in respondidas))
+
+def _proxima_pergunta_pendente(usuario_id, hoje):
+    """Próxima pergunta objetiva pendente (a liberada há mais tempo), ou None."""
+    departamento_id, respondidas = _setor_e_respondidas(usuario_id)
+    for id_ in indice_visibilidade.liberadas(departamento_id, TIPOS_OBJETIVOS, hoje):
+        if id_ not in respondidas:
+            return Pergunta.query.get(id_)
+    return None
+
+def _perguntas_pendentes(usuario_id, hoje, quantidade):
+    """Até 'quantidade' perguntas objetivas pendentes (na ordem do quiz) e o total de pendentes."""
+    departamento_id, respondidas = _setor_e_respondidas(usuario_id)
+    ids = [id_ for id_ in indice_visibilidade.liberadas(departamento_id, TIPOS_OBJETIVOS, hoje) if id_ not in respondidas]
+    primeiras = ids[:quantidade]
+    por_id = {p.id: p for p in Pergunta.query.filter(Pergunta.id.in_(primeiras))} if primeiras else {}
+    return [por_id[id_] for id_ in primeiras if id_ in por_id], len(ids)
+
+# --- TOKENS DAS PERGUNTAS DO QUIZ (cronômetro no servidor) ---
+# Cada pergunta entregue ao usuário (/quiz ou API) leva um token assinado com a pergunta, o
+# usuário e o instante da primeira entrega, guardado em 'entrega_pergunta' (recarregar a página
+# devolve o mesmo instante). Na resposta, o tempo decorrido sai do próprio token: sem consulta
+# ao banco nem escrita na sessão, e o tempo_restante enviado pelo navegador é ignorado.
+_assinador_perguntas = URLSafeSerializer(app.config['SECRET_KEY'], salt='token-pergunta-quiz')
+_EPOCA = datetime(1970, 1, 1)
+
+def emitir_token_pergunta(pergunta_id, usuario_id, emitido_ms=None):
+    if emitido_ms is None:
+        emitido_ms = int(time.time() * 1000)
+    return _assinador_perguntas.dumps([pergunta_id, usuario_id, emitido_ms])
+
+def entregar_perguntas(usuario_id, perguntas):
+    """Registra a primeira entrega de cada pergunta ao usuário e faz o commit.
+
+    Retorna {pergunta_id: (token, segundos restantes ou None)}. Uma pergunta já entregue
+    mantém o instante da primeira entrega, e o tempo restante desconta o que já passou.
+    """
+    if not perguntas:
+        return {}
+    agora = _EPOCA + timedelta(milliseconds=int(time.time() * 1000))
+    insert, _ = _insert_ignorando_duplicadas(EntregaPergunta.__table__, ['usuario_id', 'pergunta_id'])
+    db.session.execute(insert, [{'usuario_id': usuario_id, 'pergunta_id': p.id, 'entregue_em': agora} for p in perguntas])
+    entregas = dict(db.session.query(EntregaPergunta.pergunta_id, EntregaPergunta.entregue_em).filter(
+        EntregaPergunta.usuario_id == usuario_id, EntregaPergunta.pergunta_id.in_([p.id for p in perguntas])))
+    db.session.commit()
+    resultado = {}
+    for pergunta in perguntas:
+        entregue_em = entregas.get(pergunta.id, agora)
+        decorrido = int((agora - entregue_em).total_seconds())
+        restante = None if pergunta.tempo_limite is None else max(0, pergunta.tempo_limite - decorrido)
+        resultado[pergunta.id] = (emitir_token_pergunta(pergunta.id, usuario_id, (entregue_em - _EPOCA) // timedelta(milliseconds=1)), restante)
+    return resultado
+
+def segundos_desde_emissao(token, pergunta_id, usuario_id):
+    """Segundos inteiros desde a entrega da pergunta, ou None se o token falta, é inválido ou é de outra pergunta/usuário."""
+    if not token:
+        return None
+    try:
+        token_pergunta, token_usuario, emitido_ms = _assinador_perguntas.loads(token)
+    except (BadData, TypeError, ValueError):
+        return None
+    if token_pergunta != pergunta_id or token_usuario != usuario_id:
+        return None
+    return max(0, int(time.time() * 1000) - emitido_ms) // 1000
+
+# --- REGISTRO DE RESPOSTAS DO QUIZ (idempotente) ---
+BONUS_POR_SEGUNDO = 5
+
+def _insert_do_dialeto(tabela):
+    """INSERT com as extensões de 'upsert' do banco em uso (ON CONFLICT ou, no MySQL, ON DUPLICATE KEY)."""
+    dialeto = db.engine.dialect.name
+    modulo = mysql if dialeto == 'mysql' else postgresql if dialeto == 'postgresql' else sqlite
+    return modulo.insert(tabela)
+
+def _reservar_escrita():
+    """No SQLite, abre a transação já com a trava de escrita (BEGIN IMMEDIATE).
+
+    O driver sqlite3 só emite o BEGIN antes da primeira escrita, então uma leitura feita antes
+    dela não faz parte da transação e outra conexão pode mudar os dados lidos no meio. Nos
+    outros bancos o FOR UPDATE da própria leitura já trava as linhas.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+    conexao = db.session.connection().connection.dbapi_connection
+    if not conexao.in_transaction:
+        conexao.execute('BEGIN IMMEDIATE')
+
+def _insert_ignorando_duplicadas(tabela, chave):
+    """INSERT que não faz nada quando as colunas de 'chave' já existem; devolve (insert, tem RETURNING)."""
+    insert = _insert_do_dialeto(tabela)
+    if db.engine.dialect.name == 'mysql':
+        return insert.prefix_with('IGNORE'), False
+    return insert.on_conflict_do_nothing(index_elements=chave), True
+
+def registrar_resposta_objetiva(usuario_id, pergunta_id, resposta, decorrido):
+    """Grava a resposta de quiz rápido com uma única instrução e soma os pontos ao placar.
+
+    A pontuação é calculada no próprio INSERT ... SELECT a partir da pergunta, e o índice único
+    (usuario_id, pergunta_id) descarta a segunda resposta: duplo clique, POST reenviado ou
+    requisições simultâneas gravam uma resposta só e contam no placar uma vez só.
+    'decorrido' são os segundos desde a entrega da pergunta (segundos_desde_emissao); None
+    zera o bônus de tempo. Só grava perguntas objetivas, já liberadas e visíveis para o setor
+    do usuário. Retorna os pontos ganhos, ou None se nada foi gravado (ver resposta_ja_registrada).
+    """
+    if decorrido is None:
+        bonus_valido = 0
+    else:
+        bonus_valido = case((Pergunta.tempo_limite > decorrido, (Pergunta.tempo_limite - decorrido) * BONUS_POR_SEGUNDO), else_=0)
+    acertou = Pergunta.resposta_correta == resposta
+    agora = datetime.utcnow()
+    selecao = db.select(
+        db.literal(usuario_id), Pergunta.id, db.literal(resposta),
+        case((acertou, 100 + bonus_valido), else_=0),
+        case((acertou, 'correto'), else_='incorreto'),
+        db.literal(agora), db.false()
+    ).where(Pergunta.id == pergunta_id, Pergunta.tipo != 'discursiva', Pergunta.data_liberacao <= date.today(),
+            _visivel_para_o_usuario(usuario_id))
+
+    tabela = Resposta.__table__
+    insert, tem_returning = _insert_ignorando_duplicadas(tabela, ['usuario_id', 'pergunta_id'])
+    insert = insert.from_select(['usuario_id', 'pergunta_id', 'resposta_dada', 'pontos', 'status_correcao',
+                                 'data_resposta', 'feedback_visto'], selecao)
+    if tem_returning:
+        pontos = db.session.execute(insert.returning(tabela.c.pontos)).scalar()
+    else:
+        # MySQL não tem RETURNING: os pontos são lidos de volta só quando a linha foi inserida
+        if not db.session.execute(insert).rowcount:
+            return None
+        pontos = db.session.execute(db.select(tabela.c.pontos).where(
+            tabela.c.usuario_id == usuario_id, tabela.c.pergunta_id == pergunta_id)).scalar()
+    if pontos is None:
+        return None
+    _atualizar_placar(usuario_id, pontos=pontos, respostas=1, acertos=1 if pontos > 0 else 0)
+    _somar_ao_resumo_diario([{'usuario_id': usuario_id, 'dia': agora.date(), 'respostas': 1,
+                              'corretas': 1 if pontos > 0 else 0, 'pontos': pontos}])
+    return pontos
+
+def _visivel_para_o_usuario(usuario_id):
+    """Condição SQL: a pergunta é para todos os setores ou para o setor do usuário."""
+    t = pergunta_departamento_association
+    departamento_do_usuario = db.select(Usuario.departamento_id).where(Usuario.id == usuario_id).scalar_subquery()
+    return or_(Pergunta.para_todos_setores == True, db.select(t.c.pergunta_id).where(
+        t.c.pergunta_id == Pergunta.id, t.c.departamento_id == departamento_do_usuario).exists())
+
+def resposta_ja_registrada(usuario_id, pergunta_id):
+    """Depois de registrar_resposta_objetiva devolver None: True se foi resposta repetida,
+    False se a pergunta não existe, é discursiva, ainda não foi liberada ou é de outro setor."""
+    return db.session.query(db.select(Resposta.id).where(
+        Resposta.usuario_id == usuario_id, Resposta.pergunta_id == pergunta_id).exists()).scalar()
+
+# --- PLACAR DO RANKING ---
+def _atualizar_placar(usuario_id, pontos=0, respostas=0, acertos=0):
+    """Soma as variações ao placar do usuário e do setor dele, na transação corrente.
+
+    Deve ser chamada depois de adicionar/alterar a resposta na sessão e antes do commit,
+    para que placar e respostas nunca fiquem divergentes.
+    """
+    atualizados = db.session.execute(db.update(PontuacaoUsuario).where(PontuacaoUsuario.usuario_id == usuario_id).values(
+        pontos_totais=PontuacaoUsuario.pontos_totais + pontos,
+        total_respostas=PontuacaoUsuario.total_respostas + respostas,
+        total_acertos=PontuacaoUsuario.total_acertos + acertos
+    )).rowcount
+    if not atualizados:
+        # Usuário sem linha no placar (criado antes da migração): recalcula a partir das respostas
+        db.session.flush()
+        _reconstruir_placar_usuarios([usuario_id])
+    departamento_do_usuario = db.select(Usuario.departamento_id).where(Usuario.id == usuario_id).scalar_subquery()
+    atualizados = db.session.execute(db.update(PontuacaoDepartamento).where(PontuacaoDepartamento.departamento_id == departamento_do_usuario).values(
+        pontos_totais=PontuacaoDepartamento.pontos_totais + pontos
+    )).rowcount
+    if not atualizados and pontos:
+        # Setor sem linha no placar: recalcula a partir do placar dos usuários, que já inclui esta variação
+        db.session.flush()
+        _recalcular_placar_departamentos()
+
+def _somar_ao_placar(variacoes):
+    """Versão em lote de _atualizar_placar: variações ({'usuario_id', 'pontos', 'respostas', 'acertos'}, uma por usuário).
+
+    Um UPDATE (executemany) para os usuários e outro para os setores, em vez de dois por usuário.
+    """
+    if not variacoes:
+        return
+    usuario_ids = [v['usuario_id'] for v in variacoes]
+    com_placar = set(db.session.scalars(db.select(PontuacaoUsuario.usuario_id).where(PontuacaoUsuario.usuario_id.in_(usuario_ids))))
+    tabela = PontuacaoUsuario.__table__
+    if com_placar:
+        db.session.execute(tabela.update().where(tabela.c.usuario_id == db.bindparam('b_usuario_id')).values(
+            pontos_totais=tabela.c.pontos_totais + db.bindparam('b_pontos'),
+            total_respostas=tabela.c.total_respostas + db.bindparam('b_respostas'),
+            total_acertos=tabela.c.total_acertos + db.bindparam('b_acertos')
+        ), [{'b_usuario_id': v['usuario_id'], 'b_pontos': v['pontos'], 'b_respostas': v['respostas'], 'b_acertos': v['acertos']}
+            for v in variacoes if v['usuario_id'] in com_placar])
+    sem_placar = [u for u in usuario_ids if u not in com_placar]
+    if sem_placar:
+        # Usuários sem linha no placar (criados antes da migração): recalcula a partir das respostas
+        db.session.flush()
+        _reconstruir_placar_usuarios(sem_placar)
+
+    departamentos = dict(db.session.execute(db.select(Usuario.id, Usuario.departamento_id).where(Usuario.id.in_(usuario_ids))).all())
+    pontos_por_setor = defaultdict(int)
+    for v in variacoes:
+        pontos_por_setor[departamentos.get(v['usuario_id'])] += v['pontos']
+    variacoes_setores = [{'b_departamento_id': d, 'b_pontos': p} for d, p in pontos_por_setor.items() if d is not None and p]
+    if not variacoes_setores:
+        return
+    setores_com_placar = set(db.session.scalars(db.select(PontuacaoDepartamento.departamento_id).where(
+        PontuacaoDepartamento.departamento_id.in_([v['b_departamento_id'] for v in variacoes_setores]))))
+    if len(setores_com_placar) < len(variacoes_setores):
+        # Setor sem linha no placar: recalcula a partir do placar dos usuários, que já inclui estas variações
+        db.session.flush()
+        _recalcular_placar_departamentos()
+    else:
+        tabela = PontuacaoDepartamento.__table__
+        db.session.execute(tabela.update().where(tabela.c.departamento_id == db.bindparam('b_departamento_id')).values(
+            pontos_totais=tabela.c.pontos_totais + db.bindparam('b_pontos')
+        ), variacoes_setores)
+
+def _consulta_placar_usuarios():
+    return db.select(
+        Usuario.id,
+        func.coalesce(func.sum(Resposta.pontos), 0),
+        func.count(Resposta.id),
+        func.coalesce(func.sum(case((Resposta.pontos > 0, 1), else_=0)), 0)
+    ).select_from(Usuario).outerjoin(Resposta).group_by(Usuario.id)
+
+def _reconstruir_placar_usuarios(usuario_ids, conexao=None):
+    """Recalcula do zero o placar dos usuários informados."""
+    executar = (conexao or db.session).execute
+    executar(db.delete(PontuacaoUsuario).where(PontuacaoUsuario.usuario_id.in_(usuario_ids)))
+    executar(db.insert(PontuacaoUsuario).from_select(
+        ['usuario_id', 'pontos_totais', 'total_respostas', 'total_acertos'],
+        _consulta_placar_usuarios().where(Usuario.id.in_(usuario_ids))
+    ))
+
+def _recalcular_placar_departamentos(conexao=None):
+    """Recalcula o placar de todos os setores a partir do placar dos usuários.
+
+    Barato (lê só uma linha por usuário); usado após operações administrativas que mudam
+    setores, usuários ou apagam respostas em massa.
+    """
+    executar = (conexao or db.session).execute
+    executar(db.insert(PontuacaoDepartamento).from_select(
+        ['departamento_id', 'pontos_totais', 'num_usuarios'],
+        db.select(Departamento.id, db.literal(0), db.literal(0)).where(
+            ~db.select(PontuacaoDepartamento.departamento_id).where(PontuacaoDepartamento.departamento_id == Departamento.id).exists()
+        )
+    ))
+    executar(db.update(PontuacaoDepartamento).values(
+        pontos_totais=db.select(func.coalesce(func.sum(PontuacaoUsuario.pontos_totais), 0))
+            .join(Usuario, Usuario.id == PontuacaoUsuario.usuario_id)
+            .where(Usuario.departamento_id == PontuacaoDepartamento.departamento_id).scalar_subquery(),
+        num_usuarios=db.select(func.count(Usuario.id))
+            .where(Usuario.departamento_id == PontuacaoDepartamento.departamento_id).scalar_subquery()
+    ))
+
+def _remover_respostas_do_placar(*filtros):
+    """Desconta do placar as respostas que casam com os filtros (chamar antes de apagá-las)."""
+    variacoes = db.session.query(
+        Resposta.usuario_id,
+        func.coalesce(func.sum(Resposta.pontos), 0),
+        func.count(Resposta.id),
+        func.coalesce(func.sum(case((Resposta.pontos > 0, 1), else_=0)), 0)
+    ).filter(*filtros).group_by(Resposta.usuario_id).all()
+    if variacoes:
+        tabela = PontuacaoUsuario.__table__
+        db.session.execute(tabela.update().where(tabela.c.usuario_id == db.bindparam('b_usuario_id')).values(
+            pontos_totais=tabela.c.pontos_totais - db.bindparam('b_pontos'),
+            total_respostas=tabela.c.total_respostas - db.bindparam('b_respostas'),
+            total_acertos=tabela.c.total_acertos - db.bindparam('b_acertos')
+        ), [{'b_usuario_id': u, 'b_pontos': p, 'b_respostas': r, 'b_acertos': a} for u, p, r, a in variacoes])
+    _recalcular_placar_departamentos()
+
+def reconstruir_placares(conexao=None):
+    """Recalcula do zero o placar de todos os usuários e setores.
+
+    Pela sessão, as tags do cache são invalidadas no commit. Com 'conexao' (migrações), a sessão
+    não vê as escritas: quem faz o commit invalida as tags depois (ver aplicar_migracoes).
+    """
+    executar = (conexao or db.session).execute
+    executar(db.delete(PontuacaoUsuario))
+    executar(db.insert(PontuacaoUsuario).from_select(
+        ['usuario_id', 'pontos_totais', 'total_respostas', 'total_acertos'],
+        _consulta_placar_usuarios()
+    ))
+    _recalcular_placar_departamentos(conexao)
+
+@app.cli.command('reconstruir-ranking')
+def comando_reconstruir_ranking():
+    """Recalcula as tabelas de placar do ranking a partir de todas as respostas."""
+    reconstruir_placares()
+    db.session.commit()
+    print("Placar do ranking reconstruído.")
+
+# --- RESUMO DIÁRIO (relatório de desempenho) ---
+DIA_SEM_DATA = date(1970, 1, 1) # respostas antigas sem data_resposta: contam no total, fora de qualquer período
+
+def _conta_como_correta(pontos, status_correcao):
+    return 1 if (pontos or 0) > 0 or status_correcao in ('correto', 'parcialmente_correto') else 0
+
+def _somar_ao_resumo_diario(variacoes):
+    """Soma as variações ({'usuario_id', 'dia', 'respostas', 'corretas', 'pontos'}) ao resumo diário.
+
+    Um único upsert por linha (ON CONFLICT / ON DUPLICATE KEY ... SET coluna = coluna + nova),
+    na transação corrente, como o placar do ranking.
+    """
+    if not variacoes:
+        return
+    tabela = ResumoDiarioUsuario.__table__
+    colunas = ('respostas', 'corretas', 'pontos')
+    insert = _insert_do_dialeto(tabela)
+    if db.engine.dialect.name == 'mysql':
+        insert = insert.on_duplicate_key_update({c: tabela.c[c] + insert.inserted[c] for c in colunas})
+    else:
+        insert = insert.on_conflict_do_update(index_elements=['usuario_id', 'dia'],
+                                              set_={c: tabela.c[c] + insert.excluded[c] for c in colunas})
+    db.session.execute(insert, variacoes)
+
+def _dia_da_resposta():
+    return func.coalesce(func.date(Resposta.data_resposta), DIA_SEM_DATA)
+
+def _consulta_resumo_diario(*filtros):
+    dia = _dia_da_resposta()
+    return db.select(
+        Resposta.usuario_id, dia,
+        func.count(Resposta.id),
+        func.sum(case((or_(Resposta.pontos > 0, Resposta.status_correcao.in_(['correto', 'parcialmente_correto'])), 1), else_=0)),
+        func.coalesce(func.sum(Resposta.pontos), 0)
+    ).where(*filtros).group_by(Resposta.usuario_id, dia)
+
+def _como_data(valor):
+    # func.date() devolve texto no SQLite
+    return date.fromisoformat(valor) if isinstance(valor, str) else valor
+
+def _remover_respostas_do_resumo(*filtros):
+    """Desconta do resumo diário as respostas que casam com os filtros (chamar antes de apagá-las)."""
+    _somar_ao_resumo_diario([
+        {'usuario_id': u, 'dia': _como_data(d), 'respostas': -r, 'corretas': -c, 'pontos': -p}
+        for u, d, r, c, p in db.session.execute(_consulta_resumo_diario(*filtros))
+    ])
+
+def reconstruir_resumos_diarios(conexao=None):
+    """Recalcula do zero o resumo diário de todos os usuários (tags do cache: ver reconstruir_placares)."""
+    executar = (conexao or db.session).execute
+    executar(db.delete(ResumoDiarioUsuario))
+    executar(db.insert(ResumoDiarioUsuario).from_select(
+        ['usuario_id', 'dia', 'respostas', 'corretas', 'pontos'], _consulta_resumo_diario()
+    ))
+
+@app.cli.command('reconstruir-resumo-diario')
+def comando_reconstruir_resumo_diario():
+    """Recalcula o resumo diário do relatório de desempenho a partir de todas as respostas."""
+    reconstruir_resumos_diarios()
+    db.session.commit()
+    print("Resumo diário reconstruído.")
+
+# --- CORREÇÃO DAS ATIVIDADES DISCURSIVAS ---
+PONTOS_POR_STATUS = {'correto': 100, 'parcialmente_correto': 50, 'incorreto': 0}
+MAXIMO_CORRECOES_POR_LOTE = 500
+
+def corrigir_respostas(correcoes):
+    """Aplica as correções {resposta_id: (status, feedback)} na transação corrente; devolve os ids corrigidos.
+
+    As respostas recebem um UPDATE por combinação de status e feedback (um só quando todas
+    levam a mesma avaliação), e placar e resumo diário recebem as variações já somadas por
+    usuário e por dia. Ids que não são de respostas discursivas são ignorados. Não faz o commit.
+    """
+    # FOR UPDATE: as variações saem dos valores anteriores, então duas correções simultâneas
+    # da mesma resposta não podem ler o mesmo valor antigo (no SQLite, a trava vem do BEGIN IMMEDIATE)
+    _reservar_escrita()
+    anteriores = db.session.execute(
+        db.select(Resposta.id, Resposta.usuario_id, Resposta.pontos, Resposta.status_correcao, Resposta.data_resposta)
+        .join(Pergunta, Pergunta.id == Resposta.pergunta_id)
+        .where(Resposta.id.in_(list(correcoes)), Pergunta.tipo == 'discursiva')
+        .with_for_update()
+    ).all()
+
+    ids_por_avaliacao = defaultdict(list)
+    placar = defaultdict(lambda: {'pontos': 0, 'respostas': 0, 'acertos': 0})
+    resumo = defaultdict(lambda: {'respostas': 0, 'corretas': 0, 'pontos': 0})
+    for r in anteriores:
+        status, feedback = correcoes[r.id]
+        pontos, pontos_anteriores = PONTOS_POR_STATUS[status], r.pontos or 0
+        ids_por_avaliacao[status, feedback].append(r.id)
+        placar[r.usuario_id]['pontos'] += pontos - pontos_anteriores
+        placar[r.usuario_id]['acertos'] += int(pontos > 0) - int(pontos_anteriores > 0)
+        dia = resumo[r.usuario_id, r.data_resposta.date() if r.data_resposta else DIA_SEM_DATA]
+        dia['corretas'] += _conta_como_correta(pontos, status) - _conta_como_correta(r.pontos, r.status_correcao)
+        dia['pontos'] += pontos - pontos_anteriores
+
+    for (status, feedback), ids in ids_por_avaliacao.items():
+        db.session.execute(db.update(Resposta).where(Resposta.id.in_(ids)).values(
+            status_correcao=status, pontos=PONTOS_POR_STATUS[status], feedback_admin=feedback
+        ).execution_options(synchronize_session=False))
+    _somar_ao_placar([{'usuario_id': usuario_id, **variacao} for usuario_id, variacao in placar.items()])
+    _somar_ao_resumo_diario([{'usuario_id': usuario_id, 'dia': dia, **variacao} for (usuario_id, dia), variacao in resumo.items()])
+    return [r.id for r in anteriores]
+
+# --- ANALYTICS ---
+LIMITE_ERROS_ANALYTICS = 500 # Máximo de respostas erradas listadas de uma vez na página de análises
+
+def _estatisticas_erros_por_pergunta(usuario_id=None):
+    """Total de respostas e de erros por pergunta objetiva, agregados no banco (uma consulta)."""
+    query = db.session.query(
+        Pergunta.texto,
+        func.count(Resposta.id).label('total'),
+        func.sum(case((Resposta.pontos == 0, 1), else_=0)).label('erros')
+    ).join(Resposta, Resposta.pergunta_id == Pergunta.id).filter(Pergunta.tipo != 'discursiva')
+    if usuario_id:
+        query = query.filter(Resposta.usuario_id == usuario_id)
+    stats_perguntas = []
+    for texto, total, erros in query.group_by(Pergunta.id, Pergunta.texto).all():
+        stats_perguntas.append({'texto': texto, 'total': total, 'erros': erros, 'percentual': (erros / total) * 100})
+    stats_perguntas.sort(key=lambda x: x['percentual'], reverse=True)
+    return stats_perguntas
+
+def _erros_por_setor(usuario_id=None, limite=LIMITE_ERROS_ANALYTICS):
+    """Respostas objetivas erradas agrupadas por setor e membro.
+
+    Busca só as colunas usadas, já com os joins, em uma consulta limitada a 'limite' linhas.
+    Retorna (erros_por_setor, truncado).
+    """
+    query = db.session.query(
+        Departamento.nome.label('setor_nome'), Usuario.nome.label('usuario_nome'), Resposta.resposta_dada,
+        Pergunta.texto, Pergunta.data_liberacao, Pergunta.resposta_correta,
+        Pergunta.opcao_a, Pergunta.opcao_b, Pergunta.opcao_c, Pergunta.opcao_d
+    ).select_from(Resposta).join(Pergunta, Pergunta.id == Resposta.pergunta_id).join(
+        Usuario, Usuario.id == Resposta.usuario_id
+    ).join(Departamento, Departamento.id == Usuario.departamento_id).filter(
+        Resposta.pontos == 0, Pergunta.tipo != 'discursiva'
+    )
+    if usuario_id:
+        query = query.filter(Resposta.usuario_id == usuario_id)
+    linhas = query.order_by(Departamento.nome, Usuario.nome, Resposta.id).limit(limite + 1).all()
+
+    erros_por_setor = defaultdict(lambda: defaultdict(list))
+    for r in linhas[:limite]:
+        # A linha tem opcao_a..opcao_d, então serve no lugar da pergunta em get_texto_da_opcao
+        erros_por_setor[r.setor_nome][r.usuario_nome].append({
+            'pergunta_texto': r.texto, 'data_liberacao': r.data_liberacao.strftime('%d/%m/%Y'),
+            'resposta_dada': r.resposta_dada, 'texto_resposta_dada': get_texto_da_opcao(r, r.resposta_dada),
+            'resposta_correta': r.resposta_correta, 'texto_resposta_correta': get_texto_da_opcao(r, r.resposta_correta)
+        })
+    return erros_por_setor, len(linhas) > limite
+
+# --- ANÁLISES POR PERÍODO (pandas) ---
+# Dificuldade das perguntas, tendência de acerto por setor e distribuição do tempo de resposta
+# num intervalo de datas. As respostas objetivas do período são lidas em blocos de colunas
+# (pd.read_sql com chunksize) e agregadas com operações vetorizadas, bloco a bloco, então a
+# memória não cresce com o tamanho do período. O resultado fica em cache por janela; respostas
+# novas aparecem quando ele vence (VALIDADE_ANALISES).
+VALIDADE_ANALISES = int(os.environ.get('VALIDADE_ANALISES', 300)) # segundos
+LINHAS_POR_BLOCO_ANALISES = 100000
+MINIMO_RESPOSTAS_DIFICULDADE = 5 # perguntas com menos respostas no período ficam fora do ranking de dificuldade
+LIMITE_PERGUNTAS_DIFICULDADE = 50
+TEMPO_MAXIMO_HISTOGRAMA = 300 # segundos
+FAIXA_HISTOGRAMA = 5 # segundos
+
+def _tempo_gasto(pontos, tempo_limite):
+    """Segundos até a resposta, recuperados dos pontos de um acerto (100 + tempo_restante x BONUS_POR_SEGUNDO)."""
+    tempo_restante = (pontos - 100) / BONUS_POR_SEGUNDO
+    return (tempo_limite - tempo_restante).clip(lower=0)
+
+def _agregar_bloco(bloco, frequencia):
+    acertou = bloco['pontos'] > 0
+    bloco = bloco.assign(
+        acertos=acertou.astype('int64'),
+        periodo=bloco['data_resposta'].dt.to_period(frequencia).dt.start_time,
+        dias_ate_responder=(bloco['data_resposta'].dt.normalize() - bloco['data_liberacao']).dt.days.clip(lower=0),
+    )
+    por_pergunta = bloco.groupby('pergunta_id').agg(
+        total=('acertos', 'size'), acertos=('acertos', 'sum'), soma_dias=('dias_ate_responder', 'sum'))
+    por_setor = bloco.groupby(['departamento_id', 'periodo']).agg(total=('acertos', 'size'), acertos=('acertos', 'sum'))
+
+    # Só os acertos com tempo limite dizem quanto tempo o usuário levou
+    com_tempo = acertou & bloco['tempo_limite'].notna()
+    gasto = _tempo_gasto(bloco.loc[com_tempo, 'pontos'], bloco.loc[com_tempo, 'tempo_limite'])
+    segundos = np.minimum(gasto.to_numpy(dtype='float64'), TEMPO_MAXIMO_HISTOGRAMA).astype('int64')
+    histograma = np.bincount(segundos, minlength=TEMPO_MAXIMO_HISTOGRAMA + 1)
+    soma_tempo = gasto.groupby(bloco.loc[com_tempo, 'pergunta_id']).agg(['sum', 'size'])
+    return por_pergunta, por_setor, histograma, soma_tempo
+
+def _blocos_de_respostas(inicio, fim, departamento_id=None):
+    """Respostas objetivas do período em DataFrames de até LINHAS_POR_BLOCO_ANALISES linhas.
+
+    Do banco vêm só quatro colunas da tabela de respostas, com a data sem conversão linha a
+    linha (type_coerce); setor, tempo limite e data de liberação entram por tabelas pequenas,
+    lidas uma vez e juntadas aos blocos no pandas.
+    """
+    perguntas = pd.read_sql(db.select(Pergunta.id, Pergunta.tempo_limite, Pergunta.data_liberacao)
+                            .where(Pergunta.tipo != 'discursiva'), db.session.connection(), index_col='id')
+    perguntas['data_liberacao'] = pd.to_datetime(perguntas['data_liberacao'])
+    setores = pd.read_sql(db.select(Usuario.id, Usuario.departamento_id), db.session.connection(), index_col='id')['departamento_id']
+
+    query = db.select(
+        Resposta.pergunta_id, Resposta.usuario_id, type_coerce(Resposta.data_resposta, db.String).label('data_resposta'), Resposta.pontos
+    ).where(
+        Resposta.data_resposta >= datetime.combine(inicio, datetime.min.time()),
+        Resposta.data_resposta < datetime.combine(fim + timedelta(days=1), datetime.min.time()),
+    )
+    if departamento_id:
+        query = query.where(Resposta.usuario_id.in_(db.select(Usuario.id).where(Usuario.departamento_id == departamento_id)))
+    for bloco in pd.read_sql(query, db.session.connection(), chunksize=LINHAS_POR_BLOCO_ANALISES):
+        bloco = bloco[bloco['pergunta_id'].isin(perguntas.index)] # descarta as discursivas
+        bloco = bloco.join(perguntas, on='pergunta_id')
+        bloco['departamento_id'] = bloco['usuario_id'].map(setores)
+        bloco['data_resposta'] = pd.to_datetime(bloco['data_resposta'], format='ISO8601')
+        bloco['pontos'] = bloco['pontos'].fillna(0)
+        yield bloco
+
+def _calcular_analises_periodo(inicio, fim, departamento_id=None, granularidade='mes'):
+    frequencia = 'M' if granularidade == 'mes' else 'W'
+    partes_pergunta, partes_setor, partes_tempo = [], [], []
+    histograma = np.zeros(TEMPO_MAXIMO_HISTOGRAMA + 1, dtype='int64')
+    for bloco in _blocos_de_respostas(inicio, fim, departamento_id):
+        por_pergunta, por_setor, histograma_bloco, soma_tempo = _agregar_bloco(bloco, frequencia)
+        partes_pergunta.append(por_pergunta)
+        partes_setor.append(por_setor)
+        partes_tempo.append(soma_tempo)
+        histograma += histograma_bloco
+    if not partes_pergunta:
+        return {'total_respostas': 0, 'periodos': [], 'tendencias': [], 'dificuldade': [], 'tempos': [], 'tempo_p50': None, 'tempo_p90': None}
+
+    # Os blocos se juntam somando as parciais de cada grupo
+    por_pergunta = pd.concat(partes_pergunta).groupby(level=0).sum()
+    por_setor = pd.concat(partes_setor).groupby(level=[0, 1]).sum()
+    tempo_por_pergunta = pd.concat(partes_tempo).groupby(level=0).sum()
+    total_respostas = int(por_pergunta['total'].sum())
+
+    # Dificuldade: percentual de erro no período, entre as perguntas com respostas suficientes
+    por_pergunta['erros'] = por_pergunta['total'] - por_pergunta['acertos']
+    por_pergunta['percentual_erro'] = por_pergunta['erros'] / por_pergunta['total'] * 100
+    por_pergunta['dias_medios'] = por_pergunta['soma_dias'] / por_pergunta['total']
+    por_pergunta['tempo_medio'] = tempo_por_pergunta['sum'] / tempo_por_pergunta['size']
+    mais_dificeis = por_pergunta[por_pergunta['total'] >= MINIMO_RESPOSTAS_DIFICULDADE].sort_values(
+        ['percentual_erro', 'total'], ascending=[False, False]).head(LIMITE_PERGUNTAS_DIFICULDADE)
+    textos = dict(db.session.query(Pergunta.id, Pergunta.texto).filter(Pergunta.id.in_(mais_dificeis.index.tolist()))) \
+        if len(mais_dificeis) else {}
+    dificuldade = [{
+        'texto': textos.get(pergunta_id, ''), 'total': int(linha.total), 'erros': int(linha.erros),
+        'percentual_erro': float(linha.percentual_erro), 'dias_medios': float(linha.dias_medios),
+        'tempo_medio': None if pd.isna(linha.tempo_medio) else float(linha.tempo_medio),
+    } for pergunta_id, linha in mais_dificeis.iterrows()]
+
+    # Tendência: percentual de acerto de cada setor em cada período (None quando o setor não respondeu)
+    acerto = (por_setor['acertos'] / por_setor['total'] * 100).unstack('periodo').sort_index(axis=1)
+    geral = por_setor.groupby(level='periodo').sum()
+    periodos = list(acerto.columns)
+    nomes = {d['id']: d['nome'] for d in _lista_departamentos()}
+    tendencias = [{'setor': 'Todos os setores', 'valores': [float(v) for v in (geral['acertos'] / geral['total'] * 100).reindex(periodos)]}]
+    tendencias += sorted(({
+        'setor': nomes.get(departamento, f'Setor {departamento}'),
+        'valores': [None if pd.isna(v) else float(v) for v in linha],
+    } for departamento, linha in acerto.iterrows()), key=lambda t: t['setor'])
+
+    # Distribuição do tempo de resposta (acertos), em faixas, com percentis pelo histograma de 1 s
+    total_tempos = int(histograma.sum())
+    faixas = histograma[:TEMPO_MAXIMO_HISTOGRAMA].reshape(-1, FAIXA_HISTOGRAMA).sum(axis=1)
+    ultima_faixa = int(np.flatnonzero(faixas).max()) if faixas.any() else -1
+    tempos = [{'faixa': f'{i * FAIXA_HISTOGRAMA}–{(i + 1) * FAIXA_HISTOGRAMA} s', 'quantidade': int(n),
+               'percentual': float(n / total_tempos * 100)} for i, n in enumerate(faixas[:ultima_faixa + 1])]
+    if histograma[TEMPO_MAXIMO_HISTOGRAMA]:
+        tempos.append({'faixa': f'{TEMPO_MAXIMO_HISTOGRAMA} s ou mais', 'quantidade': int(histograma[-1]),
+                       'percentual': float(histograma[-1] / total_tempos * 100)})
+    acumulado = np.cumsum(histograma)
+
+    def percentil(p):
+        return int(np.searchsorted(acumulado, p * total_tempos)) if total_tempos else None
+
+    return {
+        'total_respostas': total_respostas,
+        'periodos': [p.strftime('%m/%Y' if granularidade == 'mes' else '%d/%m/%Y') for p in periodos],
+        'tendencias': tendencias,
+        'dificuldade': dificuldade,
+        'tempos': tempos,
+        'tempo_p50': percentil(0.5),
+        'tempo_p90': percentil(0.9),
+    }
+
+def analises_periodo(inicio, fim, departamento_id=None, granularidade='mes'):
+    """Análises do período [inicio, fim], em cache por janela (setor e granularidade incluídos)."""
+    return cache.obter_ou_calcular(
+        f'analises:{inicio}:{fim}:{departamento_id or "todos"}:{granularidade}',
+        lambda: _calcular_analises_periodo(inicio, fim, departamento_id, granularidade),
+        tags=('pergunta', 'usuario', 'departamento'), validade=VALIDADE_ANALISES)
+
+# --- EXPORTAÇÃO EM FLUXO ---
+COLUNAS_EXPORTACAO_QUIZ = ['Colaborador', 'Setor', 'Data da Resposta', 'Pergunta', 'Tipo', 'Resposta Dada', 'Resposta Correta', 'Pontos']
+COLUNAS_EXPORTACAO_DISCURSIVAS = ['Colaborador', 'Setor', 'Data da Resposta', 'Pergunta', 'Resposta Discursiva', 'Status', 'Feedback', 'Pontos']
+LINHAS_POR_LOTE_EXPORTACAO = 1000
+
+def _consulta_exportacao_detalhada(tipo_relatorio, departamento_id=None):
+    """Consulta (só colunas, sem objetos ORM) das respostas para a exportação detalhada."""
+    query = db.session.query(
+        Usuario.nome.label('usuario_nome'), Departamento.nome.label('setor_nome'), Resposta.data_resposta,
+        Resposta.resposta_dada, Resposta.texto_discursivo, Resposta.status_correcao, Resposta.feedback_admin, Resposta.pontos,
+        Pergunta.texto, Pergunta.tipo, Pergunta.resposta_correta,
+        Pergunta.opcao_a, Pergunta.opcao_b, Pergunta.opcao_c, Pergunta.opcao_d
+    ).select_from(Resposta).join(Usuario, Usuario.id == Resposta.usuario_id).join(
+        Departamento, Departamento.id == Usuario.departamento_id
+    ).join(Pergunta, Pergunta.id == Resposta.pergunta_id)
+
+    # Aplica o filtro de setor, se houver
+    if departamento_id:
+        query = query.filter(Usuario.departamento_id == departamento_id)
+
+    # Aplica o filtro de TIPO de pergunta
+    if tipo_relatorio == 'quiz':
+        query = query.filter(Pergunta.tipo != 'discursiva')
+    elif tipo_relatorio == 'discursivas':
+        query = query.filter(Pergunta.tipo == 'discursiva')
+
+    return query.order_by(Departamento.nome, Usuario.nome, Resposta.data_resposta)
+
+def _linhas_exportacao_detalhada(query, tipo_relatorio):
+    """Gera as linhas da planilha lendo o banco em lotes (yield_per), sem montar a lista inteira."""
+    for r in query.execution_options(yield_per=LINHAS_POR_LOTE_EXPORTACAO):
+        data_resposta = (r.data_resposta - timedelta(hours=3)).strftime('%d/%m/%Y %H:%M')
+        if tipo_relatorio == 'quiz':
+            yield [r.usuario_nome, r.setor_nome, data_resposta, r.texto, r.tipo,
+                   get_texto_da_opcao(r, r.resposta_dada), get_texto_da_opcao(r, r.resposta_correta), r.pontos or 0]
+        else: # Discursivas
+            yield [r.usuario_nome, r.setor_nome, data_resposta, r.texto, r.texto_discursivo,
+                   r.status_correcao, r.feedback_admin or '', r.pontos or 0]
+
+def _gerar_csv(colunas, linhas):
+    """Gera o CSV em blocos de texto. Usa ';' e BOM para o Excel em português abrir direto."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    escritor.writerow(colunas)
+    for numero, linha in enumerate(linhas, start=1):
+        escritor.writerow(linha)
+        if numero % LINHAS_POR_LOTE_EXPORTACAO == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _gerar_xlsx(colunas, linhas, nome_planilha, destino):
+    """Escreve a planilha em 'destino' no modo write-only do openpyxl (memória constante)."""
+    workbook = openpyxl.Workbook(write_only=True)
+    planilha = workbook.create_sheet(nome_planilha)
+    planilha.append(colunas)
+    for linha in linhas:
+        planilha.append(linha)
+    workbook.save(destino)
+    return destino
+
+def _escrever_planilha_relatorio(dados_relatorio, destino):
+    """Grava o relatório de desempenho (saída de _gerar_dados_relatorio) como planilha Excel."""
+    # Converte os dados para um formato que o pandas entende
+    df = pd.DataFrame(dados_relatorio, columns=['nome', 'setor', 'total_respostas', 'respostas_corretas', 'aproveitamento', 'pontuacao_total'])
+
+    # Renomeia e reordena as colunas para a planilha
+    df = df.rename(columns={
+        'nome': 'Colaborador',
+        'setor': 'Setor',
+        'total_respostas': 'Respostas Totais',
+        'respostas_corretas': 'Respostas Corretas',
+        'aproveitamento': 'Aproveitamento (%)',
+        'pontuacao_total': 'Pontuação Total'
+    })
+    df['Aproveitamento (%)'] = df['Aproveitamento (%)'].map('{:.1f}%'.format)
+
+    with pd.ExcelWriter(destino, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Relatorio de Desempenho')
+    return destino
+
+# --- IMPORTAÇÃO DE PERGUNTAS ---
+COLUNAS_IMPORTACAO = ['tipo', 'texto', 'opcao_a', 'opcao_b', 'opcao_c', 'opcao_d',
+                      'resposta_correta', 'data_liberacao', 'tempo_limite', 'setores']
+TIPOS_PERGUNTA = ['multipla_escolha', 'verdadeiro_falso', 'discursiva']
+LINHAS_POR_LOTE_IMPORTACAO = 1000
+
+def _normalizar_planilha(df):
+    """Converte a planilha lida pelo pandas em texto, como no formulário de pré-visualização."""
+    df = df.fillna('')
+    if 'data_liberacao' in df.columns:
+        df['data_liberacao'] = pd.to_datetime(df['data_liberacao'], errors='coerce', dayfirst=True).dt.strftime('%d/%m/%Y').fillna('')
+    for col in df.columns:
+        if col != 'data_liberacao':
+            df[col] = df[col].astype(str).str.replace(r'\.0$', '', regex=True)
+    return df
+
+def _setores_da_planilha(coluna):
+    """Traduz a coluna 'setores' ("Vendas; RH", "todos" ou vazio) para ids de setor.
+
+    Retorna, por linha, (ids ou None para todos os setores, nomes não encontrados).
+    A tradução é feita uma vez por valor distinto, não por linha.
+    """
+    setores_por_nome = {nome.strip().lower(): id_ for id_, nome in db.session.query(Departamento.id, Departamento.nome)}
+    traducoes = {}
+    for valor in coluna.unique():
+        nomes = [n.strip().lower() for n in valor.replace(',', ';').split(';') if n.strip()]
+        if not nomes or nomes == ['todos']:
+            traducoes[valor] = (None, [])
+        else:
+            traducoes[valor] = ([setores_por_nome[n] for n in nomes if n in setores_por_nome],
+                                [n for n in nomes if n not in setores_por_nome])
+    return coluna.map(traducoes)
+
+def _validar_planilha(df):
+    """Valida todas as linhas de uma vez, coluna a coluna, em vez de linha a linha.
+
+    Retorna (df normalizado, lista com o dicionário de erros de cada linha, na ordem do df).
+    """
+    colunas = list(dict.fromkeys(list(df.columns) + COLUNAS_IMPORTACAO))
+    df = df.reindex(columns=colunas, fill_value='').fillna('').astype(str)
+    tipo = df['tipo'].str.lower()
+    resposta = df['resposta_correta'].str.lower()
+    datas = pd.to_datetime(df['data_liberacao'], format='%d/%m/%Y', errors='coerce')
+    tempo = pd.to_numeric(df['tempo_limite'], errors='coerce')
+    tempo = tempo.where(tempo.abs() != float('inf'))
+    setores = _setores_da_planilha(df['setores'])
+    setores_invalidos = setores.map(lambda s: ', '.join(s[1]))
+
+    verificacoes = [
+        ('texto', df['texto'] == '', "O texto não pode ser vazio."),
+        ('tipo', ~tipo.isin(TIPOS_PERGUNTA), "Tipo inválido."),
+        ('resposta_correta', (tipo == 'multipla_escolha') & ~resposta.isin(['a', 'b', 'c', 'd']), "Deve ser a, b, c ou d."),
+        ('resposta_correta', (tipo == 'verdadeiro_falso') & ~resposta.isin(['v', 'f']), "Deve ser v ou f."),
+        ('data_liberacao', datas.isna(), "Formato inválido. Use DD/MM/AAAA."),
+        ('tempo_limite', (tipo != 'discursiva') & tempo.isna(), "Deve ser um número."),
+    ]
+    erros = [{} for _ in range(len(df))]
+    for coluna, mascara, mensagem in verificacoes:
+        for posicao in mascara.to_numpy().nonzero()[0]:
+            erros[posicao][coluna] = mensagem
+    for posicao in (setores_invalidos != '').to_numpy().nonzero()[0]:
+        erros[posicao]['setores'] = f"Setor não encontrado: {setores_invalidos.iloc[posicao]}"
+
+    df['tipo'], df['resposta_correta'] = tipo, resposta
+    df['data_convertida'], df['tempo_convertido'], df['ids_setores'] = datas.dt.date, tempo, setores.map(lambda s: s[0])
+    return df, erros
+
+def _inserir_lote_perguntas(registros, setores):
+    """Insere um lote com uma única instrução (executemany) e liga as perguntas aos seus setores."""
+    com_setores = [i for i, ids in enumerate(setores) if ids]
+    if not com_setores:
+        db.session.execute(Pergunta.__table__.insert(), registros)
+        return
+    if db.engine.dialect.insert_executemany_returning_sort_by_parameter_order:
+        ids = db.session.scalars(Pergunta.__table__.insert().returning(Pergunta.__table__.c.id, sort_by_parameter_order=True), registros).all()
+    else:
+        # Sem RETURNING em lote (MySQL): só as linhas com setores específicos precisam do id
+        sem_setores = [registros[i] for i, ids in enumerate(setores) if not ids]
+        if sem_setores:
+            db.session.execute(Pergunta.__table__.insert(), sem_setores)
+        ids = {i: db.session.execute(Pergunta.__table__.insert().values(**registros[i])).inserted_primary_key[0] for i in com_setores}
+    db.session.execute(pergunta_departamento_association.insert(), [
+        {'pergunta_id': ids[i], 'departamento_id': departamento_id}
+        for i in com_setores for departamento_id in setores[i]
+    ])
+
+def importar_perguntas_em_massa(df, tarefa_atual=None, tamanho_lote=LINHAS_POR_LOTE_IMPORTACAO):
+    """Valida e grava uma planilha de perguntas em lotes.
+
+    Cada lote roda em um savepoint: se o banco recusar o lote, ele é refeito linha a linha
+    e só as linhas problemáticas são descartadas.
+    Retorna (success_count, error_count, linhas por segundo).
+    """
+    inicio = time.perf_counter()
+    df, erros = _validar_planilha(df)
+    for row_index, erros_linha in zip(df.index, erros):
+        if erros_linha:
+            app.logger.error(f"Linha {row_index} inválida na importação: {erros_linha}")
+    validas = df[[not e for e in erros]]
+    error_count = len(df) - len(validas)
+
+    registros = [{
+        'tipo': linha.tipo, 'texto': linha.texto,
+        'opcao_a': linha.opcao_a or None, 'opcao_b': linha.opcao_b or None,
+        'opcao_c': linha.opcao_c or None, 'opcao_d': linha.opcao_d or None,
+        'resposta_correta': linha.resposta_correta or None,
+        'data_liberacao': linha.data_convertida,
+        'tempo_limite': None if pd.isna(linha.tempo_convertido) else int(linha.tempo_convertido),
+        'para_todos_setores': linha.ids_setores is None,
+    } for linha in validas.itertuples()]
+    setores = validas['ids_setores'].tolist()
+
+    success_count = 0
+    for ini in range(0, len(registros), tamanho_lote):
+        lote, setores_lote = registros[ini:ini + tamanho_lote], setores[ini:ini + tamanho_lote]
+        try:
+            with db.session.begin_nested():
+                _inserir_lote_perguntas(lote, setores_lote)
+            success_count += len(lote)
+        except SQLAlchemyError:
+            # Refaz o lote linha a linha para isolar as que o banco recusou
+            for posicao, (registro, ids) in enumerate(zip(lote, setores_lote)):
+                try:
+                    with db.session.begin_nested():
+                        _inserir_lote_perguntas([registro], [ids])
+                    success_count += 1
+                except SQLAlchemyError as e:
+                    error_count += 1
+                    app.logger.error(f"Erro ao salvar linha {validas.index[ini + posicao]}: {e} | Dados: {registro}")
+
+        processadas = min(ini + tamanho_lote, len(registros))
+        if tarefa_atual:
+            registrar_progresso(tarefa_atual, processadas * 100 // len(registros), f'{processadas} de {len(registros)} linhas válidas gravadas.')
+    db.session.commit()
+
+    linhas_por_segundo = len(df) / max(time.perf_counter() - inicio, 1e-6)
+    app.logger.info(f"Importação: {success_count} perguntas gravadas, {error_count} linhas com erro ({linhas_por_segundo:.0f} linhas/s).")
+    return success_count, error_count, linhas_por_segundo
+
+# Pré-visualização: as linhas ficam numa área temporária no banco até a importação
+VALIDADE_PREVIA_IMPORTACAO = timedelta(hours=24)
+LINHAS_POR_PAGINA_PREVIA = 100
+
+def criar_previa_importacao(df):
+    """Valida a planilha e guarda suas linhas para a pré-visualização. Retorna a ImportacaoPlanilha."""
+    _, erros = _validar_planilha(df)
+    importacao = ImportacaoPlanilha(token=secrets.token_urlsafe(32), cabecalhos=json.dumps(df.columns.tolist()),
+                                    expira_em=datetime.utcnow() + VALIDADE_PREVIA_IMPORTACAO)
+    db.session.add(importacao)
+    db.session.flush()
+    db.session.execute(LinhaImportacaoPlanilha.__table__.insert(), [
+        {'importacao_id': importacao.id, 'posicao': posicao, 'dados': json.dumps(row),
+         'erros': json.dumps(erros_linha), 'valida': not erros_linha}
+        for posicao, (row, erros_linha) in enumerate(zip(df.to_dict(orient='records'), erros))
+    ])
+    db.session.commit()
+    return importacao
+
+def importacao_da_sessao():
+    """Pré-visualização em andamento do admin logado, se ainda não expirou."""
+    token = session.get('importacao_token')
+    if not token:
+        return None
+    return ImportacaoPlanilha.query.filter(
+        ImportacaoPlanilha.token == token, ImportacaoPlanilha.expira_em > datetime.utcnow()
+    ).first()
+
+def atualizar_linhas_previa(importacao, linhas_editadas):
+    """Grava as correções feitas na tela ({posicao: dados}) e revalida apenas essas linhas."""
+    if not linhas_editadas:
+        return
+    posicoes = sorted(linhas_editadas)
+    _, erros = _validar_planilha(pd.DataFrame([linhas_editadas[p] for p in posicoes], index=posicoes))
+    existentes = {linha.posicao: linha for linha in importacao.linhas.filter(LinhaImportacaoPlanilha.posicao.in_(posicoes))}
+    for posicao, erros_linha in zip(posicoes, erros):
+        linha = existentes.get(posicao)
+        if linha:
+            linha.dados = json.dumps(linhas_editadas[posicao])
+            linha.erros = json.dumps(erros_linha)
+            linha.valida = not erros_linha
+    db.session.commit()
+
+def limpar_importacoes_expiradas():
+    """Apaga as pré-visualizações abandonadas. Roda na manutenção do worker e a cada novo envio de planilha."""
+    agora = datetime.utcnow()
+    expiradas = db.select(ImportacaoPlanilha.id).where(ImportacaoPlanilha.expira_em <= agora)
+    LinhaImportacaoPlanilha.query.filter(LinhaImportacaoPlanilha.importacao_id.in_(expiradas)).delete(synchronize_session=False)
+    apagadas = ImportacaoPlanilha.query.filter(ImportacaoPlanilha.expira_em <= agora).delete(synchronize_session=False)
+    db.session.commit()
+    return apagadas
+
+# --- FILA DE TAREFAS ---
+TAREFAS = {} # tipo -> função que executa a tarefa
+ESPERA_BASE_TAREFA = 30 # segundos; dobra a cada nova tentativa
+
+def tarefa(tipo):
+    """Registra a função que executa as tarefas de um tipo. Ela recebe a Tarefa e os parâmetros."""
+    def decorator(funcao):
+        TAREFAS[tipo] = funcao
+        return funcao
+    return decorator
+
+def enfileirar_tarefa(tipo_tarefa, max_tentativas=3, **parametros):
+    """Cria uma tarefa na fila. Sem worker configurado, executa-a imediatamente."""
+    nova_tarefa = Tarefa(tipo=tipo_tarefa, parametros=json.dumps(parametros), max_tentativas=max_tentativas)
+    db.session.add(nova_tarefa)
+    db.session.commit()
+    if not app.config['TAREFAS_EM_SEGUNDO_PLANO']:
+        # Sem worker não há quem tente de novo: uma falha já encerra a tarefa
+        nova_tarefa.status, nova_tarefa.max_tentativas = 'executando', 1
+        executar_tarefa(nova_tarefa)
+    return nova_tarefa
+
+def executar_em_segundo_plano(tipo_tarefa, **parametros):
+    """Como enfileirar_tarefa, mas sem worker.py a tarefa roda numa thread deste processo, e não na requisição.
+
+    Serve para o que não deve segurar a resposta (envio de arquivos, planilhas grandes):
+    a requisição só registra a tarefa, e a página da tarefa mostra o andamento.
+    """
+    if app.config['TAREFAS_EM_SEGUNDO_PLANO']:
+        return enfileirar_tarefa(tipo_tarefa, **parametros)
+    nova_tarefa = Tarefa(tipo=tipo_tarefa, parametros=json.dumps(parametros), status='executando')
+    db.session.add(nova_tarefa)
+    db.session.commit()
+    _executor().submit(_executar_na_thread, nova_tarefa.id)
+    return nova_tarefa
+
+def _executar_na_thread(tarefa_id):
+    """Executa uma tarefa já reservada numa thread do executor, com as novas tentativas da fila (sem worker.py)."""
+    with app.app_context():
+        tarefa_atual = db.session.get(Tarefa, tarefa_id)
+        executar_tarefa(tarefa_atual)
+        while tarefa_atual.status == 'pendente':
+            time.sleep(max(0, (tarefa_atual.executar_apos - datetime.utcnow()).total_seconds()))
+            tarefa_atual.status = 'executando'
+            db.session.commit()
+            executar_tarefa(tarefa_atual)
+
+def registrar_progresso(tarefa_atual, progresso, mensagem=None):
+    """Atualiza o progresso exibido ao admin. Faz commit: chame só em pontos seguros da tarefa."""
+    tarefa_atual.progresso = int(progresso)
+    if mensagem:
+        tarefa_atual.mensagem = mensagem
+    db.session.commit()
+
+def caminho_resultado_tarefa(tarefa_atual, extensao):
+    os.makedirs(app.config['PASTA_RESULTADOS_TAREFAS'], exist_ok=True)
+    return os.path.join(app.config['PASTA_RESULTADOS_TAREFAS'], f'tarefa_{tarefa_atual.id}.{extensao}')
+
+def reservar_proxima_tarefa():
+    """Marca como 'executando' a próxima tarefa pronta e a devolve (ou None).
+
+    A troca de status é um UPDATE condicional, então dois workers nunca pegam a mesma tarefa.
+    """
+    while True:
+        candidata_id = db.session.query(Tarefa.id).filter(
+            Tarefa.status == 'pendente', Tarefa.executar_apos <= datetime.utcnow()
+        ).order_by(Tarefa.executar_apos, Tarefa.id).limit(1).scalar()
+        if candidata_id is None:
+            return None
+        reservada = db.session.execute(db.update(Tarefa).where(
+            Tarefa.id == candidata_id, Tarefa.status == 'pendente'
+        ).values(status='executando', atualizada_em=datetime.utcnow())).rowcount
+        db.session.commit()
+        if reservada:
+            return db.session.get(Tarefa, candidata_id)
+
+def executar_tarefa(tarefa_atual):
+    """Executa uma tarefa já reservada; em caso de erro, reagenda com espera exponencial."""
+    try:
+        TAREFAS[tarefa_atual.tipo](tarefa_atual, **json.loads(tarefa_atual.parametros))
+        tarefa_atual.status, tarefa_atual.progresso, tarefa_atual.erro = 'concluida', 100, None
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        tarefa_atual.tentativas += 1
+        tarefa_atual.erro = traceback.format_exc()
+        if tarefa_atual.tentativas < tarefa_atual.max_tentativas:
+            espera = ESPERA_BASE_TAREFA * 2 ** (tarefa_atual.tentativas - 1)
+            tarefa_atual.status = 'pendente'
+            tarefa_atual.executar_apos = datetime.utcnow() + timedelta(seconds=espera)
+            tarefa_atual.mensagem = f'Falhou ({e}). Nova tentativa em {espera} segundos.'
+        else:
+            tarefa_atual.status = 'falhou'
+            tarefa_atual.mensagem = f'Falhou após {tarefa_atual.tentativas} tentativa(s): {e}'
+        db.session.commit()
+        app.logger.error(f"Erro na tarefa {tarefa_atual.id} ({tarefa_atual.tipo}): {e}")
+
+def recuperar_tarefas_interrompidas(limite=timedelta(hours=1)):
+    """Devolve à fila tarefas presas em 'executando' (worker encerrado no meio).
+
+    A interrupção conta como uma tentativa: uma tarefa que derruba o worker (falta de memória,
+    processo morto) não volta à fila para sempre, e ao chegar a max_tentativas é marcada como falha.
+    """
+    agora = datetime.utcnow()
+    presas = (Tarefa.status == 'executando', Tarefa.atualizada_em < agora - limite)
+    esgotadas = db.session.execute(db.update(Tarefa).where(*presas, Tarefa.tentativas + 1 >= Tarefa.max_tentativas).values(
+        status='falhou', tentativas=Tarefa.tentativas + 1, atualizada_em=agora,
+        erro='Execução interrompida (worker encerrado no meio da tarefa).',
+        mensagem='Falhou: interrompida na última tentativa.'
+    )).rowcount
+    recuperadas = db.session.execute(db.update(Tarefa).where(*presas).values(
+        status='pendente', tentativas=Tarefa.tentativas + 1, atualizada_em=agora,
+        mensagem='Interrompida (worker encerrado). Nova tentativa em seguida.'
+    )).rowcount
+    db.session.commit()
+    if esgotadas:
+        app.logger.warning(f"{esgotadas} tarefa(s) interrompida(s) sem tentativas restantes marcada(s) como falha.")
+    return recuperadas
+
+def limpar_tarefas_antigas(idade=timedelta(days=7)):
+    """Apaga tarefas encerradas há mais de 'idade' e os arquivos que elas geraram."""
+    antigas = Tarefa.query.filter(
+        Tarefa.status.in_(['concluida', 'falhou']), Tarefa.atualizada_em < datetime.utcnow() - idade
+    ).all()
+    for tarefa_antiga in antigas:
+        if tarefa_antiga.arquivo_resultado and os.path.exists(tarefa_antiga.arquivo_resultado):
+            os.remove(tarefa_antiga.arquivo_resultado)
+        db.session.delete(tarefa_antiga)
+    db.session.commit()
+    return len(antigas)
+
+def _contar_progresso(tarefa_atual, linhas, total, passo=5000):
+    """Repassa as linhas de um gerador, registrando o progresso a cada 'passo' linhas."""
+    for numero, linha in enumerate(linhas, start=1):
+        if numero % passo == 0 and total:
+            registrar_progresso(tarefa_atual, min(99, numero * 100 // total), f'{numero} de {total} linhas exportadas.')
+        yield linha
+
+@tarefa('exportar_respostas_detalhado')
+def _tarefa_exportar_respostas_detalhado(tarefa_atual, tipo, departamento_id=None, formato='xlsx'):
+    query = _consulta_exportacao_detalhada(tipo, departamento_id)
+    total = query.order_by(None).count()
+    colunas = COLUNAS_EXPORTACAO_QUIZ if tipo == 'quiz' else COLUNAS_EXPORTACAO_DISCURSIVAS
+    linhas = _contar_progresso(tarefa_atual, _linhas_exportacao_detalhada(query, tipo), total)
+    caminho = caminho_resultado_tarefa(tarefa_atual, formato)
+    if formato == 'csv':
+        with open(caminho, 'w', encoding='utf-8', newline='') as arquivo:
+            for bloco in _gerar_csv(colunas, linhas):
+                arquivo.write(bloco)
+    else:
+        _gerar_xlsx(colunas, linhas, 'Relatorio Detalhado', destino=caminho)
+    tarefa_atual.arquivo_resultado = caminho
+    tarefa_atual.nome_arquivo = f'relatorio_detalhado_{tipo}.{formato}'
+    tarefa_atual.mensagem = f'{total} respostas exportadas.'
+
+@tarefa('exportar_relatorios')
+def _tarefa_exportar_relatorios(tarefa_atual, departamento_id=None, inicio=None, fim=None):
+    caminho = caminho_resultado_tarefa(tarefa_atual, 'xlsx')
+    _escrever_planilha_relatorio(_gerar_dados_relatorio(departamento_id, _como_data(inicio), _como_data(fim)), caminho)
+    tarefa_atual.arquivo_resultado = caminho
+    tarefa_atual.nome_arquivo = 'relatorio_desempenho_quiz.xlsx'
+    tarefa_atual.mensagem = 'Relatório de desempenho gerado.'
+
+@tarefa('importar_perguntas')
+def _tarefa_importar_perguntas(tarefa_atual, importacao_id):
+    importacao = ImportacaoPlanilha.query.get(importacao_id)
+    if not importacao:
+        raise ValueError('A pré-visualização desta planilha expirou. Envie a planilha novamente.')
+    linhas = importacao.linhas.order_by(LinhaImportacaoPlanilha.posicao).with_entities(LinhaImportacaoPlanilha.posicao, LinhaImportacaoPlanilha.dados).all()
+    df = pd.DataFrame([json.loads(dados) for _, dados in linhas], index=[posicao for posicao, _ in linhas])
+    success_count, error_count, linhas_por_segundo = importar_perguntas_em_massa(df, tarefa_atual)
+    # A área temporária não é mais necessária
+    importacao.linhas.delete(synchronize_session=False)
+    db.session.delete(importacao)
+    if error_count > 0:
+        tarefa_atual.mensagem = f'Importação parcial: {success_count} perguntas salvas. {error_count} linhas continham erros e foram ignoradas.'
+    else:
+        tarefa_atual.mensagem = f'Importação concluída! {success_count} perguntas foram importadas com sucesso!'
+    tarefa_atual.mensagem += f' ({linhas_por_segundo:.0f} linhas/s)'
+
+# --- ARQUIVOS ENVIADOS (upload e exclusão fora da requisição) ---
+_executor_arquivos = None
+
+def _executor():
+    # Criado no primeiro uso, já dentro do processo do gunicorn (depois do fork)
+    global _executor_arquivos
+    if _executor_arquivos is None:
+        _executor_arquivos = ThreadPoolExecutor(max_workers=app.config['THREADS_DE_ARQUIVOS'], thread_name_prefix='arquivos')
+    return _executor_arquivos
+
+def guardar_upload(file):
+    """Grava o arquivo recebido no disco local, o que é rápido, para enviá-lo depois em segundo plano."""
+    os.makedirs(app.config['PASTA_UPLOADS_PENDENTES'], exist_ok=True)
+    caminho = os.path.join(app.config['PASTA_UPLOADS_PENDENTES'], f"{uuid.uuid4().hex}_{secure_filename(file.filename)}")
+    file.save(caminho)
+    return caminho
+
+# Modelos com colunas de arquivo, pelo nome guardado nos parâmetros da tarefa 'enviar_upload'
+MODELOS_COM_ARQUIVO = {'Pergunta': Pergunta, 'Resposta': Resposta}
+
+def agendar_upload(caminho, nome_original, pasta, modelo, registro_id, coluna):
+    """Envia o arquivo ao armazenamento em segundo plano e, ao terminar, grava a URL em modelo.coluna.
+
+    Chame depois do commit do registro. Se a coluna já tinha um arquivo, ele é apagado após a troca.
+    O envio fica registrado como tarefa 'enviar_upload', então não se perde se o processo cair:
+    com o worker.py ele vai pela fila; sem ele, por uma thread deste processo, e o que ficar
+    pela metade é retomado com 'flask retomar-uploads'.
+    """
+    executar_em_segundo_plano('enviar_upload', caminho=caminho, nome_original=nome_original, pasta=pasta,
+                              modelo=modelo.__name__, registro_id=registro_id, coluna=coluna)
+
+@tarefa('enviar_upload')
+def _tarefa_enviar_upload(tarefa_atual, caminho, nome_original, pasta, modelo, registro_id, coluna):
+    # Em caso de erro a fila tenta de novo; o arquivo local só é apagado depois que a URL foi gravada
+    url = armazenamento.enviar(caminho, pasta, nome_original)
+    modelo = MODELOS_COM_ARQUIVO[modelo]
+    anterior = db.session.query(getattr(modelo, coluna)).filter(modelo.id == registro_id).scalar()
+    atualizados = modelo.query.filter_by(id=registro_id).update({coluna: url}, synchronize_session=False)
+    db.session.commit()
+    os.remove(caminho)
+    if not atualizados:
+        _excluir_arquivos([url]) # O registro foi apagado enquanto o arquivo subia
+    elif anterior:
+        _excluir_arquivos([anterior])
+    tarefa_atual.mensagem = f'{nome_original} enviado.'
+
+def retomar_uploads_interrompidos(limite=timedelta(minutes=10)):
+    """Executa de novo os envios que ficaram pela metade (processo encerrado) ou que falharam, se o arquivo ainda existe."""
+    pendentes = Tarefa.query.filter(
+        Tarefa.tipo == 'enviar_upload',
+        or_(Tarefa.status == 'falhou', and_(Tarefa.status == 'executando', Tarefa.atualizada_em < datetime.utcnow() - limite))
+    ).all()
+    retomadas = 0
+    for tarefa_atual in pendentes:
+        if not os.path.exists(json.loads(tarefa_atual.parametros)['caminho']):
+            continue
+        tarefa_atual.status, tarefa_atual.tentativas = 'executando', 0
+        db.session.commit()
+        executar_tarefa(tarefa_atual)
+        retomadas += 1
+    return retomadas
+
+@app.cli.command('retomar-uploads')
+def comando_retomar_uploads():
+    """Envia ao armazenamento os uploads interrompidos ou que falharam (usado quando não há worker.py)."""
+    print(f"{retomar_uploads_interrompidos()} envio(s) retomado(s).")
+
+def agendar_exclusao(urls):
+    """Apaga arquivos do armazenamento fora da requisição, em lote (uma tarefa para todos)."""
+    urls = [url for url in urls if url]
+    if not urls:
+        return
+    if app.config['TAREFAS_EM_SEGUNDO_PLANO']:
+        enfileirar_tarefa('excluir_arquivos', urls=urls)
+    else:
+        _executor().submit(_excluir_arquivos, urls)
+
+def _excluir_arquivos(urls):
+    try:
+        armazenamento.excluir(urls)
+        app.logger.info(f"{len(urls)} arquivo(s) excluído(s) do armazenamento.")
+    except Exception as e:
+        app.logger.error(f"Erro ao tentar excluir arquivos do armazenamento: {e}")
+
+@tarefa('excluir_arquivos')
+def _tarefa_excluir_arquivos(tarefa_atual, urls):
+    armazenamento.excluir(urls) # Em caso de erro, a fila tenta de novo
+    tarefa_atual.mensagem = f'{len(urls)} arquivo(s) excluído(s).'
+
 # --- ROTAS PRINCIPAIS DO USUÁRIO ---
 @app.route('/')
 def pagina_login():
@@ -192,32 +1698,10 @@ def dashboard():
         return redirect(url_for('pagina_login'))
 
     usuario_id = session['usuario_id']
-    usuario = Usuario.query.get(usuario_id)
     hoje = date.today()
     
-    perguntas_respondidas_ids = [r.pergunta_id for r in Resposta.query.filter_by(usuario_id=usuario_id).all()]
-    
-    # Contagem de Quiz Rápido Pendente (sem mudanças)
-    contagem_quiz_pendente = Pergunta.query.filter(
-        Pergunta.tipo != 'discursiva',
-        Pergunta.data_liberacao <= hoje,
-        Pergunta.id.notin_(perguntas_respondidas_ids),
-        or_(
-            Pergunta.para_todos_setores == True,
-            Pergunta.departamentos.any(Departamento.id == usuario.departamento_id)
-        )
-    ).count()
-
-    # Contagem de Atividades Discursivas Pendentes (sem mudanças)
-    contagem_atividades_pendentes = Pergunta.query.filter(
-        Pergunta.tipo == 'discursiva',
-        Pergunta.data_liberacao <= hoje,
-        Pergunta.id.notin_(perguntas_respondidas_ids),
-        or_(
-            Pergunta.para_todos_setores == True,
-            Pergunta.departamentos.any(Departamento.id == usuario.departamento_id)
-        )
-    ).count()
+    # Contagem de Quiz Rápido e de Atividades Discursivas pendentes em uma só consulta
+    contagem_quiz_pendente, contagem_atividades_pendentes = _contagem_pendentes(usuario_id, hoje)
 
     # MUDANÇA: Contagem de feedbacks agora verifica a nova coluna 'feedback_visto'
     contagem_novos_feedbacks = Resposta.query.join(Pergunta).filter(
@@ -242,20 +1726,11 @@ def logout():
 def pagina_quiz():
     if 'usuario_id' not in session: return redirect(url_for('pagina_login'))
     usuario_id = session['usuario_id']
-    usuario = Usuario.query.get(usuario_id)
     hoje = date.today()
-    perguntas_respondidas_ids = [r.pergunta_id for r in Resposta.query.filter_by(usuario_id=usuario_id).all()]
-    proxima_pergunta = Pergunta.query.filter(
-        Pergunta.tipo != 'discursiva',
-        Pergunta.data_liberacao <= hoje,
-        Pergunta.id.notin_(perguntas_respondidas_ids),
-        or_(
-            Pergunta.para_todos_setores == True,
-            Pergunta.departamentos.any(Departamento.id == usuario.departamento_id)
-        )
-    ).order_by(Pergunta.data_liberacao).first()
+    proxima_pergunta = _proxima_pergunta_pendente(usuario_id, hoje)
     if proxima_pergunta:
-        return render_template('quiz.html', pergunta=proxima_pergunta)
+        token, tempo_restante = entregar_perguntas(usuario_id, [proxima_pergunta])[proxima_pergunta.id]
+        return render_template('quiz.html', pergunta=proxima_pergunta, token=token, tempo_restante=tempo_restante)
     else:
         flash('Parabéns, você respondeu todas as perguntas de quiz rápido disponíveis para o seu setor!', 'success')
         return redirect(url_for('dashboard'))
@@ -266,15 +1741,10 @@ def pagina_atividades():
     hoje = date.today()
     usuario_id = session['usuario_id']
     usuario = Usuario.query.get(usuario_id)
-    atividades = Pergunta.query.filter(
-        Pergunta.tipo == 'discursiva',
-        Pergunta.data_liberacao <= hoje,
-        or_(
-            Pergunta.para_todos_setores == True,
-            Pergunta.departamentos.any(Departamento.id == usuario.departamento_id)
-        )
-    ).order_by(Pergunta.data_liberacao.desc()).all()
-    respostas_dadas = {r.pergunta_id: r for r in Resposta.query.filter_by(usuario_id=usuario_id).all()}
+    ids_atividades = indice_visibilidade.liberadas(usuario.departamento_id, ('discursiva',), hoje)
+    atividades = Pergunta.query.filter(Pergunta.id.in_(ids_atividades)).order_by(Pergunta.data_liberacao.desc()).all() if ids_atividades else []
+    respostas_dadas = {r.pergunta_id: r for r in Resposta.query.filter(
+        Resposta.usuario_id == usuario_id, Resposta.pergunta_id.in_(ids_atividades)).all()} if ids_atividades else {}
     return render_template('atividades.html', atividades=atividades, respostas_dadas=respostas_dadas)
 
 # Dentro de app.py
@@ -292,29 +1762,38 @@ def responder_atividade(pergunta_id):
         # ====================================================================
         # A LÓGICA PARA PROCESSAR O ANEXO ESTÁ AQUI
         # ====================================================================
-        anexo_url = None # 1. Começa sem anexo por padrão.
+        anexo = None # 1. Começa sem anexo por padrão.
         
         if 'anexo_resposta' in request.files: # 2. Verifica se um arquivo foi enviado.
             file = request.files['anexo_resposta']
             if file and file.filename != '' and allowed_file(file.filename):
-                # 3. Envia o arquivo para o Cloudinary de forma segura.
-                #    'resource_type="auto"' permite enviar PDFs, Docs, etc., além de imagens.
-                upload_result = cloudinary.uploader.upload(file, resource_type="auto")
-                # 4. Pega a URL segura que o Cloudinary devolveu.
-                anexo_url = upload_result.get('secure_url')
+                # 3. Só grava o arquivo em disco; o envio ao armazenamento acontece em segundo plano
+                anexo = guardar_upload(file), file.filename
         # ====================================================================
 
-        # 5. Salva a resposta no banco de dados com o link do anexo (ou None se não houver).
+        # 4. Salva a resposta no banco; o link do anexo é preenchido quando o envio terminar.
         nova_resposta = Resposta(
             usuario_id=session['usuario_id'],
             pergunta_id=pergunta.id,
             texto_discursivo=texto_resposta,
-            anexo_resposta=anexo_url, # <-- A URL é salva aqui
-            status_correcao='pendente'
+            status_correcao='pendente',
+            data_resposta=datetime.utcnow()
         )
         db.session.add(nova_resposta)
-        db.session.commit()
-        
+        try:
+            _atualizar_placar(session['usuario_id'], respostas=1)
+            _somar_ao_resumo_diario([{'usuario_id': session['usuario_id'], 'dia': nova_resposta.data_resposta.date(),
+                                      'respostas': 1, 'corretas': 0, 'pontos': 0}])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            if anexo:
+                os.remove(anexo[0])
+            flash('Esta atividade já foi respondida.', 'warning')
+            return redirect(url_for('pagina_atividades'))
+
+        if anexo:
+            agendar_upload(*anexo, 'anexos', Resposta, nova_resposta.id, 'anexo_resposta')
         flash('Sua resposta foi enviada para avaliação!', 'success')
         return redirect(url_for('pagina_atividades'))
 
@@ -324,27 +1803,93 @@ def responder_atividade(pergunta_id):
 @app.route('/responder', methods=['POST'])
 def processa_resposta():
     if 'usuario_id' not in session: return redirect(url_for('pagina_login'))
-    pergunta_id = request.form['pergunta_id']
-    resposta_usuario = request.form.get('resposta', '')
-    pergunta = Pergunta.query.get(pergunta_id)
-    pontos = 0
-    if pergunta.resposta_correta == resposta_usuario:
-        tempo_restante = float(request.form['tempo_restante'])
-        pontos = 100 + int(tempo_restante * 5)
+    pergunta_id = request.form.get('pergunta_id', type=int)
+    resposta_usuario = request.form.get('resposta', '')[:1]
+    if pergunta_id is None:
+        abort(400)
+    decorrido = segundos_desde_emissao(request.form.get('token'), pergunta_id, session['usuario_id'])
+    pontos = registrar_resposta_objetiva(session['usuario_id'], pergunta_id, resposta_usuario, decorrido)
+    db.session.commit()
+    if pontos is None:
+        if resposta_ja_registrada(session['usuario_id'], pergunta_id):
+            # Duplo clique ou POST reenviado: a pergunta já tinha resposta deste usuário
+            flash('Esta pergunta já foi respondida.', 'warning')
+        else:
+            flash('Pergunta não disponível para você.', 'danger')
+        return redirect(url_for('pagina_quiz'))
+    if pontos > 0:
         flash(f'Resposta correta! Você ganhou {pontos} pontos.', 'success')
     else:
         flash('Resposta incorreta. Sem pontos desta vez.', 'danger')
-    nova_resposta = Resposta(
-        pontos=pontos, 
-        usuario_id=session['usuario_id'], 
-        pergunta_id=pergunta_id, 
-        resposta_dada=resposta_usuario, 
-        status_correcao='correto' if pontos > 0 else 'incorreto'
-    )
-    db.session.add(nova_resposta)
-    db.session.commit()
     return redirect(url_for('pagina_quiz'))
 
+# --- API JSON DO QUIZ ---
+# Usada pelo quiz.html: cada resposta vai por JSON e volta com a próxima pergunta, numa ida e
+# volta só, sem o redirect e a página inteira renderizada a cada pergunta. O cronômetro de cada
+# pergunta começa na entrega (token), então o quiz.html não busca perguntas antecipadamente.
+MAXIMO_PERGUNTAS_API = 20
+
+def _pergunta_json(pergunta, entrega):
+    # Nunca inclui a resposta correta; 'entrega' é o (token, tempo restante) de entregar_perguntas
+    token, tempo_restante = entrega
+    return {
+        'id': pergunta.id,
+        'tipo': pergunta.tipo,
+        'texto': pergunta.texto,
+        'opcoes': {'a': pergunta.opcao_a, 'b': pergunta.opcao_b, 'c': pergunta.opcao_c, 'd': pergunta.opcao_d}
+                  if pergunta.tipo == 'multipla_escolha' else None,
+        'tempo_limite': pergunta.tempo_limite,
+        'tempo_restante': tempo_restante,
+        'token': token,
+    }
+
+def _proxima_json(usuario_id):
+    perguntas, pendentes = _perguntas_pendentes(usuario_id, date.today(), 1)
+    entregas = entregar_perguntas(usuario_id, perguntas)
+    return {'proxima': _pergunta_json(perguntas[0], entregas[perguntas[0].id]) if perguntas else None, 'pendentes': pendentes}
+
+def _placar_json(usuario_id):
+    placar = db.session.get(PontuacaoUsuario, usuario_id)
+    return {
+        'pontos_totais': placar.pontos_totais if placar else 0,
+        'total_respostas': placar.total_respostas if placar else 0,
+        'total_acertos': placar.total_acertos if placar else 0,
+    }
+
+@app.route('/api/quiz/perguntas')
+def api_quiz_perguntas():
+    if 'usuario_id' not in session: return jsonify({'erro': 'não autorizado'}), 401
+    quantidade = min(max(request.args.get('quantidade', 5, type=int), 1), MAXIMO_PERGUNTAS_API)
+    perguntas, pendentes = _perguntas_pendentes(session['usuario_id'], date.today(), quantidade)
+    entregas = entregar_perguntas(session['usuario_id'], perguntas)
+    return jsonify({'perguntas': [_pergunta_json(p, entregas[p.id]) for p in perguntas], 'pendentes': pendentes})
+
+@app.route('/api/quiz/respostas', methods=['POST'])
+def api_quiz_responder():
+    if 'usuario_id' not in session: return jsonify({'erro': 'não autorizado'}), 401
+    dados = request.get_json(silent=True) or {}
+    try:
+        pergunta_id = int(dados['pergunta_id'])
+        resposta = str(dados.get('resposta') or '')[:1]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'erro': 'Informe pergunta_id, resposta e token.'}), 400
+    usuario_id = session['usuario_id']
+    decorrido = segundos_desde_emissao(dados.get('token'), pergunta_id, usuario_id)
+    pontos = registrar_resposta_objetiva(usuario_id, pergunta_id, resposta, decorrido)
+    db.session.commit()
+    if pontos is None:
+        if not resposta_ja_registrada(usuario_id, pergunta_id):
+            return jsonify({'erro': 'Pergunta não encontrada ou não disponível para você.'}), 404
+        return jsonify({'erro': 'Esta pergunta já foi respondida.', 'placar': _placar_json(usuario_id),
+                        **_proxima_json(usuario_id)}), 409
+    return jsonify({'pergunta_id': pergunta_id, 'correta': pontos > 0, 'pontos': pontos,
+                    'placar': _placar_json(usuario_id), **_proxima_json(usuario_id)}), 201
+
+@app.route('/api/quiz/placar')
+def api_quiz_placar():
+    if 'usuario_id' not in session: return jsonify({'erro': 'não autorizado'}), 401
+    return jsonify(_placar_json(session['usuario_id']))
+
 # Em app.py
 
 @app.route('/minhas-respostas')
@@ -391,11 +1936,13 @@ def minhas_respostas():
         # Apenas para discursivas aguardando avaliação
         query = query.filter(Resposta.status_correcao == 'pendente')
     
-    # Executa a busca final com os filtros e ordena pelas mais recentes
-    respostas_usuario = query.order_by(Resposta.data_resposta.desc()).all()
+    # Executa a busca final com os filtros, uma página por vez, das mais recentes para as mais antigas
+    pagina = paginar_por_chave(query.options(db.joinedload(Resposta.pergunta)), Resposta.data_resposta, Resposta.id,
+                               apos=request.args.get('apos'), antes=request.args.get('antes'))
 
     return render_template('minhas_respostas.html', 
-                           respostas=respostas_usuario,
+                           respostas=pagina.itens,
+                           pagina=pagina,
                            filtro_tipo=filtro_tipo,
                            filtro_resultado=filtro_resultado)
 
@@ -409,68 +1956,28 @@ def exportar_respostas_detalhado():
         return redirect(url_for('pagina_admin'))
 
     depto_selecionado_id = request.args.get('departamento_id', type=int)
-    # Pega o tipo de relatório a ser gerado (quiz ou discursivas)
+    # Pega o tipo de relatório a ser gerado (quiz ou discursivas) e o formato do arquivo
     tipo_relatorio = request.args.get('tipo', 'todos')
+    formato = 'xlsx' if request.args.get('formato') == 'xlsx' else 'csv'
 
-    # Busca base de todas as respostas
-    query = Resposta.query.join(Usuario).join(Departamento).join(Pergunta)
-
-    # Aplica o filtro de setor, se houver
-    if depto_selecionado_id:
-        query = query.filter(Usuario.departamento_id == depto_selecionado_id)
-        
-    # Aplica o filtro de TIPO de pergunta
-    if tipo_relatorio == 'quiz':
-        query = query.filter(Pergunta.tipo != 'discursiva')
-    elif tipo_relatorio == 'discursivas':
-        query = query.filter(Pergunta.tipo == 'discursiva')
-
-    todas_as_respostas = query.order_by(Departamento.nome, Usuario.nome, Resposta.data_resposta).all()
-
-    if not todas_as_respostas:
+    query = _consulta_exportacao_detalhada(tipo_relatorio, depto_selecionado_id)
+    if not db.session.query(query.exists()).scalar():
         flash("Nenhuma resposta encontrada para exportar com os filtros selecionados.", "warning")
         return redirect(url_for('pagina_analytics'))
 
-    # Processa os dados e cria a planilha
-    dados_para_planilha = []
-    colunas = []
-    
-    if tipo_relatorio == 'quiz':
-        colunas = ['Colaborador', 'Setor', 'Data da Resposta', 'Pergunta', 'Tipo', 'Resposta Dada', 'Resposta Correta', 'Pontos']
-        for r in todas_as_respostas:
-            dados_para_planilha.append({
-                'Colaborador': r.usuario.nome, 'Setor': r.usuario.departamento.nome,
-                'Data da Resposta': (r.data_resposta - timedelta(hours=3)).strftime('%d/%m/%Y %H:%M'),
-                'Pergunta': r.pergunta.texto, 'Tipo': r.pergunta.tipo,
-                'Resposta Dada': get_texto_da_opcao(r.pergunta, r.resposta_dada),
-                'Resposta Correta': get_texto_da_opcao(r.pergunta, r.pergunta.resposta_correta),
-                'Pontos': r.pontos or 0
-            })
-    else: # Discursivas
-        colunas = ['Colaborador', 'Setor', 'Data da Resposta', 'Pergunta', 'Resposta Discursiva', 'Status', 'Feedback', 'Pontos']
-        for r in todas_as_respostas:
-             dados_para_planilha.append({
-                'Colaborador': r.usuario.nome, 'Setor': r.usuario.departamento.nome,
-                'Data da Resposta': (r.data_resposta - timedelta(hours=3)).strftime('%d/%m/%Y %H:%M'),
-                'Pergunta': r.pergunta.texto, 'Resposta Discursiva': r.texto_discursivo,
-                'Status': r.status_correcao, 'Feedback': r.feedback_admin or '',
-                'Pontos': r.pontos or 0
-            })
-
-    df = pd.DataFrame(dados_para_planilha, columns=colunas)
-    output = io.BytesIO()
-    
-    nome_arquivo = f'relatorio_detalhado_{tipo_relatorio}.xlsx'
-
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Relatorio Detalhado')
-    output.seek(0)
-
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=nome_arquivo
+    if app.config['TAREFAS_EM_SEGUNDO_PLANO'] or formato == 'xlsx':
+        # O XLSX só existe inteiro no fim (o zip é fechado por último): é montado fora da requisição,
+        # sem o risco do timeout do gunicorn, e baixado pela página da tarefa
+        nova_tarefa = executar_em_segundo_plano('exportar_respostas_detalhado', tipo=tipo_relatorio,
+                                                departamento_id=depto_selecionado_id, formato=formato)
+        return redirect(url_for('pagina_tarefa', tarefa_id=nova_tarefa.id))
+
+    # O CSV sai em blocos enquanto o banco ainda está sendo lido
+    colunas = COLUNAS_EXPORTACAO_QUIZ if tipo_relatorio == 'quiz' else COLUNAS_EXPORTACAO_DISCURSIVAS
+    return Response(
+        stream_with_context(_gerar_csv(colunas, _linhas_exportacao_detalhada(query, tipo_relatorio))),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=relatorio_detalhado_{tipo_relatorio}.csv'}
     )
 
 # --- ROTAS DE RANKING ---
@@ -478,25 +1985,26 @@ def exportar_respostas_detalhado():
 def pagina_ranking():
     if 'usuario_id' not in session: return redirect(url_for('pagina_login'))
 
-    # MUDANÇA: Usamos func.coalesce para garantir que a soma nunca seja None
-    pontos_por_depto = db.session.query(
-        Departamento.nome,
-        func.coalesce(func.sum(Resposta.pontos), 0).label('pontos_totais')
-    ).join(Usuario, Departamento.id == Usuario.departamento_id).join(Resposta, Usuario.id == Resposta.usuario_id).group_by(Departamento.nome).all()
+    return pagina_em_cache(lambda: render_template('ranking.html', ranking=_ranking_setores()),
+                           tags=('departamento', 'usuario', 'pontuacao_departamento'))
 
-    usuarios_por_depto = db.session.query(
-        Departamento.id, 
+def _ranking_setores():
+    # Lê o placar já consolidado por setor (mantido a cada resposta e correção)
+    # Setor ainda sem linha no placar aparece com 0 pontos e os usuários contados na hora
+    usuarios_do_setor = db.select(func.count(Usuario.id)).where(Usuario.departamento_id == Departamento.id).scalar_subquery()
+    num_usuarios = func.coalesce(PontuacaoDepartamento.num_usuarios, usuarios_do_setor)
+    placar_setores = db.session.query(
+        Departamento.id,
         Departamento.nome,
-        func.count(Usuario.id).label('num_usuarios')
-    ).join(Usuario, Departamento.id == Usuario.departamento_id).group_by(Departamento.id, Departamento.nome).all()
+        func.coalesce(PontuacaoDepartamento.pontos_totais, 0),
+        num_usuarios
+    ).outerjoin(PontuacaoDepartamento, PontuacaoDepartamento.departamento_id == Departamento.id).filter(
+        num_usuarios > 0
+    ).all()
 
     ranking_final = []
-    pontos_dict = dict(pontos_por_depto)
-    
-    for depto_id, depto_nome, num_usuarios in usuarios_por_depto:
-        # Agora, a busca a partir de 'pontos_dict' sempre retornará um número
-        pontos_totais = pontos_dict.get(depto_nome, 0)
-        pontuacao_proporcional = pontos_totais / num_usuarios if num_usuarios > 0 else 0
+    for depto_id, depto_nome, pontos_totais, num_usuarios in placar_setores:
+        pontuacao_proporcional = pontos_totais / num_usuarios
         
         ranking_final.append({
             'id': depto_id, 
@@ -507,14 +2015,23 @@ def pagina_ranking():
         })
         
     ranking_final.sort(key=lambda x: x['pontuacao_proporcional'], reverse=True)
-    
-    return render_template('ranking.html', ranking=ranking_final)
+    return ranking_final
 
 @app.route('/ranking/<int:departamento_id>')
 def pagina_ranking_detalhe(departamento_id):
     if 'usuario_id' not in session: return redirect(url_for('pagina_login'))
-    departamento = Departamento.query.get_or_404(departamento_id)
-    ranking_individual_query = db.session.query(Usuario.nome, func.coalesce(func.sum(Resposta.pontos), 0).label('pontos_totais'), func.coalesce(func.count(Resposta.id), 0).label('total_respostas'), func.coalesce(func.sum(case((Resposta.pontos > 0, 1), else_=0)), 0).label('total_acertos')).select_from(Usuario).outerjoin(Resposta).filter(Usuario.departamento_id == departamento_id).group_by(Usuario.nome).all()
+    return pagina_em_cache(lambda: render_template('ranking_detalhe.html', departamento=Departamento.query.get_or_404(departamento_id),
+                                                   ranking=_ranking_do_setor(departamento_id)),
+                           tags=('departamento', 'usuario', 'pontuacao_usuario'))
+
+def _ranking_do_setor(departamento_id):
+    # Membro ainda sem linha no placar aparece zerado
+    ranking_individual_query = db.session.query(
+        Usuario.nome,
+        func.coalesce(PontuacaoUsuario.pontos_totais, 0).label('pontos_totais'),
+        func.coalesce(PontuacaoUsuario.total_respostas, 0).label('total_respostas'),
+        func.coalesce(PontuacaoUsuario.total_acertos, 0).label('total_acertos')
+    ).outerjoin(PontuacaoUsuario, PontuacaoUsuario.usuario_id == Usuario.id).filter(Usuario.departamento_id == departamento_id).all()
     ranking_final = []
     for membro in ranking_individual_query:
         total_respostas = membro.total_respostas
@@ -522,7 +2039,7 @@ def pagina_ranking_detalhe(departamento_id):
         percentual = (total_acertos / total_respostas) * 100 if total_respostas > 0 else 0
         ranking_final.append({'nome': membro.nome, 'pontos_totais': membro.pontos_totais, 'total_respostas': total_respostas, 'total_acertos': total_acertos, 'percentual_acertos': round(percentual, 1)})
     ranking_final.sort(key=lambda x: x['nome'])
-    return render_template('ranking_detalhe.html', departamento=departamento, ranking=ranking_final)
+    return ranking_final
 
 # --- ROTAS DE ADMIN ---
 
@@ -543,6 +2060,7 @@ def pagina_admin():
             flash('Senha incorreta!', 'danger')
     
     perguntas, usuarios, departamentos = [], [], []
+    pagina_perguntas = pagina_usuarios = None
     contagem_pendentes = 0
     
     # Dicionário para passar os valores dos filtros de volta para o template
@@ -550,8 +2068,11 @@ def pagina_admin():
 
     if senha_correta:
         # Busca inicial de dados para os formulários
-        usuarios = Usuario.query.join(Departamento).order_by(Departamento.nome, Usuario.nome).all()
-        departamentos = Departamento.query.order_by(Departamento.nome).all()
+        pagina_usuarios = paginar_por_chave(Usuario.query.options(db.joinedload(Usuario.departamento)), Usuario.nome, Usuario.id,
+                                            apos=request.args.get('usuarios_apos'), antes=request.args.get('usuarios_antes'),
+                                            decrescente=False)
+        usuarios = pagina_usuarios.itens
+        departamentos = _lista_departamentos()
         contagem_pendentes = Resposta.query.join(Pergunta).filter(Pergunta.tipo == 'discursiva', Resposta.status_correcao == 'pendente').count()
 
         # --- INÍCIO DA NOVA LÓGICA DE FILTRAGEM DE PERGUNTAS ---
@@ -589,14 +2110,18 @@ def pagina_admin():
             query_perguntas = query_perguntas.filter(Pergunta.tipo == filtro_tipo)
             filtros_ativos['tipo'] = filtro_tipo
 
-        # 4. Executa a busca final com os filtros aplicados
-        perguntas = query_perguntas.order_by(Pergunta.data_liberacao.desc(), Pergunta.id.desc()).all()
+        # 4. Executa a busca final com os filtros aplicados, uma página por vez
+        pagina_perguntas = paginar_por_chave(query_perguntas, Pergunta.data_liberacao, Pergunta.id,
+                                             apos=request.args.get('apos'), antes=request.args.get('antes'))
+        perguntas = pagina_perguntas.itens
         # --- FIM DA NOVA LÓGICA DE FILTRAGEM ---
 
     return render_template('admin.html', 
                            senha_correta=senha_correta, 
                            perguntas=perguntas, 
                            usuarios=usuarios, 
+                           pagina_perguntas=pagina_perguntas,
+                           pagina_usuarios=pagina_usuarios,
                            departamentos=departamentos,
                            contagem_pendentes=contagem_pendentes,
                            filtros=filtros_ativos) # Envia os filtros ativos para o template
@@ -608,6 +2133,8 @@ def adicionar_setor():
     if nome_setor and not Departamento.query.filter_by(nome=nome_setor).first():
         novo_depto = Departamento(nome=nome_setor)
         db.session.add(novo_depto)
+        db.session.flush()
+        db.session.add(PontuacaoDepartamento(departamento_id=novo_depto.id, pontos_totais=0, num_usuarios=0))
         db.session.commit()
         flash(f'Setor "{nome_setor}" adicionado com sucesso!', 'success')
     else:
@@ -621,6 +2148,7 @@ def excluir_setor(departamento_id):
     if depto.usuarios:
         flash(f'Não é possível excluir o setor "{depto.nome}" pois ele possui usuários.', 'danger')
     else:
+        PontuacaoDepartamento.query.filter_by(departamento_id=departamento_id).delete()
         db.session.delete(depto)
         db.session.commit()
         flash(f'Setor "{depto.nome}" excluído com sucesso.', 'success')
@@ -649,6 +2177,9 @@ def adicionar_usuario():
         departamento_id=request.form['departamento_id']
     )
     db.session.add(novo_usuario)
+    db.session.flush()
+    db.session.add(PontuacaoUsuario(usuario_id=novo_usuario.id, pontos_totais=0, total_respostas=0, total_acertos=0))
+    _recalcular_placar_departamentos()
     db.session.commit()
     flash('Usuário adicionado com sucesso!', 'success')
     return redirect(url_for('pagina_admin'))
@@ -657,7 +2188,7 @@ def adicionar_usuario():
 def editar_usuario(usuario_id):
     if not session.get('admin_logged_in'): return redirect(url_for('pagina_admin'))
     usuario = Usuario.query.get_or_404(usuario_id)
-    departamentos = Departamento.query.order_by(Departamento.nome).all()
+    departamentos = _lista_departamentos()
     return render_template('edit_user.html', usuario=usuario, departamentos=departamentos)
 
 @app.route('/admin/edit_user/<int:usuario_id>', methods=['POST'])
@@ -683,6 +2214,8 @@ def atualizar_usuario(usuario_id):
     usuario.codigo_acesso = novo_codigo
     usuario.departamento_id = request.form['departamento_id']
     
+    db.session.flush()
+    _recalcular_placar_departamentos() # O usuário pode ter mudado de setor
     db.session.commit()
     flash(f'Usuário "{usuario.nome}" atualizado com sucesso!', 'success')
     return redirect(url_for('pagina_admin'))
@@ -691,9 +2224,19 @@ def atualizar_usuario(usuario_id):
 def excluir_usuario(usuario_id):
     if not session.get('admin_logged_in'): return redirect(url_for('pagina_admin'))
     usuario = Usuario.query.get_or_404(usuario_id)
+    anexos = [url for url, in db.session.query(Resposta.anexo_resposta).filter(
+        Resposta.usuario_id == usuario_id, Resposta.anexo_resposta.isnot(None))]
     Resposta.query.filter_by(usuario_id=usuario_id).delete()
+    PontuacaoUsuario.query.filter_by(usuario_id=usuario_id).delete()
+    ResumoDiarioUsuario.query.filter_by(usuario_id=usuario_id).delete()
+    NotificacaoEnviada.query.filter_by(usuario_id=usuario_id).delete()
+    NotificacaoFalha.query.filter_by(usuario_id=usuario_id).delete()
+    EntregaPergunta.query.filter_by(usuario_id=usuario_id).delete()
     db.session.delete(usuario)
+    db.session.flush()
+    _recalcular_placar_departamentos()
     db.session.commit()
+    agendar_exclusao(anexos)
     flash(f'Usuário "{usuario.nome}" e todas as suas respostas foram excluídos.', 'success')
     return redirect(url_for('pagina_admin'))
 
@@ -712,17 +2255,13 @@ def adicionar_pergunta():
     )
 
     # =========================================================
-    # LÓGICA CORRIGIDA PARA USAR O CLOUDINARY
+    # IMAGEM: gravada em disco agora e enviada ao armazenamento depois do commit
     # =========================================================
+    imagem = None
     if 'imagem_pergunta' in request.files:
         file = request.files['imagem_pergunta']
         if file and file.filename != '' and allowed_file(file.filename):
-            # Envia o arquivo para a nuvem do Cloudinary
-            upload_result = cloudinary.uploader.upload(file, folder="perguntas")
-            # Pega a URL segura que o Cloudinary devolveu
-            imagem_url = upload_result.get('secure_url')
-            # Salva essa URL no banco de dados
-            nova_pergunta.imagem_pergunta = imagem_url
+            imagem = guardar_upload(file), file.filename
     # =========================================================
 
     if 'para_todos_setores' in request.form:
@@ -747,6 +2286,8 @@ def adicionar_pergunta():
 
     db.session.add(nova_pergunta)
     db.session.commit()
+    if imagem:
+        agendar_upload(*imagem, 'perguntas', Pergunta, nova_pergunta.id, 'imagem_pergunta')
     flash('Pergunta adicionada com sucesso!', 'success')
     
     # A lógica de notificação foi desativada para a versão local
@@ -759,7 +2300,7 @@ def adicionar_pergunta():
 def editar_pergunta(pergunta_id):
     if not session.get('admin_logged_in'): return redirect(url_for('pagina_admin'))
     pergunta = Pergunta.query.get_or_404(pergunta_id)
-    todos_departamentos = Departamento.query.order_by(Departamento.nome).all()
+    todos_departamentos = _lista_departamentos()
     return render_template('edit_question.html', pergunta=pergunta, todos_departamentos=todos_departamentos)
 
 @app.route('/admin/edit_question/<int:pergunta_id>', methods=['POST'])
@@ -775,23 +2316,14 @@ def atualizar_pergunta(pergunta_id):
     pergunta.data_liberacao = datetime.strptime(request.form.get('data_liberacao'), '%Y-%m-%d').date()
 
     # =========================================================
-    # LÓGICA CORRIGIDA PARA ATUALIZAR A IMAGEM USANDO CLOUDINARY
+    # IMAGEM: a nova é enviada em segundo plano depois do commit
     # =========================================================
+    imagem = None
     if 'imagem_pergunta' in request.files:
         file = request.files['imagem_pergunta']
         if file and file.filename != '' and allowed_file(file.filename):
-            # (Opcional, mas boa prática: apaga a imagem antiga do Cloudinary)
-            if pergunta.imagem_pergunta:
-                # Extrai o 'public_id' da URL antiga para poder deletar
-                public_id = pergunta.imagem_pergunta.split('/')[-1].split('.')[0]
-                cloudinary.uploader.destroy(public_id)
-
-            # Envia a NOVA imagem para o Cloudinary
-            upload_result = cloudinary.uploader.upload(file, folder="perguntas_quiz")
-            # Pega a URL segura que o Cloudinary devolveu
-            imagem_url = upload_result.get('secure_url')
-            # Atualiza a URL da pergunta no banco de dados
-            pergunta.imagem_pergunta = imagem_url
+            # A imagem antiga continua valendo até a nova terminar de subir; depois é apagada
+            imagem = guardar_upload(file), file.filename
     # =========================================================
 
     # Lógica para atualizar os setores (já estava correta)
@@ -818,6 +2350,8 @@ def atualizar_pergunta(pergunta_id):
         pergunta.opcao_a, pergunta.opcao_b, pergunta.opcao_c, pergunta.opcao_d = None, None, None, None
         
     db.session.commit()
+    if imagem:
+        agendar_upload(*imagem, 'perguntas_quiz', Pergunta, pergunta.id, 'imagem_pergunta')
     flash('Pergunta atualizada com sucesso!', 'success')
     return redirect(url_for('pagina_admin'))
 
@@ -828,35 +2362,20 @@ def excluir_pergunta(pergunta_id):
         
     pergunta = Pergunta.query.get_or_404(pergunta_id)
     
-    # --- NOVA LÓGICA PARA APAGAR ARQUIVOS DO CLOUDINARY ---
-    try:
-        # 1. Apaga a imagem da pergunta, se existir
-        if pergunta.imagem_pergunta:
-            # Extrai o "public_id" da URL do Cloudinary
-            public_id = pergunta.imagem_pergunta.split('/')[-1].split('.')[0]
-            cloudinary.uploader.destroy(public_id)
-            app.logger.info(f"Imagem {public_id} excluída do Cloudinary.")
-
-        # 2. Busca todas as respostas da pergunta para apagar os anexos
-        respostas_para_excluir = Resposta.query.filter_by(pergunta_id=pergunta.id).all()
-        for resposta in respostas_para_excluir:
-            if resposta.anexo_resposta:
-                public_id_anexo = resposta.anexo_resposta.split('/')[-1].split('.')[0]
-                # Usa 'destroy' com resource_type="raw" para arquivos como PDF, DOC
-                cloudinary.uploader.destroy(public_id_anexo, resource_type="raw")
-                app.logger.info(f"Anexo {public_id_anexo} excluído do Cloudinary.")
-
-    except Exception as e:
-        app.logger.error(f"Erro ao tentar excluir arquivos do Cloudinary: {e}")
-        # Mesmo que falhe em apagar do Cloudinary, continua para apagar do banco
-    # --- FIM DA NOVA LÓGICA ---
+    # Arquivos da pergunta e dos anexos das respostas: apagados do armazenamento depois, em lote
+    arquivos = [pergunta.imagem_pergunta] + [url for url, in db.session.query(Resposta.anexo_resposta).filter(
+        Resposta.pergunta_id == pergunta.id, Resposta.anexo_resposta.isnot(None))]
 
-    # Apaga todas as respostas ligadas a esta pergunta no banco
+    # Apaga todas as respostas ligadas a esta pergunta no banco (descontando-as do ranking)
+    _remover_respostas_do_placar(Resposta.pergunta_id == pergunta.id)
+    _remover_respostas_do_resumo(Resposta.pergunta_id == pergunta.id)
     Resposta.query.filter_by(pergunta_id=pergunta.id).delete()
+    EntregaPergunta.query.filter_by(pergunta_id=pergunta.id).delete()
     
     # Apaga a pergunta do banco
     db.session.delete(pergunta)
     db.session.commit()
+    agendar_exclusao(arquivos)
     
     flash('Pergunta e todas as suas respostas foram excluídas com sucesso.', 'success')
     return redirect(url_for('pagina_admin'))
@@ -864,37 +2383,48 @@ def excluir_pergunta(pergunta_id):
 @app.route('/admin/correcoes')
 def pagina_correcoes():
     if not session.get('admin_logged_in'): return redirect(url_for('pagina_admin'))
-    usuarios_disponiveis = Usuario.query.order_by(Usuario.nome).all()
     usuario_selecionado_id = request.args.get('usuario_id', type=int)
     status_selecionado = request.args.get('status', 'pendente')
     query = Resposta.query.join(Pergunta).filter(Pergunta.tipo == 'discursiva')
     if status_selecionado != 'todos':
         query = query.filter(Resposta.status_correcao == status_selecionado)
+    # O filtro de colaborador lista só quem tem respostas com o status escolhido, não a empresa inteira
+    usuarios_disponiveis = Usuario.query.options(db.joinedload(Usuario.departamento)).filter(
+        Usuario.id.in_(query.with_entities(Resposta.usuario_id))
+    ).order_by(Usuario.nome).all()
     if usuario_selecionado_id:
         query = query.filter(Resposta.usuario_id == usuario_selecionado_id)
-    respostas_filtradas = query.join(Usuario).order_by(Resposta.data_resposta.desc()).all()
+    query = query.options(db.joinedload(Resposta.pergunta), db.joinedload(Resposta.usuario).joinedload(Usuario.departamento))
+    pagina = paginar_por_chave(query, Resposta.data_resposta, Resposta.id,
+                               apos=request.args.get('apos'), antes=request.args.get('antes'))
     return render_template('correcoes.html', 
-                           respostas=respostas_filtradas, 
+                           respostas=pagina.itens, 
+                           pagina=pagina,
                            usuarios_disponiveis=usuarios_disponiveis, 
                            usuario_selecionado_id=usuario_selecionado_id,
                            status_selecionado=status_selecionado)
 
 
+def _periodo_do_relatorio():
+    """Datas 'inicio' e 'fim' (AAAA-MM-DD, inclusivas) da query string; inválidas são ignoradas."""
+    return (request.args.get('inicio', type=date.fromisoformat),
+            request.args.get('fim', type=date.fromisoformat))
+
 @app.route('/admin/relatorios')
 def pagina_relatorios():
     if not session.get('admin_logged_in'): 
         return redirect(url_for('pagina_admin'))
 
     depto_selecionado_id = request.args.get('departamento_id', type=int)
-    departamentos = Departamento.query.order_by(Departamento.nome).all()
+    inicio, fim = _periodo_do_relatorio()
 
     # Agora apenas chama a função auxiliar para obter os dados
-    dados_relatorio = _gerar_dados_relatorio(depto_selecionado_id)
-
-    return render_template('relatorios.html', 
-                           relatorios=dados_relatorio, 
-                           departamentos=departamentos, 
-                           depto_selecionado_id=depto_selecionado_id)
+    return pagina_em_cache(lambda: render_template('relatorios.html', 
+                                                   relatorios=_gerar_dados_relatorio(depto_selecionado_id, inicio, fim), 
+                                                   departamentos=_lista_departamentos(), 
+                                                   depto_selecionado_id=depto_selecionado_id,
+                                                   inicio=inicio, fim=fim),
+                           tags=('usuario', 'departamento', 'resumo_diario_usuario'))
 
 
 @app.route('/admin/relatorios/exportar')
@@ -903,35 +2433,24 @@ def exportar_relatorios():
         return redirect(url_for('pagina_admin'))
 
     depto_selecionado_id = request.args.get('departamento_id', type=int)
+    inicio, fim = _periodo_do_relatorio()
+
+    if app.config['TAREFAS_EM_SEGUNDO_PLANO']:
+        nova_tarefa = enfileirar_tarefa('exportar_relatorios', departamento_id=depto_selecionado_id,
+                                        inicio=inicio and inicio.isoformat(), fim=fim and fim.isoformat())
+        return redirect(url_for('pagina_tarefa', tarefa_id=nova_tarefa.id))
 
     # 1. Reutiliza a mesma lógica de busca de dados
-    dados_relatorio = _gerar_dados_relatorio(depto_selecionado_id)
+    dados_relatorio = _gerar_dados_relatorio(depto_selecionado_id, inicio, fim)
 
     if not dados_relatorio:
         flash("Nenhum dado para exportar com os filtros selecionados.", "warning")
         return redirect(url_for('pagina_relatorios'))
 
-    # 2. Converte os dados para um formato que o pandas entende
-    df = pd.DataFrame(dados_relatorio)
-
-    # 3. Renomeia e reordena as colunas para a planilha
-    df = df.rename(columns={
-        'nome': 'Colaborador',
-        'setor': 'Setor',
-        'total_respostas': 'Respostas Totais',
-        'respostas_corretas': 'Respostas Corretas',
-        'aproveitamento': 'Aproveitamento (%)',
-        'pontuacao_total': 'Pontuação Total'
-    })
-    df['Aproveitamento (%)'] = df['Aproveitamento (%)'].map('{:.1f}%'.format)
-
-    # 4. Cria o arquivo Excel em memória
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Relatorio de Desempenho')
+    # 2. Gera a planilha em memória e envia para download
+    output = _escrever_planilha_relatorio(dados_relatorio, io.BytesIO())
     output.seek(0)
 
-    # 5. Envia o arquivo para download
     return send_file(
         output,
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
@@ -943,68 +2462,93 @@ def exportar_relatorios():
 def corrigir_resposta(resposta_id):
     if not session.get('admin_logged_in'):
         return redirect(url_for('pagina_admin'))
-        
-    resposta = Resposta.query.get_or_404(resposta_id)
-    
+
     novo_status = request.form.get('status')
-    feedback_texto = request.form.get('feedback', '')
-    
-    # MUDANÇA: Adicionada a nova opção 'parcialmente_correto'
-    if novo_status in ['correto', 'incorreto', 'parcialmente_correto']:
-        resposta.status_correcao = novo_status
-        resposta.feedback_admin = feedback_texto
-        
-        if novo_status == 'correto':
-            resposta.pontos = 100
-        elif novo_status == 'parcialmente_correto':
-            resposta.pontos = 50 # Pontuação intermediária
-        else: # Incorreto
-            resposta.pontos = 0
-            
+    # Na página de correções cada resposta tem a sua caixa (feedback_<id>), dentro do formulário do lote
+    feedback_texto = request.form.get(f'feedback_{resposta_id}', request.form.get('feedback', ''))
+
+    if novo_status in PONTOS_POR_STATUS:
+        if not corrigir_respostas({resposta_id: (novo_status, feedback_texto)}):
+            abort(404)
         db.session.commit()
         flash('Resposta avaliada com sucesso!', 'success')
     else:
         flash('Ação de correção inválida.', 'danger')
         
-    return redirect(url_for('pagina_correcoes'))
+    return _voltar_para_correcoes()
+
+@app.route('/admin/correcoes/lote', methods=['POST'])
+def corrigir_respostas_lote():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('pagina_admin'))
+
+    novo_status = request.form.get('status')
+    ids = request.form.getlist('resposta_id', type=int)[:MAXIMO_CORRECOES_POR_LOTE]
+    if novo_status not in PONTOS_POR_STATUS or not ids:
+        flash('Selecione as respostas e a avaliação.', 'danger')
+        return _voltar_para_correcoes()
+
+    # O feedback escrito na própria resposta tem prioridade sobre o comum a todas as selecionadas
+    feedback_comum = request.form.get('feedback_lote', '')
+    corrigidas = corrigir_respostas({i: (novo_status, request.form.get(f'feedback_{i}') or feedback_comum) for i in ids})
+    db.session.commit()
+    flash(f'{len(corrigidas)} resposta(s) avaliada(s) com sucesso!', 'success')
+    return _voltar_para_correcoes()
+
+def _voltar_para_correcoes():
+    """Volta à página de correções com os filtros que estavam aplicados (campos ocultos do formulário)."""
+    return redirect(url_for('pagina_correcoes', usuario_id=request.form.get('filtro_usuario_id') or None,
+                            status=request.form.get('filtro_status') or None))
+
+@app.route('/api/admin/correcoes', methods=['POST'])
+def api_corrigir_respostas():
+    # {"correcoes": [{"resposta_id": 1, "status": "correto", "feedback": "..."}, ...]}, tudo numa transação
+    if not session.get('admin_logged_in'): return jsonify({'erro': 'não autorizado'}), 401
+    dados = request.get_json(silent=True) or {}
+    try:
+        correcoes = {int(c['resposta_id']): (c['status'], str(c.get('feedback') or '')) for c in dados['correcoes']}
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({'erro': 'Informe correcoes: uma lista de {resposta_id, status, feedback}.'}), 400
+    if not 0 < len(correcoes) <= MAXIMO_CORRECOES_POR_LOTE or any(status not in PONTOS_POR_STATUS for status, _ in correcoes.values()):
+        return jsonify({'erro': f"De 1 a {MAXIMO_CORRECOES_POR_LOTE} correções, com status {', '.join(PONTOS_POR_STATUS)}."}), 400
+    corrigidas = corrigir_respostas(correcoes)
+    db.session.commit()
+    return jsonify({'corrigidas': corrigidas, 'ignoradas': sorted(set(correcoes) - set(corrigidas))})
 
 @app.route('/admin/analytics')
 def pagina_analytics():
     if not session.get('admin_logged_in'): return redirect(url_for('pagina_admin'))
-    usuarios_disponiveis = Usuario.query.order_by(Usuario.nome).all()
-    usuario_selecionado_id = request.args.get('usuario_id', type=int)
-    base_query = Resposta.query.join(Pergunta).filter(Pergunta.tipo != 'discursiva')
-    if usuario_selecionado_id:
-        base_query = base_query.filter(Resposta.usuario_id == usuario_selecionado_id)
-    todas_as_respostas_objetivas = base_query.all()
-    stats_perguntas_raw = defaultdict(lambda: {'total': 0, 'erros': 0})
-    for resposta in todas_as_respostas_objetivas:
-        stats_perguntas_raw[resposta.pergunta_id]['total'] += 1
-        if resposta.pontos == 0:
-            stats_perguntas_raw[resposta.pergunta_id]['erros'] += 1
-    stats_perguntas = []
-    for pergunta_id, data in stats_perguntas_raw.items():
-        pergunta = Pergunta.query.get(pergunta_id)
-        if pergunta:
-            percentual = (data['erros'] / data['total']) * 100 if data['total'] > 0 else 0
-            stats_perguntas.append({'texto': pergunta.texto, 'total': data['total'], 'erros': data['erros'], 'percentual': percentual})
-    stats_perguntas.sort(key=lambda x: x['percentual'], reverse=True)
-    respostas_erradas_query = Resposta.query.join(Pergunta).filter(Resposta.pontos == 0, Pergunta.tipo != 'discursiva')
-    if usuario_selecionado_id:
-        respostas_erradas_query = respostas_erradas_query.filter(Resposta.usuario_id == usuario_selecionado_id)
-    respostas_erradas = respostas_erradas_query.join(Usuario).join(Departamento).order_by(Departamento.nome, Usuario.nome).all()
-    erros_por_setor = defaultdict(lambda: defaultdict(list))
-    for r in respostas_erradas:
-        setor_nome, usuario_nome = r.usuario.departamento.nome, r.usuario.nome
-        erros_por_setor[setor_nome][usuario_nome].append({
-            'pergunta_texto': r.pergunta.texto, 'data_liberacao': r.pergunta.data_liberacao.strftime('%d/%m/%Y'),
-            'resposta_dada': r.resposta_dada, 'texto_resposta_dada': get_texto_da_opcao(r.pergunta, r.resposta_dada),
-            'resposta_correta': r.pergunta.resposta_correta, 'texto_resposta_correta': get_texto_da_opcao(r.pergunta, r.pergunta.resposta_correta)
-        })
+    return pagina_em_cache(lambda: _renderizar_analytics(request.args.get('usuario_id', type=int)),
+                           tags=('usuario', 'departamento', 'pergunta', 'resposta'))
+
+def _renderizar_analytics(usuario_selecionado_id):
+    usuarios_disponiveis = Usuario.query.options(db.joinedload(Usuario.departamento)).order_by(Usuario.nome).all()
+    departamentos = _lista_departamentos()
+    stats_perguntas = _estatisticas_erros_por_pergunta(usuario_selecionado_id)
+    erros_por_setor, erros_truncados = _erros_por_setor(usuario_selecionado_id)
     return render_template('analytics.html', 
                            stats_perguntas=stats_perguntas, erros_por_setor=erros_por_setor,
+                           erros_truncados=erros_truncados, limite_erros=LIMITE_ERROS_ANALYTICS,
+                           departamentos=departamentos,
                            usuarios_disponiveis=usuarios_disponiveis, usuario_selecionado_id=usuario_selecionado_id)
 
+@app.route('/admin/analytics/periodo')
+def pagina_analises_periodo():
+    if not session.get('admin_logged_in'): return redirect(url_for('pagina_admin'))
+    hoje = date.today()
+    fim = request.args.get('fim', type=date.fromisoformat) or hoje
+    inicio = request.args.get('inicio', type=date.fromisoformat) or fim - timedelta(days=365)
+    if inicio > fim:
+        inicio, fim = fim, inicio
+    depto_selecionado_id = request.args.get('departamento_id', type=int)
+    granularidade = request.args.get('granularidade')
+    if granularidade not in ('semana', 'mes'):
+        granularidade = 'mes' if (fim - inicio).days > 92 else 'semana'
+    analises = analises_periodo(inicio, fim, depto_selecionado_id, granularidade)
+    return render_template('analises_periodo.html', analises=analises, inicio=inicio, fim=fim,
+                           granularidade=granularidade, departamentos=_lista_departamentos(),
+                           depto_selecionado_id=depto_selecionado_id)
+
 @app.route('/admin/upload_planilha', methods=['POST'])
 def upload_planilha():
     if not session.get('admin_logged_in'): return redirect(url_for('pagina_admin'))
@@ -1013,26 +2557,13 @@ def upload_planilha():
         flash('Arquivo inválido ou não selecionado. Envie uma planilha .xls ou .xlsx.', 'danger')
         return redirect(url_for('pagina_admin'))
     try:
-        df = pd.read_excel(arquivo)
-        df = df.fillna('')
-        if 'data_liberacao' in df.columns:
-            df['data_liberacao'] = pd.to_datetime(df['data_liberacao'], errors='coerce').dt.strftime('%d/%m/%Y').fillna('')
-        for col in df.columns:
-            if col != 'data_liberacao':
-                df[col] = df[col].astype(str).str.replace(r'\.0$', '', regex=True)
-        headers = df.columns.tolist()
-        dados_da_planilha = df.to_dict(orient='records')
-        session['csv_headers'] = headers
-        validated_data = []
-        has_valid_rows = False
-        for row in dados_da_planilha:
-            is_valid, errors = validar_linha(row)
-            if is_valid: has_valid_rows = True
-            validated_data.append({'data': row, 'is_valid': is_valid, 'errors': errors})
-        session['csv_data'] = validated_data
-        session['has_valid_rows'] = has_valid_rows
+        df = _normalizar_planilha(pd.read_excel(arquivo))
+        limpar_importacoes_expiradas()
+        importacao = criar_previa_importacao(df)
+        session['importacao_token'] = importacao.token # A planilha fica no servidor; a sessão guarda só o token
         return redirect(url_for('preview_csv'))
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"Erro ao ler a planilha Excel: {e}")
         flash(f"Ocorreu um erro inesperado ao processar a planilha: {e}", "danger")
         return redirect(url_for('pagina_admin'))
@@ -1040,10 +2571,24 @@ def upload_planilha():
 @app.route('/admin/preview_csv')
 def preview_csv():
     if not session.get('admin_logged_in'): return redirect(url_for('pagina_admin'))
-    validated_data = session.get('csv_data', [])
-    has_valid_rows = session.get('has_valid_rows', False)
-    headers = session.get('csv_headers', [])
-    return render_template('preview_csv.html', data=validated_data, has_valid_rows=has_valid_rows, headers=headers)
+    importacao = importacao_da_sessao()
+    if not importacao:
+        flash('A pré-visualização expirou ou não foi encontrada. Envie a planilha novamente.', 'warning')
+        return redirect(url_for('pagina_admin'))
+
+    so_erros = request.args.get('so_erros') == '1'
+    query = importacao.linhas
+    if so_erros:
+        query = query.filter_by(valida=False)
+    paginacao = query.order_by(LinhaImportacaoPlanilha.posicao).paginate(
+        page=request.args.get('pagina', 1, type=int), per_page=LINHAS_POR_PAGINA_PREVIA, error_out=False)
+    data = [{'posicao': linha.posicao, 'data': json.loads(linha.dados), 'is_valid': linha.valida, 'errors': json.loads(linha.erros)}
+            for linha in paginacao.items]
+    total_validas = importacao.linhas.filter_by(valida=True).count()
+    return render_template('preview_csv.html', data=data, paginacao=paginacao, so_erros=so_erros,
+                           has_valid_rows=total_validas > 0, total_validas=total_validas,
+                           total_invalidas=importacao.linhas.filter_by(valida=False).count(),
+                           headers=json.loads(importacao.cabecalhos))
 
 # Em app.py
 
@@ -1051,8 +2596,12 @@ def preview_csv():
 def processar_edicao_csv():
     if not session.get('admin_logged_in'): 
         return redirect(url_for('pagina_admin'))
+    importacao = importacao_da_sessao()
+    if not importacao:
+        flash('A pré-visualização expirou ou não foi encontrada. Envie a planilha novamente.', 'warning')
+        return redirect(url_for('pagina_admin'))
 
-    # 1. Reconstrói os dados da planilha a partir do formulário editado
+    # 1. Reconstrói as linhas da página a partir do formulário editado e grava as correções
     rows_data = defaultdict(dict)
     for key, value in request.form.items():
         if key.startswith('row-'):
@@ -1060,57 +2609,76 @@ def processar_edicao_csv():
             row_index = int(parts[1])
             col_name = parts[2]
             rows_data[row_index][col_name] = value
+    atualizar_linhas_previa(importacao, rows_data)
 
-    success_count = 0
-    error_count = 0
-    perguntas_para_notificar = []
-    
-    # 2. Loop através das linhas corrigidas para salvar no banco
-    for row_index in sorted(rows_data.keys()):
-        row = rows_data[row_index]
-        is_valid, errors = validar_linha(row) # Revalida a linha
-        
-        if is_valid:
-            try:
-                data_obj = datetime.strptime(row['data_liberacao'], '%d/%m/%Y').date()
-                nova_pergunta = Pergunta(
-                    tipo=row['tipo'], texto=row['texto'],
-                    opcao_a=row.get('opcao_a') or None, opcao_b=row.get('opcao_b') or None,
-                    opcao_c=row.get('opcao_c') or None, opcao_d=row.get('opcao_d') or None,
-                    resposta_correta=row.get('resposta_correta') or None, 
-                    data_liberacao=data_obj,
-                    tempo_limite=int(float(row['tempo_limite'])) if row.get('tempo_limite') else None
-                )
-                db.session.add(nova_pergunta)
-                
-                # if row.get('enviar_notificacao', '').lower() == 'sim':
-                #     perguntas_para_notificar.append(nova_pergunta)
-                
-                success_count += 1
-            except Exception as e:
-                db.session.rollback()
-                error_count += 1
-                app.logger.error(f"Erro ao salvar linha {row_index} (após correção): {e} | Dados: {row}")
-        else:
-            error_count += 1
-            app.logger.error(f"Linha {row_index} ainda inválida após edição: {errors}")
+    # Navegação entre as páginas da pré-visualização: as correções já foram salvas acima
+    if request.form.get('acao') != 'importar':
+        return redirect(url_for('preview_csv', pagina=request.form.get('ir_para_pagina', 1, type=int),
+                                so_erros='1' if request.form.get('so_erros') == '1' else None))
 
+    # 2. Salva as linhas no banco (na fila, se houver worker)
+    session.pop('importacao_token', None)
+    importacao.expira_em = datetime.utcnow() + VALIDADE_PREVIA_IMPORTACAO # Não expira enquanto espera na fila
     db.session.commit()
-    
-    # for pergunta in perguntas_para_notificar:
-    #     disparar_notificacao_nova_pergunta(pergunta)
-        
-    session.pop('csv_data', None)
-    session.pop('has_valid_rows', None)
-    session.pop('csv_headers', None)
-    
-    if error_count > 0:
-        flash(f'Importação parcial: {success_count} perguntas salvas. {error_count} linhas continham erros e foram ignoradas.', 'warning')
-    else:
-        flash(f'Importação concluída! {success_count} perguntas foram importadas com sucesso!', 'success')
-        
+    nova_tarefa = enfileirar_tarefa('importar_perguntas', max_tentativas=1, importacao_id=importacao.id)
+
+    if nova_tarefa.status != 'concluida':
+        return redirect(url_for('pagina_tarefa', tarefa_id=nova_tarefa.id))
+    flash(nova_tarefa.mensagem, 'warning' if nova_tarefa.mensagem.startswith('Importação parcial') else 'success')
     return redirect(url_for('pagina_admin'))
 
+# --- ROTAS DE INSTRUMENTAÇÃO ---
+@app.route('/metrics')
+def metricas():
+    if not app.config['INSTRUMENTACAO']:
+        return 'Instrumentação desligada (INSTRUMENTACAO=1).', 404
+    token = app.config['METRICS_TOKEN']
+    autorizado = session.get('admin_logged_in') or (token and secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'))
+    if not autorizado:
+        return 'Não autorizado.', 403
+    return Response(instrumentacao.formato_prometheus() + cache.formato_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/desempenho', methods=['GET', 'POST'])
+def pagina_desempenho():
+    if not session.get('admin_logged_in'): return redirect(url_for('pagina_admin'))
+    if request.method == 'POST':
+        instrumentacao.resetar()
+        flash('Métricas zeradas.', 'success')
+        return redirect(url_for('pagina_desempenho'))
+    resumo = instrumentacao.resumo() if app.config['INSTRUMENTACAO'] else None
+    return render_template('desempenho.html', resumo=resumo, cache=cache.estatisticas(), backend_cache=app.config['CACHE'],
+                           iniciado_em=datetime.fromtimestamp(resumo['iniciado_em']) if resumo else None)
+
+# --- ROTAS DA FILA DE TAREFAS ---
+@app.route('/admin/tarefas/<int:tarefa_id>')
+def pagina_tarefa(tarefa_id):
+    if not session.get('admin_logged_in'): return redirect(url_for('pagina_admin'))
+    tarefa_atual = Tarefa.query.get_or_404(tarefa_id)
+    return render_template('tarefa.html', tarefa=tarefa_atual)
+
+@app.route('/admin/tarefas/<int:tarefa_id>/status')
+def status_tarefa(tarefa_id):
+    if not session.get('admin_logged_in'): return jsonify({'erro': 'não autorizado'}), 403
+    tarefa_atual = Tarefa.query.get_or_404(tarefa_id)
+    return jsonify({
+        'id': tarefa_atual.id,
+        'tipo': tarefa_atual.tipo,
+        'status': tarefa_atual.status,
+        'progresso': tarefa_atual.progresso,
+        'mensagem': tarefa_atual.mensagem,
+        'tentativas': tarefa_atual.tentativas,
+        'download_url': url_for('baixar_resultado_tarefa', tarefa_id=tarefa_atual.id) if tarefa_atual.arquivo_resultado else None
+    })
+
+@app.route('/admin/tarefas/<int:tarefa_id>/download')
+def baixar_resultado_tarefa(tarefa_id):
+    if not session.get('admin_logged_in'): return redirect(url_for('pagina_admin'))
+    tarefa_atual = Tarefa.query.get_or_404(tarefa_id)
+    if tarefa_atual.status != 'concluida' or not tarefa_atual.arquivo_resultado or not os.path.exists(tarefa_atual.arquivo_resultado):
+        flash('O arquivo desta tarefa não está disponível.', 'danger')
+        return redirect(url_for('pagina_tarefa', tarefa_id=tarefa_id))
+    return send_file(tarefa_atual.arquivo_resultado, as_attachment=True, download_name=tarefa_atual.nome_arquivo)
+
 # Em app.py, no final do arquivo
 
 # --- ROTA DE SERVIÇO PARA INICIALIZAR/RESETAR O BANCO DE DADOS LOCAL ---
@@ -1120,10 +2688,14 @@ def init_db(secret_key):
     if secret_key != 'resetar-banco-123':
         return "Chave secreta inválida.", 403
     try:
-        app.logger.info("Iniciando a reinicialização do banco de dados...")
-        db.drop_all()
-        db.create_all()
-        app.logger.info("Tabelas criadas. Inserindo dados iniciais...")
+        # Import local: migracoes.py importa os modelos deste arquivo
+        from migracoes import aplicar_migracoes, resetar_banco
+        if request.args.get('resetar') == '1':
+            app.logger.info("Iniciando a reinicialização do banco de dados...")
+            resetar_banco()
+        else:
+            aplicar_migracoes()
+        app.logger.info("Esquema atualizado. Inserindo dados iniciais...")
         
         # Dados iniciais para usuários e setores
         dados_iniciais = {
@@ -1138,9 +2710,13 @@ def init_db(secret_key):
         }
         
         for nome_depto, lista_usuarios in dados_iniciais.items():
-            novo_depto = Departamento(nome=nome_depto)
-            db.session.add(novo_depto)
+            novo_depto = Departamento.query.filter_by(nome=nome_depto).first()
+            if not novo_depto:
+                novo_depto = Departamento(nome=nome_depto)
+                db.session.add(novo_depto)
             for user_data in lista_usuarios:
+                if Usuario.query.filter_by(codigo_acesso=user_data['codigo_acesso']).first():
+                    continue
                 novo_usuario = Usuario(
                     nome=user_data['nome'], 
                     codigo_acesso=user_data['codigo_acesso'],
@@ -1149,6 +2725,8 @@ def init_db(secret_key):
                 )
                 db.session.add(novo_usuario)
         
+        db.session.flush()
+        reconstruir_placares() # Usuários e setores novos entram no ranking com placar zerado
         db.session.commit()
         app.logger.info("Banco de dados inicializado com sucesso!")
         return "<h1>Banco de dados inicializado com sucesso!</h1>"
@@ -0,0 +1,85 @@
+# Armazenamento dos arquivos enviados (imagens das perguntas e anexos das respostas).
+#
+# O app conversa só com a interface abaixo (enviar/excluir); o destino é escolhido
+# pela variável de ambiente ARMAZENAMENTO:
+#
+#     ARMAZENAMENTO=cloudinary  -> Cloudinary (padrão quando CLOUDINARY_CLOUD_NAME está definido)
+#     ARMAZENAMENTO=local       -> pasta local servida em /static/uploads (desenvolvimento e testes)
+
+import os
+import shutil
+import uuid
+from collections import defaultdict
+
+import cloudinary
+import cloudinary.api
+import cloudinary.uploader
+from werkzeug.utils import secure_filename
+
+class ArmazenamentoCloudinary:
+    LIMITE_EXCLUSAO = 100 # máximo de public_ids por chamada da Admin API
+
+    def enviar(self, caminho, pasta, nome_original=None):
+        """Envia o arquivo local 'caminho' e devolve a URL pública."""
+        resultado = cloudinary.uploader.upload(caminho, folder=pasta, resource_type="auto")
+        return resultado.get('secure_url')
+
+    @staticmethod
+    def _identificar(url):
+        """Extrai (resource_type, public_id) de uma URL de entrega do Cloudinary.
+
+        Formato: https://res.cloudinary.com/<nuvem>/<resource_type>/upload/v<versão>/<pasta>/<nome>.<ext>
+        """
+        partes = url.split('/')
+        try:
+            indice = partes.index('upload')
+        except ValueError:
+            return None, None
+        resource_type = partes[indice - 1]
+        caminho = partes[indice + 1:]
+        if caminho and caminho[0].startswith('v') and caminho[0][1:].isdigit():
+            caminho = caminho[1:]
+        public_id = '/'.join(caminho)
+        if resource_type != 'raw':
+            # Em imagens e vídeos a extensão não faz parte do public_id; em 'raw' faz
+            public_id = public_id.rsplit('.', 1)[0]
+        return resource_type, public_id
+
+    def excluir(self, urls):
+        """Apaga vários arquivos com uma chamada por tipo de recurso (até 100 por chamada)."""
+        por_tipo = defaultdict(list)
+        for url in urls:
+            resource_type, public_id = self._identificar(url)
+            if public_id:
+                por_tipo[resource_type].append(public_id)
+        for resource_type, public_ids in por_tipo.items():
+            for ini in range(0, len(public_ids), self.LIMITE_EXCLUSAO):
+                cloudinary.api.delete_resources(public_ids[ini:ini + self.LIMITE_EXCLUSAO], resource_type=resource_type)
+
+class ArmazenamentoLocal:
+    def __init__(self, pasta_base, url_base='/static/uploads'):
+        self.pasta_base = pasta_base
+        self.url_base = url_base.rstrip('/')
+
+    def enviar(self, caminho, pasta, nome_original=None):
+        nome = f"{uuid.uuid4().hex}_{secure_filename(nome_original or os.path.basename(caminho))}"
+        os.makedirs(os.path.join(self.pasta_base, pasta), exist_ok=True)
+        shutil.copyfile(caminho, os.path.join(self.pasta_base, pasta, nome))
+        return f"{self.url_base}/{pasta}/{nome}"
+
+    def excluir(self, urls):
+        for url in urls:
+            if not url.startswith(self.url_base + '/'):
+                continue
+            relativo = url[len(self.url_base) + 1:]
+            caminho = os.path.realpath(os.path.join(self.pasta_base, relativo))
+            # Nunca apaga nada fora da pasta de uploads
+            if caminho.startswith(os.path.realpath(self.pasta_base) + os.sep) and os.path.exists(caminho):
+                os.remove(caminho)
+
+def criar_armazenamento(nome, pasta_local):
+    if nome == 'local':
+        return ArmazenamentoLocal(pasta_local)
+    if nome == 'cloudinary':
+        return ArmazenamentoCloudinary()
+    raise ValueError(f"Armazenamento desconhecido: {nome}")
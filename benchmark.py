@@ -0,0 +1,366 @@
+# Mede latência (p50/p99) e vazão das rotas principais, sobre os dados de gerar_dados.py.
+#
+#     python benchmark.py                                   -> cliente de teste do Flask, no próprio processo
+#     python benchmark.py --url http://127.0.0.1:8000       -> contra um gunicorn local com o mesmo banco
+#     python benchmark.py --cenarios dashboard,ranking --requisicoes 500 --concorrencia 8
+#
+# Cada execução acrescenta uma linha em resultados_benchmark.jsonl (com o commit atual),
+# para comparar as versões do app ao longo do tempo.
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import threading
+import time
+import timeit
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from app import app, db, Usuario, SENHA_ADMIN, emitir_token_pergunta, segundos_desde_emissao
+
+ARQUIVO_RESULTADOS = 'resultados_benchmark.jsonl'
+PADRAO_PERGUNTA_ID = re.compile(rb'name="pergunta_id" value="(\d+)"')
+PADRAO_TOKEN = re.compile(rb'name="token" value="([^"]+)"')
+PADRAO_ATIVIDADE = re.compile(rb'href="/atividade/(\d+)"')
+PADRAO_CORRECAO_PENDENTE = re.compile(rb'name="resposta_id" value="(\d+)"')
+# Cliente em rede lenta (foto tirada no celular): o anexo leva ~2 s para chegar. Maior que os
+# buffers do socket, então o servidor fica esperando o corpo chegar antes de a rota começar
+TAMANHO_ANEXO = 1024 * 1024
+BYTES_POR_SEGUNDO_CLIENTE_LENTO = 512 * 1024
+
+def _multipart(campos, arquivo):
+    """Corpo multipart/form-data com os 'campos' e um arquivo (nome do campo, nome do arquivo, bytes)."""
+    fronteira = f'benchmark{random.getrandbits(64):016x}'
+    partes = [f'--{fronteira}\r\nContent-Disposition: form-data; name="{nome}"\r\n\r\n{valor}\r\n'.encode()
+              for nome, valor in campos.items()]
+    campo, nome_arquivo, conteudo = arquivo
+    partes.append(f'--{fronteira}\r\nContent-Disposition: form-data; name="{campo}"; filename="{nome_arquivo}"\r\n'
+                  f'Content-Type: application/octet-stream\r\n\r\n'.encode() + conteudo + b'\r\n')
+    partes.append(f'--{fronteira}--\r\n'.encode())
+    return f'multipart/form-data; boundary={fronteira}', b''.join(partes)
+
+# --- CLIENTES ---
+class ClienteTeste:
+    """Cliente de teste do Flask: mede o app sem rede nem servidor."""
+    def __init__(self):
+        self._cliente = app.test_client()
+
+    def get(self, caminho, cabecalhos=None):
+        resposta = self._cliente.get(caminho, headers=cabecalhos)
+        return resposta.status_code, resposta.get_data()
+
+    def etag(self, caminho):
+        return self._cliente.get(caminho).headers.get('ETag')
+
+    def post(self, caminho, dados):
+        resposta = self._cliente.post(caminho, data=dados)
+        return resposta.status_code, resposta.get_data()
+
+    def post_json(self, caminho, dados):
+        resposta = self._cliente.post(caminho, json=dados)
+        return resposta.status_code, resposta.get_data()
+
+    def post_multipart(self, caminho, campos, arquivo, bytes_por_segundo=None):
+        # Sem rede, o corpo chega de uma vez: 'bytes_por_segundo' só vale para o ClienteHttp
+        tipo, corpo = _multipart(campos, arquivo)
+        resposta = self._cliente.post(caminho, data=corpo, content_type=tipo)
+        return resposta.status_code, resposta.get_data()
+
+class _SemRedirecionar(urllib.request.HTTPRedirectHandler):
+    # Mede só a requisição pedida, como o cliente de teste
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class ClienteHttp:
+    """Cliente HTTP com cookies, para medir um servidor de verdade (gunicorn)."""
+    def __init__(self, url_base):
+        self.url_base = url_base.rstrip('/')
+        self._abridor = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _SemRedirecionar())
+
+    def _abrir(self, requisicao):
+        try:
+            with self._abridor.open(requisicao, timeout=120) as resposta:
+                return resposta.status, resposta.read()
+        except urllib.error.HTTPError as erro:
+            return erro.code, erro.read()
+
+    def get(self, caminho, cabecalhos=None):
+        return self._abrir(urllib.request.Request(self.url_base + caminho, headers=cabecalhos or {}))
+
+    def etag(self, caminho):
+        try:
+            with self._abridor.open(urllib.request.Request(self.url_base + caminho), timeout=120) as resposta:
+                return resposta.headers.get('ETag')
+        except urllib.error.HTTPError:
+            return None
+
+    def post(self, caminho, dados):
+        return self._abrir(urllib.request.Request(self.url_base + caminho, data=urllib.parse.urlencode(dados, doseq=True).encode()))
+
+    def post_json(self, caminho, dados):
+        return self._abrir(urllib.request.Request(self.url_base + caminho, data=json.dumps(dados).encode(),
+                                                  headers={'Content-Type': 'application/json'}))
+
+    def post_multipart(self, caminho, campos, arquivo, bytes_por_segundo=None):
+        tipo, corpo = _multipart(campos, arquivo)
+        dados = self._aos_poucos(corpo, bytes_por_segundo) if bytes_por_segundo else corpo
+        return self._abrir(urllib.request.Request(self.url_base + caminho, data=dados,
+                                                  headers={'Content-Type': tipo, 'Content-Length': str(len(corpo))}))
+
+    @staticmethod
+    def _aos_poucos(corpo, bytes_por_segundo, bloco=8192):
+        for ini in range(0, len(corpo), bloco):
+            time.sleep(bloco / bytes_por_segundo)
+            yield corpo[ini:ini + bloco]
+
+# --- CENÁRIOS ---
+# Cada cenário recebe um cliente já logado e devolve (status, segundos) da requisição medida;
+# a preparação (como abrir o quiz antes de responder) fica fora da medição. Um GET que
+# redireciona (sessão perdida, página vazia) conta como erro.
+def _get(caminho):
+    def cenario(cliente):
+        inicio = time.perf_counter()
+        status, _ = cliente.get(caminho)
+        return status, time.perf_counter() - inicio
+    return cenario
+
+def _revalidar(caminho):
+    # Visita repetida de quem já tem a página: If-None-Match com o ETag recebido antes
+    def cenario(cliente):
+        etag = cliente.etag(caminho)
+        inicio = time.perf_counter()
+        status, _ = cliente.get(caminho, {'If-None-Match': etag} if etag else None)
+        return (200 if status == 304 else status), time.perf_counter() - inicio
+    return cenario
+
+def _responder(cliente):
+    status, corpo = cliente.get('/quiz')
+    encontrado = PADRAO_PERGUNTA_ID.search(corpo) if status == 200 else None
+    if not encontrado:
+        return None, 0 # usuário sem perguntas pendentes
+    token = PADRAO_TOKEN.search(corpo)
+    dados = {'pergunta_id': encontrado.group(1).decode(), 'resposta': random.choice('abcdvf'),
+             'token': token.group(1).decode() if token else ''}
+    inicio = time.perf_counter()
+    status, _ = cliente.post('/responder', dados)
+    duracao = time.perf_counter() - inicio
+    return (200 if status == 302 else status), duracao # o POST termina redirecionando para o quiz
+
+def _responder_api(cliente):
+    status, corpo = cliente.get('/api/quiz/perguntas?quantidade=1')
+    perguntas = json.loads(corpo)['perguntas'] if status == 200 else []
+    if not perguntas:
+        return None, 0
+    dados = {'pergunta_id': perguntas[0]['id'], 'resposta': random.choice('abcdvf'), 'token': perguntas[0]['token']}
+    inicio = time.perf_counter()
+    status, _ = cliente.post_json('/api/quiz/respostas', dados)
+    duracao = time.perf_counter() - inicio
+    return (200 if status == 201 else status), duracao
+
+def _anexo_lento(cliente):
+    status, corpo = cliente.get('/atividades')
+    encontrado = PADRAO_ATIVIDADE.search(corpo) if status == 200 else None
+    if not encontrado:
+        return None, 0 # usuário sem atividades pendentes
+    inicio = time.perf_counter()
+    status, _ = cliente.post_multipart(f'/atividade/{encontrado.group(1).decode()}', {'texto_discursivo': 'Resposta do benchmark.'},
+                                       ('anexo_resposta', 'anexo.pdf', os.urandom(TAMANHO_ANEXO)), BYTES_POR_SEGUNDO_CLIENTE_LENTO)
+    duracao = time.perf_counter() - inicio
+    return (200 if status == 302 else status), duracao
+
+# nome -> (função, precisa de admin, altera o banco)
+CENARIOS = {
+    'dashboard': (_get('/dashboard'), False, False),
+    'quiz': (_get('/quiz'), False, False),
+    'responder': (_responder, False, True),
+    'api_perguntas': (_get('/api/quiz/perguntas?quantidade=5'), False, False),
+    'api_responder': (_responder_api, False, True),
+    'anexo_lento': (_anexo_lento, False, True),
+    'ranking': (_get('/ranking'), False, False),
+    'ranking_304': (_revalidar('/ranking'), False, False),
+    'analytics': (_get('/admin/analytics'), True, False),
+    'relatorios': (_get('/admin/relatorios'), True, False),
+    'relatorios_304': (_revalidar('/admin/relatorios'), True, False),
+    'exportar_csv': (_get('/admin/relatorios/exportar_detalhado?tipo=todos&formato=csv'), True, False),
+    'exportar_xlsx': (_get('/admin/relatorios/exportar_detalhado?tipo=todos&formato=xlsx'), True, False),
+}
+
+# --- EXECUÇÃO ---
+def _codigos_de_acesso(quantidade, semente):
+    with app.app_context():
+        codigos = [c for c, in db.session.query(Usuario.codigo_acesso).order_by(Usuario.id)]
+    if not codigos:
+        raise SystemExit('Nenhum usuário no banco; rode gerar_dados.py antes.')
+    return random.Random(semente).sample(codigos, min(quantidade, len(codigos)))
+
+def _novo_cliente(args, codigo=None):
+    cliente = ClienteHttp(args.url) if args.url else ClienteTeste()
+    if codigo is None:
+        cliente.post('/admin', {'senha': SENHA_ADMIN})
+    else:
+        cliente.post('/login', {'codigo': codigo})
+    return cliente
+
+def medir_cenario(nome, args, codigos):
+    """Roda 'args.requisicoes' requisições do cenário com 'args.concorrencia' threads."""
+    funcao, de_admin, _ = CENARIOS[nome]
+    local = threading.local()
+    proximo_codigo = iter(codigos * (args.requisicoes // len(codigos) + 1))
+    trava = threading.Lock()
+
+    def _uma_requisicao(_):
+        # Admin: um cliente por thread; usuários: um usuário diferente a cada requisição
+        if de_admin:
+            if not hasattr(local, 'cliente'):
+                local.cliente = _novo_cliente(args)
+            cliente = local.cliente
+        else:
+            with trava:
+                codigo = next(proximo_codigo)
+            cliente = _novo_cliente(args, codigo)
+        return funcao(cliente)
+
+    for _ in range(args.aquecimento):
+        _uma_requisicao(None)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        resultados = list(executor.map(_uma_requisicao, range(args.requisicoes)))
+    duracao = time.perf_counter() - inicio
+
+    tempos = sorted(t for status, t in resultados if status == 200)
+    erros = sum(1 for status, _ in resultados if status is not None and status != 200)
+    ignoradas = sum(1 for status, _ in resultados if status is None)
+    if not tempos:
+        return {'cenario': nome, 'requisicoes': 0, 'erros': erros, 'ignoradas': ignoradas}
+    return {
+        'cenario': nome,
+        'requisicoes': len(tempos),
+        'erros': erros,
+        'ignoradas': ignoradas,
+        'p50_ms': round(_percentil(tempos, 0.50) * 1000, 2),
+        'p99_ms': round(_percentil(tempos, 0.99) * 1000, 2),
+        'media_ms': round(statistics.fmean(tempos) * 1000, 2),
+        # Vazão medida no relógio de parede, com a concorrência pedida (inclui o login de cada usuário)
+        'req_por_segundo': round(len(tempos) / duracao, 1),
+    }
+
+def medir_correcoes(args, quantidade):
+    """Respostas discursivas avaliadas por segundo em /admin/correcoes, uma a uma e em lote (uma página por vez).
+
+    Como no navegador, cada POST é seguido de um carregamento da página. Avalia até
+    'quantidade' respostas pendentes em cada modo, então altera o banco.
+    """
+    cliente = _novo_cliente(args)
+    resultados = {}
+    for modo in ('uma_a_uma', 'em_lote'):
+        corrigidas = erros = 0
+        inicio = time.perf_counter()
+        while corrigidas < quantidade:
+            status, corpo = cliente.get('/admin/correcoes')
+            ids = [i.decode() for i in PADRAO_CORRECAO_PENDENTE.findall(corpo)] if status == 200 else []
+            if not ids:
+                break
+            avaliacao = random.choice(('correto', 'parcialmente_correto', 'incorreto'))
+            if modo == 'uma_a_uma':
+                ids = ids[:1]
+                status, _ = cliente.post(f'/admin/corrigir/{ids[0]}', {'status': avaliacao, 'filtro_status': 'pendente'})
+            else:
+                ids = ids[:quantidade - corrigidas]
+                status, _ = cliente.post('/admin/correcoes/lote', {'resposta_id': ids, 'status': avaliacao, 'filtro_status': 'pendente'})
+            if status != 302:
+                erros += 1
+                break
+            corrigidas += len(ids)
+        duracao = time.perf_counter() - inicio
+        resultados[modo] = {'corrigidas': corrigidas, 'erros': erros,
+                            'por_segundo': round(corrigidas / duracao, 1) if corrigidas else 0}
+    return resultados
+
+def medir_token_pergunta(repeticoes=20000):
+    """Custo, em microssegundos, de emitir e de conferir o token de uma pergunta (sem banco)."""
+    token = emitir_token_pergunta(1234, 5678)
+    emitir = timeit.timeit(lambda: emitir_token_pergunta(1234, 5678), number=repeticoes)
+    conferir = timeit.timeit(lambda: segundos_desde_emissao(token, 1234, 5678), number=repeticoes)
+    return {'emitir_us': round(emitir / repeticoes * 1e6, 2), 'conferir_us': round(conferir / repeticoes * 1e6, 2)}
+
+def _percentil(ordenados, p):
+    indice = min(len(ordenados) - 1, max(0, round(p * len(ordenados)) - 1))
+    return ordenados[indice]
+
+def _banco_em_uso():
+    with app.app_context():
+        return db.engine.url.render_as_string(hide_password=True)
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark das rotas do quiz.')
+    parser.add_argument('--url', help='URL de um servidor já rodando (ex.: gunicorn); sem ela usa o cliente de teste')
+    parser.add_argument('--cenarios', default=','.join(CENARIOS), help='lista separada por vírgulas')
+    parser.add_argument('--requisicoes', type=int, default=200, help='requisições medidas por cenário')
+    parser.add_argument('--concorrencia', type=int, default=4)
+    parser.add_argument('--aquecimento', type=int, default=5, help='requisições descartadas antes de medir')
+    parser.add_argument('--sem-escrita', action='store_true', help='pula os cenários que alteram o banco')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--correcoes', type=int, default=0,
+                        help='avalia N respostas discursivas pendentes uma a uma e N em lote (altera o banco; 0 pula)')
+    parser.add_argument('--saida', default=ARQUIVO_RESULTADOS)
+    args = parser.parse_args()
+
+    nomes = [n.strip() for n in args.cenarios.split(',') if n.strip()]
+    desconhecidos = [n for n in nomes if n not in CENARIOS]
+    if desconhecidos:
+        parser.error(f"cenários desconhecidos: {', '.join(desconhecidos)} (disponíveis: {', '.join(CENARIOS)})")
+    if args.sem_escrita:
+        nomes = [n for n in nomes if not CENARIOS[n][2]]
+
+    random.seed(args.semente)
+    codigos = _codigos_de_acesso(args.requisicoes + args.aquecimento, args.semente)
+
+    print(f"{'cenário':<15}{'req':>6}{'erros':>7}{'p50 ms':>10}{'p99 ms':>10}{'média ms':>10}{'req/s':>9}")
+    resultados = []
+    for nome in nomes:
+        r = medir_cenario(nome, args, codigos)
+        resultados.append(r)
+        if r['requisicoes']:
+            print(f"{nome:<15}{r['requisicoes']:>6}{r['erros']:>7}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['media_ms']:>10.1f}{r['req_por_segundo']:>9.1f}")
+        else:
+            print(f"{nome:<15}{0:>6}{r['erros']:>7}   (nenhuma requisição bem-sucedida)")
+
+    custo_token = medir_token_pergunta()
+    print(f"token da pergunta: {custo_token['emitir_us']:.1f} µs para emitir, {custo_token['conferir_us']:.1f} µs para conferir")
+
+    correcoes = None
+    if args.correcoes and not args.sem_escrita:
+        correcoes = medir_correcoes(args, args.correcoes)
+        print("correções: " + ', '.join(f"{modo.replace('_', ' ')} {r['por_segundo']:.1f}/s ({r['corrigidas']} respostas)"
+                                        for modo, r in correcoes.items()))
+
+    with open(args.saida, 'a', encoding='utf-8') as arquivo:
+        arquivo.write(json.dumps({
+            'quando': datetime.now().isoformat(timespec='seconds'),
+            'commit': _commit_atual(),
+            'alvo': args.url or 'cliente_de_teste',
+            'banco': _banco_em_uso() if not args.url else None,
+            'requisicoes': args.requisicoes,
+            'concorrencia': args.concorrencia,
+            'resultados': resultados,
+            'token_pergunta': custo_token,
+            'correcoes': correcoes,
+        }, ensure_ascii=False) + '\n')
+    print(f"Resultados acrescentados em {args.saida}.")
@@ -0,0 +1,141 @@
+# Mede a vazão do envio de notificações (enviar_notificacoes.py) contra um servidor SMTP local
+# (aiosmtpd, pip install aiosmtpd), que simula a latência de um provedor real e recusa uma parte
+# dos endereços:
+#
+#     python benchmark_notificacoes.py                                  -> 200 destinatários, 50 ms por mensagem
+#     python benchmark_notificacoes.py --destinatarios 500 --conexoes 1,4,8 --latencia 100
+#
+# Cenários: uma conexão sem limite de taxa (como o envio sequencial antigo), cada número de
+# --conexoes sem limite, o maior pool com o limite --limite e, por fim, a reexecução, que não
+# deve enviar nada de novo (idempotência): só os recusados, que estão no dead letter, voltam a ser tentados.
+#
+# Usa o banco de DATABASE_URL_PYTHONANYWHERE, como o app, e precisa de perguntas liberadas hoje:
+# rode gerar_dados.py antes, nunca em produção. Só os --destinatarios primeiros usuários com
+# e-mail recebem; os demais são marcados como já avisados. Os registros de aviso do dia são
+# apagados antes de cada cenário e no fim.
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import time
+import zlib
+from datetime import date, datetime
+
+from aiosmtpd.controller import Controller
+
+ARQUIVO_RESULTADOS = 'resultados_benchmark.jsonl'
+
+# --- SERVIDOR SMTP LOCAL ---
+class ServidorLento:
+    """Handler do aiosmtpd: demora 'latencia' segundos por mensagem e recusa 'recusados'% dos endereços."""
+
+    def __init__(self, latencia, recusados):
+        self.latencia = latencia
+        self.recusados = recusados
+        self.recebidas = 0
+
+    async def handle_RCPT(self, server, session, envelope, endereco, opcoes_rcpt):
+        # Sempre os mesmos endereços recusados, para comparar os cenários
+        if zlib.crc32(endereco.encode()) % 100 < self.recusados:
+            return '550 Caixa postal inexistente'
+        envelope.rcpt_tos.append(endereco)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.latencia)
+        self.recebidas += 1
+        return '250 Mensagem aceita'
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+# --- MEDIÇÃO ---
+def _chave_do_dia():
+    return f'novas-perguntas:{date.today().isoformat()}'
+
+def _limpar_avisos():
+    from app import db, NotificacaoEnviada, NotificacaoFalha
+    db.session.execute(db.delete(NotificacaoEnviada).where(NotificacaoEnviada.chave == _chave_do_dia()))
+    db.session.execute(db.delete(NotificacaoFalha).where(NotificacaoFalha.chave == _chave_do_dia()))
+    db.session.commit()
+
+def _preparar_destinatarios(quantidade):
+    """Limpa os avisos do dia e marca como avisados todos os usuários com e-mail, menos os 'quantidade' primeiros."""
+    from app import db, Usuario, NotificacaoEnviada
+    _limpar_avisos()
+    chave = _chave_do_dia()
+    ignorados = db.select(db.literal(chave), Usuario.id).where(Usuario.email.isnot(None)).order_by(Usuario.id).offset(quantidade)
+    db.session.execute(db.insert(NotificacaoEnviada).from_select(['chave', 'usuario_id'], ignorados))
+    db.session.commit()
+
+def medir_cenario(nome, conexoes, por_segundo, servidor, args, preparar=True):
+    # Import local: o app lê MAIL_SERVER e MAIL_PORT ao ser importado, depois que o servidor sobe
+    import enviar_notificacoes
+    from app import app
+    with app.app_context():
+        if preparar:
+            _preparar_destinatarios(args.destinatarios)
+    enviar_notificacoes.CONEXOES_SMTP = conexoes
+    enviar_notificacoes.EMAILS_POR_SEGUNDO = por_segundo
+    recebidas_antes = servidor.recebidas
+    inicio = time.perf_counter()
+    enviados, falhas = enviar_notificacoes.enviar_email_notificacao()
+    duracao = time.perf_counter() - inicio
+    return {
+        'cenario': nome, 'conexoes': conexoes, 'limite_por_segundo': por_segundo or None,
+        'enviados': enviados, 'falhas': falhas, 'recebidos_pelo_servidor': servidor.recebidas - recebidas_antes,
+        'segundos': round(duracao, 2), 'emails_por_segundo': round((enviados + falhas) / duracao, 1) if duracao else 0,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Vazão do envio de notificações contra um SMTP local (aiosmtpd).')
+    parser.add_argument('--destinatarios', type=int, default=200)
+    parser.add_argument('--conexoes', default='4', help='tamanhos do pool a medir, separados por vírgulas')
+    parser.add_argument('--latencia', type=float, default=50, help='ms que o servidor leva por mensagem')
+    parser.add_argument('--recusados', type=int, default=1, help='porcentagem dos endereços recusados pelo servidor')
+    parser.add_argument('--limite', type=float, default=10, help='e-mails/s do cenário com limite de taxa (0 pula)')
+    parser.add_argument('--saida', default=ARQUIVO_RESULTADOS)
+    args = parser.parse_args()
+
+    servidor = ServidorLento(args.latencia / 1000, args.recusados)
+    porta = _porta_livre()
+    controlador = Controller(servidor, hostname='127.0.0.1', port=porta)
+    controlador.start()
+    os.environ.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=str(porta), MAIL_USE_TLS='0')
+    os.environ.pop('MAIL_USERNAME', None)
+    os.environ.pop('MAIL_PASSWORD', None)
+
+    try:
+        cenarios = [('sequencial', 1, 0)]
+        cenarios += [(f'pool_{n}', n, 0) for n in (int(c) for c in args.conexoes.split(',') if c.strip()) if n > 1]
+        if args.limite:
+            cenarios.append(('com_limite', max(n for _, n, _ in cenarios), args.limite))
+        resultados = [medir_cenario(nome, conexoes, por_segundo, servidor, args) for nome, conexoes, por_segundo in cenarios]
+        # Reexecução logo depois do último cenário: quem já recebeu não recebe de novo
+        ultimo = cenarios[-1]
+        resultados.append(medir_cenario('reexecucao', ultimo[1], ultimo[2], servidor, args, preparar=False))
+    finally:
+        controlador.stop()
+        from app import app
+        with app.app_context():
+            _limpar_avisos()
+
+    print(f"{'cenário':<13}{'conexões':>9}{'limite/s':>10}{'enviados':>10}{'falhas':>8}{'recebidos':>11}{'s':>8}{'e-mails/s':>11}")
+    for r in resultados:
+        print(f"{r['cenario']:<13}{r['conexoes']:>9}{r['limite_por_segundo'] or '-':>10}{r['enviados']:>10}{r['falhas']:>8}"
+              f"{r['recebidos_pelo_servidor']:>11}{r['segundos']:>8.2f}{r['emails_por_segundo']:>11.1f}")
+
+    from benchmark import _commit_atual
+    with open(args.saida, 'a', encoding='utf-8') as arquivo:
+        arquivo.write(json.dumps({
+            'quando': datetime.now().isoformat(timespec='seconds'),
+            'commit': _commit_atual(),
+            'notificacoes': resultados,
+            'destinatarios': args.destinatarios,
+            'latencia_ms': args.latencia,
+        }, ensure_ascii=False) + '\n')
+    print(f"Resultados acrescentados em {args.saida}.")
@@ -0,0 +1,118 @@
+# Mede se a consulta de perguntas pendentes (/dashboard, /quiz e a API do quiz) continua com a
+# mesma latência para usuários que já responderam muito:
+#
+#     python benchmark_pendentes.py                                  -> usuários com 0, 1k, 5k, 10k e 20k respostas
+#     python benchmark_pendentes.py --respostas 0,10000,50000 --requisicoes 100
+#
+# Monta um banco SQLite temporário próprio (não usa o banco do app): perguntas objetivas já
+# liberadas para todos os setores, algumas dezenas ainda pendentes, e um usuário para cada
+# quantidade de respostas pedida. Para cada usuário mede p50/p99 das rotas pelo cliente de teste
+# do Flask e das funções de consulta sozinhas. O resultado vai para resultados_benchmark.jsonl.
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ARQUIVO_RESULTADOS = 'resultados_benchmark.jsonl'
+PENDENTES_POR_USUARIO = 50
+
+def _montar_banco(quantidades):
+    """Cria perguntas suficientes e um usuário por quantidade de respostas; devolve {quantidade: usuario_id}."""
+    from app import db, Departamento, Usuario, Pergunta, Resposta, reconstruir_placares, reconstruir_resumos_diarios
+    from gerar_dados import _inserir_em_lotes
+    from migracoes import resetar_banco
+    resetar_banco()
+    hoje = date.today()
+    total_perguntas = max(quantidades) + PENDENTES_POR_USUARIO
+    departamento = Departamento(nome='Benchmark')
+    db.session.add(departamento)
+    db.session.commit()
+    _inserir_em_lotes(Pergunta.__table__, ({
+        'tipo': 'multipla_escolha', 'texto': f'Pergunta {i + 1}', 'opcao_a': 'A', 'opcao_b': 'B', 'opcao_c': 'C', 'opcao_d': 'D',
+        'resposta_correta': 'abcd'[i % 4], 'data_liberacao': hoje - timedelta(days=(total_perguntas - i) // 50),
+        'tempo_limite': 30, 'para_todos_setores': True,
+    } for i in range(total_perguntas)))
+    perguntas = [id_ for id_, in db.session.query(Pergunta.id).order_by(Pergunta.data_liberacao, Pergunta.id)]
+    _inserir_em_lotes(Usuario.__table__, ({'nome': f'Usuário com {q} respostas', 'codigo_acesso': f'{i:04d}',
+                                           'departamento_id': departamento.id} for i, q in enumerate(quantidades)))
+    usuarios = dict(zip(quantidades, (id_ for id_, in db.session.query(Usuario.id).order_by(Usuario.id))))
+    agora = datetime.utcnow()
+    # Cada usuário respondeu as 'quantidade' perguntas mais antigas: as pendentes são as mais novas
+    _inserir_em_lotes(Resposta.__table__, ({
+        'usuario_id': usuario_id, 'pergunta_id': pergunta_id, 'resposta_dada': 'a', 'pontos': 100,
+        'status_correcao': 'correto', 'data_resposta': agora, 'feedback_visto': False,
+    } for quantidade, usuario_id in usuarios.items() for pergunta_id in perguntas[:quantidade]))
+    reconstruir_placares()
+    reconstruir_resumos_diarios()
+    db.session.commit()
+    return usuarios
+
+def _percentis(tempos):
+    tempos = sorted(tempos)
+    return {'p50_ms': round(statistics.median(tempos) * 1000, 2),
+            'p99_ms': round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.99))] * 1000, 2)}
+
+def _medir(funcao, repeticoes):
+    funcao() # aquecimento (índice de visibilidade, cache de instruções)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return _percentis(tempos)
+
+def medir_usuario(usuario_id, repeticoes):
+    from app import app, db, Usuario, _contagem_pendentes, _proxima_pergunta_pendente
+    cliente = app.test_client()
+    with app.app_context():
+        usuario = db.session.get(Usuario, usuario_id)
+        with cliente.session_transaction() as sessao:
+            sessao['usuario_id'], sessao['usuario_nome'] = usuario.id, usuario.nome
+        hoje = date.today()
+        medicoes = {
+            'contagem_pendentes': _medir(lambda: _contagem_pendentes(usuario_id, hoje), repeticoes),
+            'proxima_pergunta': _medir(lambda: _proxima_pergunta_pendente(usuario_id, hoje), repeticoes),
+        }
+        pendentes = _contagem_pendentes(usuario_id, hoje)[0]
+    for nome, caminho in (('dashboard', '/dashboard'), ('quiz', '/quiz'), ('api_perguntas', '/api/quiz/perguntas?quantidade=5')):
+        medicoes[nome] = _medir(lambda: cliente.get(caminho), repeticoes)
+    return pendentes, medicoes
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Latência das perguntas pendentes conforme o número de respostas do usuário.')
+    parser.add_argument('--respostas', default='0,1000,5000,10000,20000', help='respostas de cada usuário, separadas por vírgulas')
+    parser.add_argument('--requisicoes', type=int, default=50, help='repetições medidas por rota e usuário')
+    parser.add_argument('--saida', default=os.path.abspath(ARQUIVO_RESULTADOS))
+    args = parser.parse_args()
+    quantidades = sorted({int(q) for q in args.respostas.split(',') if q.strip()})
+
+    # O app lê o banco e o cache das variáveis de ambiente ao ser importado
+    pasta = tempfile.mkdtemp(prefix='benchmark-pendentes-')
+    os.environ['DATABASE_URL_PYTHONANYWHERE'] = 'sqlite:///' + os.path.join(pasta, 'quiz.db')
+    os.environ['CACHE'] = 'desligado'
+    from app import app
+    with app.app_context():
+        print(f"Montando o banco em {pasta} ({sum(quantidades)} respostas)...")
+        usuarios = _montar_banco(quantidades)
+
+    rotas = ('contagem_pendentes', 'proxima_pergunta', 'dashboard', 'quiz', 'api_perguntas')
+    print(f"{'respostas':>10}{'pendentes':>11}  " + ''.join(f'{r + " p50":>24}' for r in rotas))
+    resultados = []
+    for quantidade in quantidades:
+        pendentes, medicoes = medir_usuario(usuarios[quantidade], args.requisicoes)
+        resultados.append({'respostas': quantidade, 'pendentes': pendentes, **medicoes})
+        print(f"{quantidade:>10}{pendentes:>11}  " + ''.join(f"{medicoes[r]['p50_ms']:>21.2f} ms" for r in rotas))
+
+    from benchmark import _commit_atual
+    with open(args.saida, 'a', encoding='utf-8') as arquivo:
+        arquivo.write(json.dumps({
+            'quando': datetime.now().isoformat(timespec='seconds'),
+            'commit': _commit_atual(),
+            'pendentes_por_respostas': resultados,
+            'requisicoes': args.requisicoes,
+        }, ensure_ascii=False) + '\n')
+    print(f"Resultados acrescentados em {args.saida}.")
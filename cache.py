@@ -0,0 +1,217 @@
+# Cache de dados que mudam pouco (lista de setores, ranking, relatório de desempenho).
+#
+# O destino é escolhido pela variável de ambiente CACHE:
+#
+#     CACHE=sqlite     -> arquivo SQLite local compartilhado por todos os workers do gunicorn (padrão)
+#     CACHE=memoria    -> LRU em memória, por processo (um worker só, ou desenvolvimento)
+#     CACHE=desligado  -> nada é guardado
+#
+# Cada valor é guardado com "tags" (nomes das tabelas das quais ele depende). Depois de
+# cada commit, as tabelas alteradas na sessão têm a versão da tag incrementada, e os
+# valores guardados com a versão antiga deixam de valer; nenhuma rota precisa lembrar
+# de limpar o cache.
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from itertools import chain
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+class CacheMemoria:
+    def __init__(self, maximo=1000):
+        self.maximo = maximo
+        self._valores = OrderedDict() # chave -> (expira_em, dados)
+        self._versoes = Counter()
+        self._trava = threading.Lock()
+
+    def ler(self, chave):
+        with self._trava:
+            item = self._valores.get(chave)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._valores[chave]
+                return None
+            self._valores.move_to_end(chave)
+            return item[1]
+
+    def gravar(self, chave, dados, validade):
+        if self.maximo <= 0:
+            return
+        with self._trava:
+            self._valores[chave] = (time.time() + validade, dados)
+            self._valores.move_to_end(chave)
+            while len(self._valores) > self.maximo:
+                self._valores.popitem(last=False)
+
+    def versoes(self, tags):
+        with self._trava:
+            return tuple(self._versoes[tag] for tag in tags)
+
+    def incrementar(self, tags):
+        with self._trava:
+            for tag in tags:
+                self._versoes[tag] += 1
+
+    def limpar(self):
+        with self._trava:
+            self._valores.clear()
+
+class CacheSqlite:
+    LIMPEZA_A_CADA = 200 # gravações entre duas limpezas dos itens vencidos
+
+    def __init__(self, caminho, maximo=20000):
+        self.caminho = caminho
+        self.maximo = maximo
+        self._local = threading.local()
+        self._gravacoes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        with self._conexao() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_valor (chave TEXT PRIMARY KEY, expira_em REAL NOT NULL, dados BLOB NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_valor_expira_em ON cache_valor (expira_em)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_tag (nome TEXT PRIMARY KEY, versao INTEGER NOT NULL)")
+
+    def _conexao(self):
+        # Uma conexão por thread; WAL deixa os workers lerem enquanto outro grava
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def ler(self, chave):
+        linha = self._conexao().execute("SELECT dados FROM cache_valor WHERE chave = ? AND expira_em >= ?", (chave, time.time())).fetchone()
+        return linha[0] if linha else None
+
+    def gravar(self, chave, dados, validade):
+        conn = self._conexao()
+        conn.execute("INSERT OR REPLACE INTO cache_valor (chave, expira_em, dados) VALUES (?, ?, ?)", (chave, time.time() + validade, dados))
+        self._gravacoes += 1
+        if self._gravacoes % self.LIMPEZA_A_CADA == 0:
+            conn.execute("DELETE FROM cache_valor WHERE expira_em < ?", (time.time(),))
+            conn.execute("DELETE FROM cache_valor WHERE chave IN (SELECT chave FROM cache_valor ORDER BY expira_em DESC LIMIT -1 OFFSET ?)", (self.maximo,))
+
+    def versoes(self, tags):
+        if not tags:
+            return ()
+        linhas = dict(self._conexao().execute(
+            f"SELECT nome, versao FROM cache_tag WHERE nome IN ({', '.join('?' * len(tags))})", tuple(tags)).fetchall())
+        return tuple(linhas.get(tag, 0) for tag in tags)
+
+    def incrementar(self, tags):
+        conn = self._conexao()
+        with conn:
+            conn.executemany("INSERT INTO cache_tag (nome, versao) VALUES (?, 1) ON CONFLICT(nome) DO UPDATE SET versao = versao + 1",
+                             [(tag,) for tag in tags])
+
+    def limpar(self):
+        self._conexao().execute("DELETE FROM cache_valor")
+
+class Cache:
+    def __init__(self, backend, validade=300):
+        self.backend = backend
+        self.validade = validade
+        self._trava = threading.Lock()
+        self.acertos = Counter() # por prefixo da chave ('setores', 'ranking', ...)
+        self.falhas = Counter()
+        self.invalidacoes = Counter() # por tag
+
+    def obter_ou_calcular(self, chave, funcao, tags=(), validade=None):
+        """Devolve o valor guardado em 'chave' se as tags não mudaram desde então; senão calcula e guarda.
+
+        As versões das tags são lidas antes do cálculo: se uma escrita acontecer no meio,
+        o valor fica guardado com a versão antiga e é descartado na próxima leitura.
+        """
+        tags = tuple(sorted(tags))
+        versoes = self.backend.versoes(tags)
+        dados = self.backend.ler(chave)
+        if dados is not None:
+            versoes_guardadas, valor = pickle.loads(dados)
+            if versoes_guardadas == versoes:
+                self._contar(self.acertos, chave)
+                return valor
+        self._contar(self.falhas, chave)
+        valor = funcao()
+        self.backend.gravar(chave, pickle.dumps((versoes, valor), pickle.HIGHEST_PROTOCOL), validade or self.validade)
+        return valor
+
+    def versoes(self, tags):
+        """Versões atuais das tags, para quem mantém o próprio cache (ex.: o índice de visibilidade)."""
+        return self.backend.versoes(tuple(sorted(tags)))
+
+    def invalidar(self, *tags):
+        if not tags:
+            return
+        self.backend.incrementar(tags)
+        with self._trava:
+            self.invalidacoes.update(tags)
+
+    def _contar(self, contador, chave):
+        with self._trava:
+            contador[chave.split(':', 1)[0]] += 1
+
+    # --- Invalidação automática pelas escritas da sessão do SQLAlchemy ---
+    def vincular_sessoes(self):
+        event.listen(Session, 'after_flush', self._registrar_flush)
+        event.listen(Session, 'do_orm_execute', self._registrar_execucao)
+        event.listen(Session, 'after_commit', self._invalidar_alteradas)
+
+    @staticmethod
+    def _registrar_flush(sessao, contexto):
+        tabelas = sessao.info.setdefault('_tabelas_alteradas', set())
+        for objeto in chain(sessao.new, sessao.dirty, sessao.deleted):
+            tabelas.add(sa.inspect(objeto).mapper.local_table.name)
+
+    @staticmethod
+    def _registrar_execucao(estado):
+        # INSERT/UPDATE/DELETE em lote (Core ou query.delete()) não passam pelo flush
+        if estado.is_insert or estado.is_update or estado.is_delete:
+            estado.session.info.setdefault('_tabelas_alteradas', set()).add(estado.statement.table.name)
+
+    def _invalidar_alteradas(self, sessao):
+        tabelas = sessao.info.pop('_tabelas_alteradas', None)
+        if tabelas:
+            self.invalidar(*tabelas)
+
+    # --- Relatórios ---
+    def estatisticas(self):
+        with self._trava:
+            prefixos = sorted(set(self.acertos) | set(self.falhas))
+            return {
+                'prefixos': [{
+                    'prefixo': p, 'acertos': self.acertos[p], 'falhas': self.falhas[p],
+                    'taxa_acerto': self.acertos[p] / (self.acertos[p] + self.falhas[p]) * 100,
+                } for p in prefixos],
+                'invalidacoes': dict(self.invalidacoes),
+            }
+
+    def formato_prometheus(self):
+        with self._trava:
+            linhas = ['# HELP quiz_cache_acertos_total Leituras atendidas pelo cache.',
+                      '# TYPE quiz_cache_acertos_total counter']
+            linhas += [f'quiz_cache_acertos_total{{prefixo="{p}"}} {n}' for p, n in sorted(self.acertos.items())]
+            linhas += ['# HELP quiz_cache_falhas_total Leituras que precisaram ir ao banco.',
+                       '# TYPE quiz_cache_falhas_total counter']
+            linhas += [f'quiz_cache_falhas_total{{prefixo="{p}"}} {n}' for p, n in sorted(self.falhas.items())]
+            linhas += ['# HELP quiz_cache_invalidacoes_total Invalidações por tabela alterada.',
+                       '# TYPE quiz_cache_invalidacoes_total counter']
+            linhas += [f'quiz_cache_invalidacoes_total{{tag="{t}"}} {n}' for t, n in sorted(self.invalidacoes.items())]
+        return '\n'.join(linhas) + '\n'
+
+def criar_cache(nome, arquivo, validade=300):
+    if nome == 'sqlite':
+        return Cache(CacheSqlite(arquivo), validade)
+    if nome == 'memoria':
+        return Cache(CacheMemoria(), validade)
+    if nome == 'desligado':
+        # Nada é guardado, mas as versões das tags continuam valendo neste processo
+        return Cache(CacheMemoria(maximo=0), validade)
+    raise ValueError(f"Cache desconhecido: {nome}")
@@ -0,0 +1,142 @@
+# Compara os modos do gunicorn (gunicorn.conf.py) com o mesmo número de workers, isto é, a mesma memória:
+#
+#     python comparar_servidores.py                                 -> sync x gevent, 2 workers, 50 clientes simultâneos
+#     python comparar_servidores.py --cenarios anexo_lento,dashboard --concorrencia 100 --workers 4
+#
+# Para cada modo sobe um gunicorn nesta pasta, roda o benchmark.py contra ele (--url) e mede a
+# memória somada do master e dos workers (PSS, que não conta duas vezes as páginas compartilhadas
+# depois do fork). O cenário anexo_lento simula clientes em rede lenta enviando anexos: é o caso
+# em que os workers síncronos ficam parados esperando. Cada modo usa outra semente (outros usuários),
+# para que as respostas gravadas por um não esvaziem as atividades pendentes do outro.
+#
+# Usa o banco de DATABASE_URL_PYTHONANYWHERE, como o app; rode gerar_dados.py antes, nunca em produção.
+# Só Linux (lê a memória de /proc).
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+ARQUIVO_RESULTADOS = 'resultados_benchmark.jsonl'
+ESPERA_SERVIDOR = 60 # segundos para o gunicorn começar a responder
+
+# --- MEMÓRIA ---
+def _memoria_kb(pid):
+    """PSS do processo em KB (RSS se o kernel não tiver smaps_rollup); 0 se ele já terminou."""
+    for arquivo, campo in (('smaps_rollup', 'Pss:'), ('status', 'VmRSS:')):
+        try:
+            with open(f'/proc/{pid}/{arquivo}') as f:
+                for linha in f:
+                    if linha.startswith(campo):
+                        return int(linha.split()[1])
+        except OSError:
+            continue
+    return 0
+
+def _filhos(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+class MedidorMemoria(threading.Thread):
+    """Amostra a memória do master e dos workers a cada 'intervalo' segundos; guarda o pico."""
+
+    def __init__(self, pid, intervalo=0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.intervalo = intervalo
+        self.pico_kb = 0
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.is_set():
+            total = sum(_memoria_kb(p) for p in [self.pid] + _filhos(self.pid))
+            self.pico_kb = max(self.pico_kb, total)
+            self._parar.wait(self.intervalo)
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+# --- EXECUÇÃO ---
+def _aguardar_servidor(url, processo):
+    limite = time.monotonic() + ESPERA_SERVIDOR
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise SystemExit(f'O gunicorn terminou ao subir (código {processo.returncode}).')
+        try:
+            with urllib.request.urlopen(url + '/', timeout=2):
+                return
+        except OSError:
+            time.sleep(0.3)
+    raise SystemExit(f'O gunicorn não respondeu em {ESPERA_SERVIDOR} s.')
+
+def medir_modo(modo, args, semente):
+    """Sobe o gunicorn no 'modo', roda o benchmark contra ele e devolve os resultados e o pico de memória."""
+    endereco = f'127.0.0.1:{args.porta}'
+    ambiente = dict(os.environ, SERVIDOR_MODO=modo, SERVIDOR_WORKERS=str(args.workers), SERVIDOR_ENDERECO=endereco)
+    servidor = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app'], cwd=PASTA, env=ambiente,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _aguardar_servidor(f'http://{endereco}', servidor)
+        medidor = MedidorMemoria(servidor.pid)
+        medidor.start()
+        with tempfile.NamedTemporaryFile(suffix='.jsonl', delete=False) as saida:
+            caminho_saida = saida.name
+        try:
+            subprocess.run([sys.executable, os.path.join(PASTA, 'benchmark.py'), '--url', f'http://{endereco}',
+                            '--cenarios', args.cenarios, '--requisicoes', str(args.requisicoes),
+                            '--concorrencia', str(args.concorrencia), '--semente', str(semente),
+                            '--saida', caminho_saida], cwd=PASTA, check=True, stdout=subprocess.DEVNULL)
+            with open(caminho_saida, encoding='utf-8') as arquivo:
+                resultados = json.loads(arquivo.readlines()[-1])['resultados']
+        finally:
+            os.remove(caminho_saida)
+            medidor.parar()
+        return {'modo': modo, 'memoria_pico_mb': round(medidor.pico_kb / 1024, 1), 'resultados': resultados}
+    finally:
+        servidor.send_signal(signal.SIGTERM)
+        servidor.wait(timeout=30)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compara os workers sync e gevent do gunicorn com a mesma memória.')
+    parser.add_argument('--modos', default='sync,gevent')
+    parser.add_argument('--workers', type=int, default=2, help='processos por modo (o orçamento de memória)')
+    parser.add_argument('--cenarios', default='anexo_lento,dashboard', help='cenários do benchmark.py')
+    parser.add_argument('--requisicoes', type=int, default=200)
+    parser.add_argument('--concorrencia', type=int, default=50, help='clientes simultâneos')
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', default=ARQUIVO_RESULTADOS)
+    args = parser.parse_args()
+
+    medicoes = [medir_modo(modo.strip(), args, args.semente + i) for i, modo in enumerate(args.modos.split(',')) if modo.strip()]
+
+    print(f"{'modo':<8}{'memória MB':>12}  {'cenário':<15}{'req':>6}{'erros':>7}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+    for medicao in medicoes:
+        for r in medicao['resultados']:
+            if r['requisicoes']:
+                print(f"{medicao['modo']:<8}{medicao['memoria_pico_mb']:>12.1f}  {r['cenario']:<15}{r['requisicoes']:>6}{r['erros']:>7}"
+                      f"{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['req_por_segundo']:>9.1f}")
+            else:
+                print(f"{medicao['modo']:<8}{medicao['memoria_pico_mb']:>12.1f}  {r['cenario']:<15}{0:>6}{r['erros']:>7}   (nenhuma requisição bem-sucedida)")
+
+    with open(args.saida, 'a', encoding='utf-8') as arquivo:
+        arquivo.write(json.dumps({
+            'quando': datetime.now().isoformat(timespec='seconds'),
+            'comparacao_servidores': medicoes,
+            'workers': args.workers,
+            'requisicoes': args.requisicoes,
+            'concorrencia': args.concorrencia,
+        }, ensure_ascii=False) + '\n')
+    print(f"Resultados acrescentados em {args.saida}.")
@@ -0,0 +1,150 @@
+# Prepara os arquivos estáticos para produção, em static/dist/ (rodar a cada deploy):
+#
+#     python construir_assets.py            -> CSS, JS e áudios com o hash do conteúdo no nome, mais .gz (e .br)
+#     python construir_assets.py --limpar   -> apaga static/dist/ antes, removendo versões antigas
+#
+# O nome muda sempre que o conteúdo muda, então o app pode mandar o navegador guardar cada
+# arquivo por um ano sem nunca perguntar de novo (Cache-Control: immutable); o manifesto
+# (static/dist/manifesto.json) diz ao url_asset() do app qual nome usar. Reinicie o app depois.
+#
+# Compressão: gzip sempre; brotli se o pacote 'brotli' estiver instalado. Áudio não comprime
+# (MP3 já é comprimido): o tick, que o quiz reinicia a cada segundo, é cortado no primeiro
+# segundo; com ffmpeg no PATH os áudios ainda são recodificados em mono, com taxa menor.
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PASTA_STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+PASTA_DIST = os.path.join(PASTA_STATIC, 'dist')
+PASTAS_DE_ASSETS = ('css', 'js', 'sounds')
+EXTENSOES_COMPRIMIDAS = ('.css', '.js', '.svg')
+# áudio -> segundos que de fato tocam (None: o arquivo inteiro)
+DURACAO_DOS_AUDIOS = {'sounds/tick.mp3': 1.0}
+TAXA_AUDIO_FFMPEG = '64k'
+
+# --- MP3 ---
+# Tabelas do cabeçalho de quadro do MPEG-1 Layer III (kbit/s e Hz, pelos índices do cabeçalho)
+_TAXAS_MP3 = (None, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, None)
+_AMOSTRAGENS_MP3 = (44100, 48000, 32000, None)
+_AMOSTRAS_POR_QUADRO = 1152
+
+def _inicio_dos_quadros(dados):
+    """Posição do primeiro quadro, pulando a tag ID3v2 (se houver)."""
+    if dados[:3] != b'ID3':
+        return 0
+    tamanho = 0
+    for byte in dados[6:10]: # inteiro "synchsafe": 7 bits por byte
+        tamanho = (tamanho << 7) | (byte & 0x7F)
+    return 10 + tamanho + (10 if dados[5] & 0x10 else 0)
+
+def cortar_mp3(dados, segundos):
+    """Primeiros 'segundos' de um MP3 (MPEG-1 Layer III), cortado na fronteira de um quadro.
+
+    Devolve os dados sem mudança se o formato não for reconhecido.
+    """
+    posicao = _inicio_dos_quadros(dados)
+    tocado = 0.0
+    while tocado < segundos and posicao + 4 <= len(dados):
+        cabecalho = int.from_bytes(dados[posicao:posicao + 4], 'big')
+        # Sincronismo (11 bits), versão MPEG-1 (11) e Layer III (01)
+        if (cabecalho >> 21) != 0x7FF or (cabecalho >> 19) & 0b11 != 0b11 or (cabecalho >> 17) & 0b11 != 0b01:
+            return dados
+        taxa = _TAXAS_MP3[(cabecalho >> 12) & 0xF]
+        amostragem = _AMOSTRAGENS_MP3[(cabecalho >> 10) & 0b11]
+        if taxa is None or amostragem is None:
+            return dados
+        posicao += 144 * taxa * 1000 // amostragem + ((cabecalho >> 9) & 1)
+        tocado += _AMOSTRAS_POR_QUADRO / amostragem
+    return dados[:posicao]
+
+def _recodificar_audio(dados, extensao, segundos):
+    """Mono, TAXA_AUDIO_FFMPEG, com ffmpeg; None se ele não estiver instalado ou falhar."""
+    if not shutil.which('ffmpeg'):
+        return None
+    with tempfile.TemporaryDirectory() as pasta:
+        entrada, saida = os.path.join(pasta, 'entrada' + extensao), os.path.join(pasta, 'saida' + extensao)
+        with open(entrada, 'wb') as arquivo:
+            arquivo.write(dados)
+        comando = ['ffmpeg', '-loglevel', 'error', '-y', '-i', entrada, '-ac', '1', '-b:a', TAXA_AUDIO_FFMPEG]
+        if segundos:
+            comando += ['-t', str(segundos)]
+        if subprocess.run(comando + [saida]).returncode != 0:
+            return None
+        with open(saida, 'rb') as arquivo:
+            return arquivo.read()
+
+def reduzir_audio(caminho, dados):
+    segundos = DURACAO_DOS_AUDIOS.get(caminho)
+    recodificado = _recodificar_audio(dados, os.path.splitext(caminho)[1], segundos)
+    if recodificado is not None and len(recodificado) < len(dados):
+        return recodificado
+    if segundos and caminho.endswith('.mp3'):
+        return cortar_mp3(dados, segundos)
+    return dados
+
+# --- CONSTRUÇÃO ---
+def _gravar(caminho, dados):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, 'wb') as arquivo:
+        arquivo.write(dados)
+
+def _nome_com_hash(caminho, dados):
+    raiz, extensao = os.path.splitext(caminho)
+    return f"{raiz}.{hashlib.sha256(dados).hexdigest()[:12]}{extensao}"
+
+def construir(limpar=False):
+    """Gera static/dist/ e o manifesto; devolve {caminho original: (bytes originais, bytes gerados por formato)}."""
+    if limpar and os.path.isdir(PASTA_DIST):
+        shutil.rmtree(PASTA_DIST)
+    manifesto = {}
+    tamanhos = {}
+    for pasta in PASTAS_DE_ASSETS:
+        for raiz, _, arquivos in os.walk(os.path.join(PASTA_STATIC, pasta)):
+            for nome in sorted(arquivos):
+                caminho = os.path.relpath(os.path.join(raiz, nome), PASTA_STATIC).replace(os.sep, '/')
+                with open(os.path.join(PASTA_STATIC, caminho), 'rb') as arquivo:
+                    original = arquivo.read()
+                dados = reduzir_audio(caminho, original) if pasta == 'sounds' else original
+                compilado = _nome_com_hash(caminho, dados)
+                destino = os.path.join(PASTA_DIST, compilado)
+                _gravar(destino, dados)
+                gerados = {'arquivo': len(dados)}
+                if caminho.endswith(EXTENSOES_COMPRIMIDAS):
+                    # mtime=0: o mesmo conteúdo gera sempre o mesmo .gz
+                    comprimido = gzip.compress(dados, compresslevel=9, mtime=0)
+                    _gravar(destino + '.gz', comprimido)
+                    gerados['gzip'] = len(comprimido)
+                    if brotli is not None:
+                        comprimido = brotli.compress(dados, quality=11)
+                        _gravar(destino + '.br', comprimido)
+                        gerados['br'] = len(comprimido)
+                manifesto[caminho] = compilado
+                tamanhos[caminho] = (len(original), gerados)
+    _gravar(os.path.join(PASTA_DIST, 'manifesto.json'), json.dumps(manifesto, indent=2, sort_keys=True).encode())
+    return tamanhos
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera os arquivos estáticos com hash e pré-comprimidos.')
+    parser.add_argument('--limpar', action='store_true', help='apaga static/dist/ antes de gerar')
+    args = parser.parse_args()
+
+    tamanhos = construir(args.limpar)
+    for caminho, (original, gerados) in tamanhos.items():
+        formatos = ', '.join(f'{formato} {bytes_ / 1024:.1f} KB' for formato, bytes_ in gerados.items())
+        print(f"{caminho:<22} {original / 1024:>8.1f} KB -> {formatos}")
+    if brotli is None:
+        print("Pacote 'brotli' não instalado: só .gz gerado.")
+    if not shutil.which('ffmpeg'):
+        print("ffmpeg não encontrado: áudios só cortados, não recodificados.")
+    print(f"Manifesto gravado em {os.path.join(PASTA_DIST, 'manifesto.json')}; reinicie o app.")
@@ -1,52 +1,204 @@
 # Em enviar_notificacoes.py
 
-from app import app, db, mail, Usuario, Pergunta
-from flask_mail import Message
+import os
+import queue
+import smtplib
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date
 
-def enviar_email_notificacao():
+from app import app, db, mail, Usuario, Pergunta, NotificacaoEnviada, NotificacaoFalha, tarefa, enfileirar_tarefa, registrar_progresso
+from flask_mail import Message
+
+# Ajustáveis por variável de ambiente, conforme o limite do provedor de e-mail
+CONEXOES_SMTP = int(os.environ.get('MAIL_CONEXOES', 4)) # conexões (e threads) simultâneas
+EMAILS_POR_SEGUNDO = float(os.environ.get('MAIL_LIMITE_POR_SEGUNDO', 10))
+TENTATIVAS_POR_DESTINATARIO = 3
+REGISTROS_POR_COMMIT = 50
+
+ASSUNTO = "Novas perguntas disponíveis no Quiz Produtivo!"
+MODELO_CORPO = (
+    "Olá, {nome}!\n\n"
+    "Temos novas perguntas de conhecimento liberadas hoje para você responder.\n\n"
+    "Acesse agora e teste seus conhecimentos!\n\n"
+    "Atenciosamente,\nEquipe Quiz Produtivo"
+)
+
+class PoolSMTP:
+    """Conjunto limitado de conexões SMTP reaproveitadas entre as threads de envio."""
+
+    def __init__(self, tamanho):
+        self._livres = queue.Queue()
+        for _ in range(tamanho):
+            self._livres.put(None) # Vaga ainda sem conexão aberta
+        self._abertas = []
+        self._trava = threading.Lock()
+
+    def obter(self):
+        conexao = self._livres.get()
+        if conexao is None:
+            try:
+                conexao = mail.connect().__enter__()
+            except BaseException:
+                # Servidor fora do ar: a vaga volta vazia, senão as outras threads esperariam por ela para sempre
+                self._livres.put(None)
+                raise
+            with self._trava:
+                self._abertas.append(conexao)
+        return conexao
+
+    def devolver(self, conexao):
+        self._livres.put(conexao)
+
+    def descartar(self, conexao):
+        """Fecha uma conexão com erro; a vaga volta vazia e será reaberta no próximo uso."""
+        with self._trava:
+            self._abertas.remove(conexao)
+        try:
+            if conexao.host:
+                conexao.host.quit()
+        except Exception:
+            pass
+        self._livres.put(None)
+
+    def fechar(self):
+        with self._trava:
+            abertas, self._abertas = self._abertas, []
+        for conexao in abertas:
+            try:
+                if conexao.host:
+                    conexao.host.quit()
+            except Exception:
+                pass
+
+class LimitadorTaxa:
+    """Balde de fichas: libera no máximo 'por_segundo' envios por segundo, somando todas as threads."""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo if por_segundo > 0 else 0
+        self._proximo = time.monotonic()
+        self._trava = threading.Lock()
+
+    def aguardar(self):
+        with self._trava:
+            agora = time.monotonic()
+            espera = self._proximo - agora
+            self._proximo = max(self._proximo, agora) + self.intervalo
+        if espera > 0:
+            time.sleep(espera)
+
+def _enviar_para(pool, limitador, usuario_id, nome, email):
+    """Envia o e-mail de um destinatário, com novas tentativas. Roda em uma thread do pool.
+
+    Retorna (usuario_id, email, erro ou None, tentativas).
+    """
+    erro = None
+    with app.app_context():
+        for tentativa in range(1, TENTATIVAS_POR_DESTINATARIO + 1):
+            limitador.aguardar()
+            conexao = None
+            try:
+                conexao = pool.obter() # falha ao conectar conta como falha de envio, com nova tentativa
+                conexao.send(Message(subject=ASSUNTO, recipients=[email], body=MODELO_CORPO.format(nome=nome)))
+                pool.devolver(conexao)
+                return usuario_id, email, None, tentativa
+            except smtplib.SMTPRecipientsRefused as e:
+                # Endereço recusado pelo servidor: tentar de novo não adianta
+                pool.devolver(conexao)
+                return usuario_id, email, e, tentativa
+            except Exception as e:
+                if conexao is not None:
+                    pool.descartar(conexao)
+                erro = e
+                time.sleep(0.5 * 2 ** (tentativa - 1))
+    return usuario_id, email, erro, TENTATIVAS_POR_DESTINATARIO
+
+def enviar_email_notificacao(tarefa_atual=None):
+    """Avisa por e-mail todos os usuários sobre as perguntas liberadas hoje.
+
+    Pode ser reexecutado com segurança: quem já recebeu o aviso do dia é ignorado.
+    Retorna (enviados, falhas).
+    """
     # 'with app.app_context()' é crucial para permitir que o script acesse o banco de dados
     with app.app_context():
-        print("Iniciando verificação de novas perguntas...")
-        
-        # 1. Encontra as perguntas liberadas hoje
+        app.logger.info("Iniciando verificação de novas perguntas...")
+
+        # 1. Verifica se há perguntas liberadas hoje
         hoje = date.today()
-        perguntas_de_hoje = Pergunta.query.filter_by(data_liberacao=hoje).all()
-        
-        if not perguntas_de_hoje:
-            print("Nenhuma pergunta nova para hoje. Encerrando.")
-            return
-
-        print(f"Encontradas {len(perguntas_de_hoje)} perguntas novas. Buscando usuários...")
-        
-        # 2. Busca todos os usuários que têm um e-mail cadastrado
-        usuarios = Usuario.query.filter(Usuario.email.isnot(None)).all()
-        
-        if not usuarios:
-            print("Nenhum usuário com e-mail cadastrado. Encerrando.")
-            return
-
-        # 3. Envia um e-mail para cada usuário
-        # Usamos 'with mail.connect()' para otimizar o envio de múltiplos e-mails
-        with mail.connect() as conn:
-            for usuario in usuarios:
-                try:
-                    subject = "Novas perguntas disponíveis no Quiz Produtivo!"
-                    body = (
-                        f"Olá, {usuario.nome}!\n\n"
-                        f"Temos novas perguntas de conhecimento liberadas hoje para você responder.\n\n"
-                        f"Acesse agora e teste seus conhecimentos!\n\n"
-                        f"Atenciosamente,\nEquipe Quiz Produtivo"
-                    )
-                    
-                    msg = Message(subject=subject, recipients=[usuario.email], body=body)
-                    conn.send(msg)
-                    print(f"E-mail enviado com sucesso para {usuario.email}")
-                except Exception as e:
-                    print(f"Falha ao enviar e-mail para {usuario.email}: {e}")
-
-        print("Processo de notificação concluído.")
-
-# Permite que o script seja executado diretamente pelo terminal
+        if not db.session.query(Pergunta.query.filter_by(data_liberacao=hoje).exists()).scalar():
+            app.logger.info("Nenhuma pergunta nova para hoje. Encerrando.")
+            return 0, 0
+
+        # 2. Busca os usuários com e-mail que ainda não receberam o aviso de hoje
+        chave = f'novas-perguntas:{hoje.isoformat()}'
+        ja_avisado = db.select(NotificacaoEnviada.id).where(
+            NotificacaoEnviada.chave == chave, NotificacaoEnviada.usuario_id == Usuario.id
+        ).exists()
+        destinatarios = db.session.query(Usuario.id, Usuario.nome, Usuario.email).filter(
+            Usuario.email.isnot(None), ~ja_avisado
+        ).all()
+
+        if not destinatarios:
+            app.logger.info("Nenhum usuário com e-mail pendente de aviso. Encerrando.")
+            return 0, 0
+
+        # Falhas de execuções anteriores são tentadas de novo e atualizadas, não duplicadas
+        falhas_anteriores = {f.usuario_id: f for f in NotificacaoFalha.query.filter_by(chave=chave)}
+
+        app.logger.info(f"Enviando {len(destinatarios)} e-mails com {CONEXOES_SMTP} conexões SMTP...")
+
+        # 3. Envia em paralelo; o registro no banco fica nesta thread, conforme os envios terminam
+        enviados, falhas = 0, 0
+        pool = PoolSMTP(CONEXOES_SMTP)
+        limitador = LimitadorTaxa(EMAILS_POR_SEGUNDO)
+        try:
+            with ThreadPoolExecutor(max_workers=CONEXOES_SMTP) as executor:
+                futuros = [executor.submit(_enviar_para, pool, limitador, *destinatario) for destinatario in destinatarios]
+                for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+                    usuario_id, email, erro, tentativas = futuro.result()
+                    if erro is None:
+                        enviados += 1
+                        db.session.add(NotificacaoEnviada(chave=chave, usuario_id=usuario_id))
+                        if usuario_id in falhas_anteriores:
+                            db.session.delete(falhas_anteriores[usuario_id])
+                    else:
+                        falhas += 1
+                        app.logger.error(f"Falha ao enviar e-mail para {email} após {tentativas} tentativa(s): {erro}")
+                        falha = falhas_anteriores.get(usuario_id)
+                        if falha:
+                            falha.email, falha.erro = email, str(erro)
+                            falha.tentativas += tentativas
+                        else:
+                            db.session.add(NotificacaoFalha(chave=chave, usuario_id=usuario_id, email=email, erro=str(erro), tentativas=tentativas))
+                    if concluidos % REGISTROS_POR_COMMIT == 0:
+                        # Grava aos poucos: se o processo cair, a reexecução não reenvia o que já saiu
+                        if tarefa_atual:
+                            registrar_progresso(tarefa_atual, concluidos * 100 // len(destinatarios), f'{concluidos} de {len(destinatarios)} e-mails processados.')
+                        else:
+                            db.session.commit()
+                db.session.commit()
+        finally:
+            pool.fechar()
+
+        app.logger.info(f"Processo de notificação concluído: {enviados} enviados, {falhas} com falha.")
+        return enviados, falhas
+
+@tarefa('enviar_notificacoes')
+def _tarefa_enviar_notificacoes(tarefa_atual):
+    enviados, falhas = enviar_email_notificacao(tarefa_atual)
+    tarefa_atual.mensagem = f'{enviados} e-mails enviados, {falhas} com falha.'
+
+# Permite que o script seja executado diretamente pelo terminal.
+# Com '--enfileirar', apenas agenda o envio para o worker.py (útil em um cron).
 if __name__ == '__main__':
-    enviar_email_notificacao()
\ No newline at end of file
+    import logging
+    logging.basicConfig(level=logging.INFO)
+    app.logger.setLevel(logging.INFO)
+    if '--enfileirar' in sys.argv:
+        with app.app_context():
+            nova_tarefa = enfileirar_tarefa('enviar_notificacoes')
+            print(f"Envio de notificações agendado (tarefa {nova_tarefa.id}).")
+    else:
+        enviar_email_notificacao()
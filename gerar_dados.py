@@ -0,0 +1,156 @@
+# Gera uma massa de dados sintética, mas realista, para medir o desempenho do app.
+#
+#     python gerar_dados.py --resetar                      -> 10 mil usuários, 50 setores, 5 mil perguntas, 5 milhões de respostas
+#     python gerar_dados.py --resetar --respostas 200000   -> versão menor, para rodar em segundos
+#
+# A mesma --semente gera sempre os mesmos dados, para comparar versões do app.
+# Use um banco separado (DATABASE_URL_PYTHONANYWHERE), nunca o de produção.
+
+import argparse
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from app import app, db, Departamento, Usuario, Pergunta, Resposta, pergunta_departamento_association, reconstruir_placares, reconstruir_resumos_diarios
+from migracoes import aplicar_migracoes, resetar_banco
+
+LINHAS_POR_LOTE = 20000
+PROPORCAO_DISCURSIVAS = 0.1
+TAXA_DE_ACERTO = 0.6
+
+def _codigo_acesso(numero, total):
+    """Códigos únicos de 4 caracteres: numéricos até 10 mil usuários, base 36 acima disso."""
+    if total <= 10000:
+        return f'{numero:04d}'
+    digitos = '0123456789abcdefghijklmnopqrstuvwxyz'
+    codigo = ''
+    for _ in range(4):
+        numero, resto = divmod(numero, 36)
+        codigo = digitos[resto] + codigo
+    return codigo
+
+def _inserir_em_lotes(tabela, linhas):
+    """Insere as linhas de um gerador com executemany, em lotes, com commit a cada lote."""
+    lote, total = [], 0
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) == LINHAS_POR_LOTE:
+            db.session.execute(tabela.insert(), lote)
+            db.session.commit()
+            total += len(lote)
+            lote = []
+    if lote:
+        db.session.execute(tabela.insert(), lote)
+        db.session.commit()
+        total += len(lote)
+    return total
+
+def gerar(usuarios, setores, perguntas, respostas, semente):
+    rng = np.random.default_rng(semente)
+    hoje = date.today()
+    agora = datetime.utcnow()
+
+    # 1. Setores e usuários (tamanhos de setor desiguais, como numa empresa de verdade)
+    _inserir_em_lotes(Departamento.__table__, ({'nome': f'Setor {i + 1:03d}'} for i in range(setores)))
+    ids_setores = [id_ for id_, in db.session.query(Departamento.id).order_by(Departamento.id)]
+    pesos_setores = rng.pareto(1.5, setores) + 1
+    setor_de_cada_usuario = rng.choice(ids_setores, size=usuarios, p=pesos_setores / pesos_setores.sum())
+    _inserir_em_lotes(Usuario.__table__, ({
+        'nome': f'Colaborador {i + 1:05d}',
+        'email': f'colaborador{i + 1}@empresa.com',
+        'codigo_acesso': _codigo_acesso(i, usuarios),
+        'departamento_id': int(setor_de_cada_usuario[i]),
+    } for i in range(usuarios)))
+    ids_usuarios = np.array([id_ for id_, in db.session.query(Usuario.id).order_by(Usuario.id)])
+
+    # 2. Perguntas liberadas ao longo do último ano (e algumas futuras), metade para todos os setores
+    tipos = rng.choice(['multipla_escolha', 'verdadeiro_falso', 'discursiva'], size=perguntas,
+                       p=[(1 - PROPORCAO_DISCURSIVAS) * 0.7, (1 - PROPORCAO_DISCURSIVAS) * 0.3, PROPORCAO_DISCURSIVAS])
+    dias = rng.integers(-365, 15, size=perguntas)
+    para_todos = rng.random(perguntas) < 0.5
+
+    def _pergunta(i):
+        tipo = str(tipos[i])
+        objetiva = tipo != 'discursiva'
+        return {
+            'tipo': tipo, 'texto': f'Pergunta sintética {i + 1}: qual é a alternativa correta?',
+            'opcao_a': 'Alternativa A' if tipo == 'multipla_escolha' else None,
+            'opcao_b': 'Alternativa B' if tipo == 'multipla_escolha' else None,
+            'opcao_c': 'Alternativa C' if tipo == 'multipla_escolha' else None,
+            'opcao_d': 'Alternativa D' if tipo == 'multipla_escolha' else None,
+            'resposta_correta': ('abcd'[i % 4] if tipo == 'multipla_escolha' else 'vf'[i % 2]) if objetiva else None,
+            'data_liberacao': hoje + timedelta(days=int(dias[i])),
+            'tempo_limite': 30 if objetiva else None,
+            'para_todos_setores': bool(para_todos[i]),
+        }
+    _inserir_em_lotes(Pergunta.__table__, (_pergunta(i) for i in range(perguntas)))
+    linhas_perguntas = db.session.query(Pergunta.id, Pergunta.tipo, Pergunta.resposta_correta, Pergunta.data_liberacao).order_by(Pergunta.id).all()
+    setores_da_pergunta = [None if todos else rng.choice(ids_setores, size=min(int(rng.integers(1, 4)), setores), replace=False)
+                           for todos in para_todos]
+    _inserir_em_lotes(pergunta_departamento_association, (
+        {'pergunta_id': pergunta.id, 'departamento_id': int(setor)}
+        for pergunta, alvo in zip(linhas_perguntas, setores_da_pergunta) if alvo is not None
+        for setor in alvo
+    ))
+
+    # 3. Respostas: cada usuário responde uma amostra das perguntas já liberadas para o seu setor (sem repetir)
+    liberadas = [i for i, p in enumerate(linhas_perguntas) if p.data_liberacao <= hoje]
+    visiveis = {setor: np.array([i for i in liberadas if setores_da_pergunta[i] is None or setor in setores_da_pergunta[i]])
+                for setor in ids_setores}
+    por_usuario = rng.multinomial(respostas, np.full(usuarios, 1 / usuarios))
+
+    def _respostas():
+        for usuario_id, setor, quantidade in zip(ids_usuarios, setor_de_cada_usuario, por_usuario):
+            candidatas = visiveis[setor]
+            for indice in rng.choice(candidatas, size=min(int(quantidade), len(candidatas)), replace=False):
+                pergunta = linhas_perguntas[indice]
+                quando = agora - timedelta(days=(hoje - pergunta.data_liberacao).days * float(rng.random()), seconds=int(rng.integers(0, 86400)))
+                # Todas as linhas com as mesmas chaves, para o executemany
+                linha = {'usuario_id': int(usuario_id), 'pergunta_id': pergunta.id, 'data_resposta': quando,
+                         'resposta_dada': None, 'texto_discursivo': None, 'feedback_visto': False}
+                if pergunta.tipo == 'discursiva':
+                    status = str(rng.choice(['pendente', 'correto', 'parcialmente_correto', 'incorreto']))
+                    linha.update(texto_discursivo='Resposta sintética.', status_correcao=status,
+                                 pontos=None if status == 'pendente' else {'correto': 100, 'parcialmente_correto': 50, 'incorreto': 0}[status])
+                else:
+                    acertou = rng.random() < TAXA_DE_ACERTO
+                    if acertou:
+                        dada = pergunta.resposta_correta
+                    elif pergunta.tipo == 'multipla_escolha':
+                        dada = 'abcd'[('abcd'.index(pergunta.resposta_correta) + int(rng.integers(1, 4))) % 4]
+                    else:
+                        dada = 'f' if pergunta.resposta_correta == 'v' else 'v'
+                    linha.update(resposta_dada=dada, status_correcao='correto' if acertou else 'incorreto',
+                                 pontos=100 + int(rng.integers(0, 150)) if acertou else 0)
+                yield linha
+    total_respostas = _inserir_em_lotes(Resposta.__table__, _respostas())
+
+    # 4. Placar do ranking e resumo diário do relatório coerentes com as respostas inseridas
+    reconstruir_placares()
+    reconstruir_resumos_diarios()
+    db.session.commit()
+    return total_respostas
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera dados sintéticos para testes de desempenho.')
+    parser.add_argument('--usuarios', type=int, default=10000)
+    parser.add_argument('--setores', type=int, default=50)
+    parser.add_argument('--perguntas', type=int, default=5000)
+    parser.add_argument('--respostas', type=int, default=5000000)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--resetar', action='store_true', help='apaga o banco antes de gerar')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.resetar:
+            resetar_banco()
+        else:
+            aplicar_migracoes()
+            if db.session.query(Usuario.id).first():
+                parser.error('o banco já tem usuários; use --resetar (num banco de testes) para gerar do zero.')
+
+        inicio = time.perf_counter()
+        total_respostas = gerar(args.usuarios, args.setores, args.perguntas, args.respostas, args.semente)
+        print(f"Gerados {args.setores} setores, {args.usuarios} usuários, {args.perguntas} perguntas e "
+              f"{total_respostas} respostas em {time.perf_counter() - inicio:.0f} s.")
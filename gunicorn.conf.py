@@ -0,0 +1,46 @@
+# Configuração do gunicorn (lida automaticamente quando ele é iniciado nesta pasta: gunicorn app:app).
+#
+# O modo é escolhido pela variável de ambiente SERVIDOR_MODO:
+#
+#     SERVIDOR_MODO=sync    -> workers síncronos; com SERVIDOR_THREADS > 1, uma thread por requisição (padrão)
+#     SERVIDOR_MODO=gevent  -> workers gevent (dependência opcional: pip install gevent, ver requirements.txt):
+#                              cada requisição é um greenlet, e enquanto uma espera a rede (corpo de um upload
+#                              chegando, download lento, banco remoto, Cloudinary, SMTP) o worker atende as outras
+#
+# No modo gevent, um worker segura até SERVIDOR_CONEXOES requisições com a memória de um processo só,
+# mas CPU continua sendo um núcleo por worker: páginas pesadas (relatórios, pandas) não ficam mais
+# rápidas. O banco precisa de um driver que coopere com o gevent (perfil_banco.py cuida do MySQL e do
+# PostgreSQL) e de um pool que caiba no limite de conexões: workers x (BD_POOL_TAMANHO + BD_POOL_EXCEDENTE);
+# quem passa disso espera uma conexão livre. Com SQLite o ganho fica só na rede dos clientes.
+#
+# Padrões desta configuração (o gunicorn sozinho usa 1 worker síncrono, 1 thread e timeout de 30 s):
+#
+#     SERVIDOR_WORKERS=2     processos; cada um com a sua memória e o seu pool de conexões com o banco
+#     SERVIDOR_THREADS=4     só no modo sync: 2 x 4 = 8 requisições atendidas ao mesmo tempo
+#     SERVIDOR_TIMEOUT=120   exportações e importações rodam na própria requisição quando não há worker.py
+#                            (TAREFAS_EM_SEGUNDO_PLANO) e passam dos 30 s com bases grandes
+#     SERVIDOR_CONEXOES=100  só no modo gevent: requisições simultâneas por worker
+#
+# Para voltar ao comportamento de antes deste arquivo: SERVIDOR_WORKERS=1 SERVIDOR_THREADS=1 SERVIDOR_TIMEOUT=30.
+# Opções passadas na linha de comando (-w, --threads, -k...) têm prioridade sobre as daqui.
+# Para comparar os modos com a mesma memória: python comparar_servidores.py
+
+import os
+
+modo = os.environ.get('SERVIDOR_MODO', 'sync')
+if 'SERVIDOR_ENDERECO' in os.environ:
+    bind = os.environ['SERVIDOR_ENDERECO'] # sem ela vale o padrão do gunicorn ($PORT ou 127.0.0.1:8000)
+workers = int(os.environ.get('SERVIDOR_WORKERS', 2))
+timeout = int(os.environ.get('SERVIDOR_TIMEOUT', 120))
+
+if modo == 'sync':
+    threads = int(os.environ.get('SERVIDOR_THREADS', 4))
+elif modo == 'gevent':
+    try:
+        import gevent # noqa: F401 (só confere se está instalado, antes de subir os workers)
+    except ImportError:
+        raise RuntimeError("SERVIDOR_MODO=gevent requer o pacote gevent (pip install gevent)")
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('SERVIDOR_CONEXOES', 100))
+else:
+    raise RuntimeError(f"SERVIDOR_MODO desconhecido: {modo}")
@@ -1,4 +1,6 @@
-from app import app, db, Usuario, Departamento
+import sys
+from app import app, db, Usuario, Departamento, reconstruir_placares
+from migracoes import aplicar_migracoes, resetar_banco
 
 # ESTRUTURA DOS SETORES E USUÁRIOS
 dados_iniciais = {
@@ -21,18 +23,25 @@ dados_iniciais = {
 }
 
 with app.app_context():
-    print("Apagando e recriando o banco de dados...")
-    db.drop_all() # Garante que o banco de dados antigo seja apagado
-    db.create_all()
+    if '--resetar' in sys.argv:
+        print("Apagando e recriando o banco de dados...")
+        resetar_banco() # Só apaga os dados antigos quando pedido explicitamente
+    else:
+        print("Aplicando migrações pendentes...")
+        aplicar_migracoes()
 
     print("Inserindo departamentos e usuários...")
     for nome_depto, lista_usuarios in dados_iniciais.items():
-        # Cria o departamento
-        novo_depto = Departamento(nome=nome_depto)
-        db.session.add(novo_depto)
+        # Cria o departamento (ou reaproveita o existente)
+        novo_depto = Departamento.query.filter_by(nome=nome_depto).first()
+        if not novo_depto:
+            novo_depto = Departamento(nome=nome_depto)
+            db.session.add(novo_depto)
         
         # Cria os usuários e já os associa ao departamento
         for user_data in lista_usuarios:
+            if Usuario.query.filter_by(codigo_acesso=user_data['codigo_acesso']).first():
+                continue
             novo_usuario = Usuario(
                 nome=user_data['nome'], 
                 codigo_acesso=user_data['codigo_acesso'],
@@ -41,6 +50,8 @@ with app.app_context():
             )
             db.session.add(novo_usuario)
     
+    db.session.flush()
+    reconstruir_placares() # Usuários e setores novos entram no ranking com placar zerado
     db.session.commit()
     print("Dados iniciais inseridos com sucesso!")
 
@@ -0,0 +1,176 @@
+# Instrumentação opcional das rotas: latência por endpoint, consultas SQL por requisição,
+# consultas mais lentas e suspeitas de N+1 (a mesma consulta repetida dentro de uma requisição).
+#
+# Ligada com INSTRUMENTACAO=1. Os números ficam em memória, por processo, e aparecem em
+# /metrics (formato do Prometheus) e em /admin/desempenho.
+
+import bisect
+import heapq
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Limites dos baldes dos histogramas (segundos e número de consultas)
+BALDES_LATENCIA = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+BALDES_CONSULTAS = [1, 2, 5, 10, 20, 50, 100, 200]
+LIMIAR_N_MAIS_1 = 10 # a mesma consulta repetida mais que isso numa requisição vira suspeita
+MAXIMO_CONSULTAS_LENTAS = 20
+
+class Histograma:
+    def __init__(self, baldes):
+        self.baldes = baldes
+        self.contagens = [0] * (len(baldes) + 1) # o último é o "+Inf"
+        self.soma = 0
+        self.total = 0
+
+    def registrar(self, valor):
+        self.contagens[bisect.bisect_left(self.baldes, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def acumulado(self):
+        """Pares (limite, contagem acumulada), como o Prometheus espera."""
+        acumulado, total = [], 0
+        for limite, contagem in zip(self.baldes + [float('inf')], self.contagens):
+            total += contagem
+            acumulado.append((limite, total))
+        return acumulado
+
+    def percentil(self, p):
+        """Estimativa pelo limite do balde (suficiente para comparar rotas)."""
+        if not self.total:
+            return 0
+        alvo = self.total * p
+        for limite, acumulado in self.acumulado():
+            if acumulado >= alvo:
+                return limite if limite != float('inf') else self.baldes[-1]
+
+class Instrumentacao:
+    def __init__(self):
+        self._trava = threading.Lock()
+        self.resetar()
+
+    def resetar(self):
+        with self._trava:
+            self.latencias = defaultdict(lambda: Histograma(BALDES_LATENCIA))
+            self.consultas = defaultdict(lambda: Histograma(BALDES_CONSULTAS))
+            self.tempo_sql = defaultdict(float)
+            self.respostas = Counter() # (endpoint, método, status) -> total
+            self.consultas_lentas = [] # heap de (duração, endpoint, sql)
+            self.n_mais_1 = {} # (endpoint, sql) -> maior repetição vista numa requisição
+            self.iniciado_em = time.time()
+
+    def init_app(self, app):
+        app.before_request(self._inicio_requisicao)
+        app.after_request(self._registrar_status)
+        app.teardown_request(self._fim_requisicao)
+        event.listen(Engine, 'before_cursor_execute', self._antes_da_consulta)
+        event.listen(Engine, 'after_cursor_execute', self._depois_da_consulta)
+
+    # --- Ganchos do Flask ---
+    def _inicio_requisicao(self):
+        g._instrumentacao = {'inicio': time.perf_counter(), 'consultas': Counter(), 'tempo_sql': 0.0}
+
+    def _fim_requisicao(self, exc=None):
+        dados = g.pop('_instrumentacao', None)
+        if dados is None:
+            return
+        duracao = time.perf_counter() - dados['inicio']
+        endpoint = request.endpoint or 'desconhecido'
+        status = 500 if exc else getattr(g, '_status_resposta', 200)
+        with self._trava:
+            self.latencias[endpoint].registrar(duracao)
+            self.consultas[endpoint].registrar(sum(dados['consultas'].values()))
+            self.tempo_sql[endpoint] += dados['tempo_sql']
+            self.respostas[(endpoint, request.method, status)] += 1
+            for sql, repeticoes in dados['consultas'].items():
+                if repeticoes > LIMIAR_N_MAIS_1 and repeticoes > self.n_mais_1.get((endpoint, sql), 0):
+                    self.n_mais_1[(endpoint, sql)] = repeticoes
+
+    def _registrar_status(self, resposta):
+        # O teardown não recebe a resposta; o status é guardado aqui
+        g._status_resposta = resposta.status_code
+        return resposta
+
+    # --- Ganchos do SQLAlchemy ---
+    def _antes_da_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_inicio_consultas', []).append(time.perf_counter())
+
+    def _depois_da_consulta(self, conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info['_inicio_consultas'].pop()
+        if not has_request_context():
+            return
+        dados = g.get('_instrumentacao')
+        if dados is None:
+            return
+        duracao = time.perf_counter() - inicio
+        dados['consultas'][statement] += 1
+        dados['tempo_sql'] += duracao
+        endpoint = request.endpoint or 'desconhecido'
+        with self._trava:
+            item = (duracao, endpoint, statement)
+            if len(self.consultas_lentas) < MAXIMO_CONSULTAS_LENTAS:
+                heapq.heappush(self.consultas_lentas, item)
+            elif duracao > self.consultas_lentas[0][0]:
+                heapq.heapreplace(self.consultas_lentas, item)
+
+    # --- Relatórios ---
+    def resumo(self):
+        """Dados para a página de admin, com as rotas mais lentas primeiro."""
+        with self._trava:
+            endpoints = [{
+                'endpoint': endpoint,
+                'requisicoes': hist.total,
+                'media_ms': hist.soma / hist.total * 1000 if hist.total else 0,
+                'p95_ms': hist.percentil(0.95) * 1000,
+                'consultas_por_requisicao': self.consultas[endpoint].soma / hist.total if hist.total else 0,
+                'tempo_sql_ms': self.tempo_sql[endpoint] / hist.total * 1000 if hist.total else 0,
+            } for endpoint, hist in self.latencias.items()]
+            lentas = sorted(self.consultas_lentas, reverse=True)
+            suspeitas = sorted(((e, s, n) for (e, s), n in self.n_mais_1.items()), key=lambda x: -x[2])
+        endpoints.sort(key=lambda e: e['media_ms'] * e['requisicoes'], reverse=True)
+        return {
+            'endpoints': endpoints,
+            'consultas_lentas': [{'duracao_ms': d * 1000, 'endpoint': e, 'sql': s} for d, e, s in lentas],
+            'n_mais_1': [{'endpoint': e, 'sql': s, 'repeticoes': n} for e, s, n in suspeitas],
+            'iniciado_em': self.iniciado_em,
+        }
+
+    def formato_prometheus(self):
+        linhas = []
+        with self._trava:
+            linhas += ['# HELP quiz_requisicao_segundos Latência das requisições por endpoint.',
+                       '# TYPE quiz_requisicao_segundos histogram']
+            for endpoint, hist in sorted(self.latencias.items()):
+                linhas += _linhas_histograma('quiz_requisicao_segundos', endpoint, hist)
+            linhas += ['# HELP quiz_consultas_sql_por_requisicao Consultas SQL executadas por requisição.',
+                       '# TYPE quiz_consultas_sql_por_requisicao histogram']
+            for endpoint, hist in sorted(self.consultas.items()):
+                linhas += _linhas_histograma('quiz_consultas_sql_por_requisicao', endpoint, hist)
+            linhas += ['# HELP quiz_sql_segundos_total Tempo total gasto em SQL por endpoint.',
+                       '# TYPE quiz_sql_segundos_total counter']
+            for endpoint, total in sorted(self.tempo_sql.items()):
+                linhas.append(f'quiz_sql_segundos_total{{endpoint="{endpoint}"}} {total:.6f}')
+            linhas += ['# HELP quiz_respostas_total Respostas por endpoint, método e status.',
+                       '# TYPE quiz_respostas_total counter']
+            for (endpoint, metodo, status), total in sorted(self.respostas.items()):
+                linhas.append(f'quiz_respostas_total{{endpoint="{endpoint}",metodo="{metodo}",status="{status}"}} {total}')
+            linhas += ['# HELP quiz_n_mais_1_suspeitas Consultas repetidas numa mesma requisição (possível N+1).',
+                       '# TYPE quiz_n_mais_1_suspeitas gauge']
+            suspeitas = Counter(endpoint for endpoint, _ in self.n_mais_1)
+            for endpoint, total in sorted(suspeitas.items()):
+                linhas.append(f'quiz_n_mais_1_suspeitas{{endpoint="{endpoint}"}} {total}')
+        return '\n'.join(linhas) + '\n'
+
+def _linhas_histograma(nome, endpoint, hist):
+    linhas = []
+    for limite, acumulado in hist.acumulado():
+        le = '+Inf' if limite == float('inf') else repr(limite)
+        linhas.append(f'{nome}_bucket{{endpoint="{endpoint}",le="{le}"}} {acumulado}')
+    linhas.append(f'{nome}_sum{{endpoint="{endpoint}"}} {hist.soma:.6f}')
+    linhas.append(f'{nome}_count{{endpoint="{endpoint}"}} {hist.total}')
+    return linhas
@@ -0,0 +1,231 @@
+# Migrações versionadas do esquema do banco de dados.
+#
+# Substitui o antigo "drop_all() + create_all()": cada migração roda uma única vez,
+# em ordem, e fica registrada na tabela 'schema_versao'. Para aplicar as pendentes:
+#
+#     python migracoes.py             -> aplica as migrações pendentes
+#     python migracoes.py --explicar  -> mostra o plano das consultas mais usadas
+
+import sys
+from datetime import date, datetime
+
+import sqlalchemy as sa
+
+from app import app, db, cache, Pergunta, Resposta, pergunta_departamento_association, reconstruir_placares, reconstruir_resumos_diarios
+
+tabela_versao = sa.Table('schema_versao', sa.MetaData(),
+    sa.Column('versao', sa.Integer, primary_key=True),
+    sa.Column('descricao', sa.String(200), nullable=False),
+    sa.Column('aplicada_em', sa.DateTime, nullable=False)
+)
+
+MIGRACOES = []
+
+def migracao(versao, descricao):
+    """Registra uma função como a migração de número 'versao'."""
+    def decorator(funcao):
+        MIGRACOES.append((versao, descricao, funcao))
+        MIGRACOES.sort(key=lambda m: m[0])
+        return funcao
+    return decorator
+
+# --- FUNÇÕES AUXILIARES ---
+def _criar_tabela(conn, nome):
+    db.metadata.tables[nome].create(conn, checkfirst=True)
+
+def _indices_existentes(conn, tabela):
+    return {indice['name'] for indice in sa.inspect(conn).get_indexes(tabela)}
+
+def _criar_indice(conn, tabela, nome):
+    """Cria o índice declarado no modelo, caso ainda não exista no banco."""
+    if nome in _indices_existentes(conn, tabela):
+        return
+    indice = next(i for i in db.metadata.tables[tabela].indexes if i.name == nome)
+    indice.create(conn)
+
+def _recriar_tabela_sqlite(conn, nome):
+    """SQLite não altera colunas: recria a tabela como está no modelo e copia as linhas."""
+    colunas_antigas = {c['name'] for c in sa.inspect(conn).get_columns(nome)}
+    for indice in _indices_existentes(conn, nome):
+        conn.execute(sa.text(f'DROP INDEX {indice}'))
+    conn.execute(sa.text(f'ALTER TABLE {nome} RENAME TO {nome}_antiga'))
+    db.metadata.tables[nome].create(conn)
+    colunas = ', '.join(c.name for c in db.metadata.tables[nome].columns if c.name in colunas_antigas)
+    conn.execute(sa.text(f'INSERT INTO {nome} ({colunas}) SELECT {colunas} FROM {nome}_antiga'))
+    conn.execute(sa.text(f'DROP TABLE {nome}_antiga'))
+
+def _remover_indice(conn, tabela, nome, *colunas):
+    if nome not in _indices_existentes(conn, tabela):
+        return
+    t = db.metadata.tables[tabela]
+    sa.Index(nome, *[t.c[c] for c in colunas]).drop(conn)
+
+# --- MIGRAÇÕES ---
+@migracao(1, 'Esquema inicial')
+def _esquema_inicial(conn):
+    # Bancos criados com o antigo create_all() já têm estas tabelas; nada é recriado.
+    for nome in ['departamento', 'usuario', 'pergunta', 'pergunta_departamento', 'resposta']:
+        _criar_tabela(conn, nome)
+
+@migracao(2, 'Índices das tabelas mais consultadas e resposta única por usuário/pergunta')
+def _indices_tabelas_quentes(conn):
+    # Remove respostas duplicadas (duplo clique, POST reenviado), mantendo a primeira
+    conn.execute(sa.text(
+        "DELETE FROM resposta WHERE id NOT IN ("
+        "SELECT id FROM (SELECT MIN(id) AS id FROM resposta GROUP BY usuario_id, pergunta_id) AS manter)"
+    ))
+    _criar_indice(conn, 'resposta', 'uq_resposta_usuario_pergunta')
+    _remover_indice(conn, 'resposta', 'ix_resposta_usuario_pergunta', 'usuario_id', 'pergunta_id')
+    _criar_indice(conn, 'resposta', 'ix_resposta_pergunta')
+    _criar_indice(conn, 'resposta', 'ix_resposta_status_data')
+    _criar_indice(conn, 'pergunta', 'ix_pergunta_tipo_data')
+    _criar_indice(conn, 'pergunta_departamento', 'ix_pergunta_departamento_departamento')
+    _criar_indice(conn, 'usuario', 'ix_usuario_departamento_id')
+
+@migracao(3, 'Tabelas de placar do ranking por usuário e por setor')
+def _placar_ranking(conn):
+    _criar_tabela(conn, 'pontuacao_usuario')
+    _criar_tabela(conn, 'pontuacao_departamento')
+    reconstruir_placares(conn)
+
+@migracao(4, 'Fila de tarefas em segundo plano')
+def _fila_tarefas(conn):
+    _criar_tabela(conn, 'tarefa')
+
+@migracao(5, 'Controle de notificações enviadas e e-mails com falha')
+def _controle_notificacoes(conn):
+    _criar_tabela(conn, 'notificacao_enviada')
+    _criar_tabela(conn, 'notificacao_falha')
+
+@migracao(6, 'Área temporária das pré-visualizações de importação')
+def _previa_importacao(conn):
+    _criar_tabela(conn, 'importacao_planilha')
+    _criar_tabela(conn, 'linha_importacao_planilha')
+
+@migracao(7, 'Índices da paginação por chave (perguntas, usuários e respostas)')
+def _indices_paginacao(conn):
+    _criar_indice(conn, 'pergunta', 'ix_pergunta_data_id')
+    _criar_indice(conn, 'usuario', 'ix_usuario_nome_id')
+    _criar_indice(conn, 'resposta', 'ix_resposta_usuario_data')
+
+@migracao(8, 'Resumo diário por usuário para o relatório de desempenho')
+def _resumo_diario(conn):
+    _criar_tabela(conn, 'resumo_diario_usuario')
+    reconstruir_resumos_diarios(conn)
+
+@migracao(9, 'Primeira entrega de cada pergunta do quiz a cada usuário (cronômetro)')
+def _entrega_pergunta(conn):
+    _criar_tabela(conn, 'entrega_pergunta')
+
+@migracao(10, 'Data obrigatória nas respostas (a paginação por chave não pula as sem data)')
+def _data_resposta_obrigatoria(conn):
+    # Respostas antigas sem data recebem a da liberação da pergunta
+    r = Resposta.__table__
+    sem_data = conn.execute(sa.select(r.c.id, Pergunta.data_liberacao).join(Pergunta, r.c.pergunta_id == Pergunta.id)
+                            .where(r.c.data_resposta.is_(None))).all()
+    if sem_data:
+        conn.execute(r.update().where(r.c.id == sa.bindparam('b_id')).values(data_resposta=sa.bindparam('b_data')),
+                     [{'b_id': id_, 'b_data': datetime.combine(dia, datetime.min.time())} for id_, dia in sem_data])
+        reconstruir_resumos_diarios(conn)
+    coluna = next(c for c in sa.inspect(conn).get_columns('resposta') if c['name'] == 'data_resposta')
+    if not coluna['nullable']:
+        return
+    if conn.dialect.name == 'postgresql':
+        conn.execute(sa.text('ALTER TABLE resposta ALTER COLUMN data_resposta SET NOT NULL'))
+    elif conn.dialect.name == 'mysql':
+        conn.execute(sa.text('ALTER TABLE resposta MODIFY data_resposta DATETIME NOT NULL'))
+    else:
+        _recriar_tabela_sqlite(conn, 'resposta')
+
+# --- EXECUÇÃO ---
+def versao_atual(conn):
+    if not sa.inspect(conn).has_table('schema_versao'):
+        return 0
+    return conn.execute(sa.select(sa.func.coalesce(sa.func.max(tabela_versao.c.versao), 0))).scalar()
+
+def aplicar_migracoes():
+    """Aplica, cada uma em sua própria transação, as migrações ainda não registradas.
+
+    Retorna a lista de (versao, descricao) aplicadas nesta execução.
+    """
+    with app.app_context():
+        with db.engine.begin() as conn:
+            tabela_versao.create(conn, checkfirst=True)
+            versao = versao_atual(conn)
+
+        aplicadas = []
+        for numero, descricao, funcao in MIGRACOES:
+            if numero <= versao:
+                continue
+            with db.engine.begin() as conn:
+                app.logger.info(f"Aplicando migração {numero}: {descricao}")
+                funcao(conn)
+                conn.execute(tabela_versao.insert().values(versao=numero, descricao=descricao, aplicada_em=datetime.utcnow()))
+            _invalidar_cache()
+            aplicadas.append((numero, descricao))
+        return aplicadas
+
+def _invalidar_cache():
+    # As migrações escrevem por uma conexão direta (reconstruções, SQL puro), que a sessão não
+    # acompanha: as tags de todas as tabelas são invalidadas aqui, depois do commit
+    cache.invalidar(*db.metadata.tables)
+
+def resetar_banco():
+    """Apaga todas as tabelas e recria o esquema do zero pelas migrações."""
+    with app.app_context():
+        db.drop_all()
+        with db.engine.begin() as conn:
+            tabela_versao.drop(conn, checkfirst=True)
+        _invalidar_cache()
+    return aplicar_migracoes()
+
+# --- VERIFICAÇÃO DOS PLANOS DE EXECUÇÃO ---
+def _consultas_quentes():
+    """Consultas das rotas mais acessadas e o índice que cada uma deve usar."""
+    hoje = date.today()
+    t = pergunta_departamento_association
+    return [
+        ('perguntas já respondidas pelo usuário (/dashboard, /quiz)', 'uq_resposta_usuario_pergunta',
+            db.session.query(Resposta.pergunta_id).filter(Resposta.usuario_id == 1)),
+        ('perguntas do setor', 'ix_pergunta_departamento_departamento',
+            db.session.query(t.c.pergunta_id).filter(t.c.departamento_id == 1)),
+        ('atividades discursivas liberadas', 'ix_pergunta_tipo_data',
+            db.session.query(Pergunta.id).filter(Pergunta.tipo == 'discursiva', Pergunta.data_liberacao <= hoje)),
+        ('correções pendentes', 'ix_resposta_status_data',
+            db.session.query(Resposta.id).filter(Resposta.status_correcao == 'pendente').order_by(Resposta.data_resposta.desc())),
+        ('respostas de uma pergunta', 'ix_resposta_pergunta',
+            db.session.query(Resposta.id).filter(Resposta.pergunta_id == 1)),
+        ('minhas respostas, uma página', 'ix_resposta_usuario_data',
+            db.session.query(Resposta.id).filter(Resposta.usuario_id == 1).order_by(Resposta.data_resposta.desc(), Resposta.id.desc()).limit(51)),
+        ('perguntas do admin, uma página', 'ix_pergunta_data_id',
+            db.session.query(Pergunta.id).order_by(Pergunta.data_liberacao.desc(), Pergunta.id.desc()).limit(51)),
+    ]
+
+def explicar_consultas_quentes():
+    """Roda EXPLAIN (SQLite, PostgreSQL ou MySQL) nas consultas quentes.
+
+    Retorna uma lista de (nome, índice esperado, índice usado?, linhas do plano).
+    """
+    resultados = []
+    with app.app_context():
+        dialeto = db.engine.dialect.name
+        prefixo = 'EXPLAIN QUERY PLAN' if dialeto == 'sqlite' else 'EXPLAIN'
+        for nome, indice, query in _consultas_quentes():
+            sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+            linhas = [' '.join(str(c) for c in linha) for linha in db.session.execute(sa.text(f'{prefixo} {sql}'))]
+            resultados.append((nome, indice, any(indice in linha for linha in linhas), linhas))
+    return resultados
+
+if __name__ == '__main__':
+    if '--explicar' in sys.argv:
+        resultados = explicar_consultas_quentes()
+        for nome, indice, usado, linhas in resultados:
+            print(f"[{'OK' if usado else 'FALHA'}] {nome} -> {indice}")
+            for linha in linhas:
+                print(f"    {linha}")
+        sys.exit(0 if all(usado for _, _, usado, _ in resultados) else 1)
+
+    aplicadas = aplicar_migracoes()
+    for numero, descricao in aplicadas:
+        print(f"Migração {numero} aplicada: {descricao}")
+    print("Banco de dados atualizado." if aplicadas else "Nenhuma migração pendente.")
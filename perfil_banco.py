@@ -0,0 +1,94 @@
+# Perfil das conexões com o banco de dados, ajustado ao tipo de banco e ao modelo de workers do gunicorn.
+#
+#     SQLite      -> WAL, synchronous=NORMAL e busy_timeout: leitores não bloqueiam o escritor e
+#                    escritas simultâneas esperam a vez em vez de falhar com "database is locked"
+#     MySQL       -> pool com pre-ping e reciclagem antes do servidor derrubar conexões ociosas
+#                    (PythonAnywhere: 300 s); max_execution_time nas consultas
+#     PostgreSQL  -> pool com pre-ping; statement_timeout
+#
+# Cada worker do gunicorn tem o seu pool: workers x (BD_POOL_TAMANHO + BD_POOL_EXCEDENTE) precisa
+# caber no limite de conexões do banco. BD_POOL_TAMANHO deve cobrir as threads de cada worker
+# mais as threads de arquivos (THREADS_DE_ARQUIVOS).
+#
+# Em workers gevent (gunicorn.conf.py) o driver precisa ceder a vez enquanto espera o banco:
+# o mysql-connector passa a usar a implementação em Python puro (sockets do gevent) e o
+# psycopg2 usa o psycogreen, se instalado (pip install psycogreen). Sem isso cada consulta
+# trava o worker inteiro. BD_POOL_TAMANHO passa a limitar quantos greenlets usam o banco juntos.
+#
+# Variáveis de ambiente (todas opcionais):
+#     BD_POOL_TAMANHO=5  BD_POOL_EXCEDENTE=5  BD_POOL_ESPERA=30  BD_POOL_RECICLAR=280
+#     BD_TIMEOUT_CONSULTA_MS=30000 (0 desliga)  BD_SQLITE_ESPERA_MS=30000
+
+import logging
+import os
+import sys
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+def _inteiro(nome, padrao):
+    return int(os.environ.get(nome, padrao))
+
+def gevent_ativo():
+    """True dentro de um worker gevent (sockets já trocados pelos cooperativos)."""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
+
+def _psycopg2_cooperativo():
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        logging.getLogger(__name__).warning(
+            "Worker gevent com PostgreSQL sem o psycogreen: cada consulta bloqueia o worker inteiro.")
+        return
+    patch_psycopg()
+
+def opcoes_engine(uri):
+    """Valor para app.config['SQLALCHEMY_ENGINE_OPTIONS'], conforme o banco da URI."""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend == 'sqlite':
+        # O pool padrão do SQLAlchemy já serve ao SQLite; o resto é feito a cada conexão
+        return {}
+
+    opcoes = {
+        'pool_pre_ping': True, # descarta conexões derrubadas pelo servidor antes de usá-las
+        'pool_size': _inteiro('BD_POOL_TAMANHO', 5),
+        'max_overflow': _inteiro('BD_POOL_EXCEDENTE', 5),
+        'pool_timeout': _inteiro('BD_POOL_ESPERA', 30),
+        'pool_recycle': _inteiro('BD_POOL_RECICLAR', 280),
+    }
+    connect_args = {}
+    timeout_ms = _inteiro('BD_TIMEOUT_CONSULTA_MS', 30000)
+    if backend == 'postgresql' and timeout_ms:
+        # Vale para a sessão inteira (um SET na conexão seria desfeito pelo rollback do pool)
+        connect_args['options'] = f'-c statement_timeout={timeout_ms}'
+    if gevent_ativo():
+        if url.get_driver_name() == 'mysqlconnector':
+            connect_args['use_pure'] = True # a extensão em C não passa pelos sockets do gevent
+        elif url.get_driver_name() == 'psycopg2':
+            _psycopg2_cooperativo()
+    if connect_args:
+        opcoes['connect_args'] = connect_args
+    return opcoes
+
+def configurar_conexoes(engine):
+    """Ajustes feitos em cada nova conexão física do engine."""
+    backend = engine.dialect.name
+    timeout_ms = _inteiro('BD_TIMEOUT_CONSULTA_MS', 30000)
+    espera_sqlite_ms = _inteiro('BD_SQLITE_ESPERA_MS', 30000)
+
+    @event.listens_for(engine, 'connect')
+    def _ao_conectar(conexao_dbapi, registro):
+        cursor = conexao_dbapi.cursor()
+        try:
+            if backend == 'sqlite':
+                if engine.url.database not in (None, '', ':memory:'):
+                    cursor.execute('PRAGMA journal_mode=WAL')
+                    cursor.execute('PRAGMA synchronous=NORMAL')
+                cursor.execute(f'PRAGMA busy_timeout={espera_sqlite_ms}')
+            elif backend == 'mysql' and timeout_ms:
+                # Só limita SELECTs (MySQL 5.7.8+); sem efeito nas escritas
+                cursor.execute(f'SET SESSION max_execution_time={timeout_ms}')
+        finally:
+            cursor.close()
@@ -0,0 +1,22 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const alerts = document.querySelectorAll('.alert');
+
+    alerts.forEach(function(alert) {
+        // Define um tempo para o alerta desaparecer
+        const autoDismiss = setTimeout(function() {
+            alert.classList.add('fade-out');
+            // Remove o elemento da tela após a animação
+            setTimeout(() => { alert.style.display = 'none'; }, 500);
+        }, 5000); // 5000 milissegundos = 5 segundos
+
+        // Permite fechar clicando no 'x'
+        const closeButton = alert.querySelector('.close-alert-btn');
+        if (closeButton) {
+            closeButton.addEventListener('click', function() {
+                clearTimeout(autoDismiss); // Cancela o desaparecimento automático
+                alert.classList.add('fade-out');
+                setTimeout(() => { alert.style.display = 'none'; }, 500);
+            });
+        }
+    });
+});
@@ -0,0 +1,129 @@
+const timerElement = document.getElementById('timer');
+const formElement = document.getElementById('quiz-form');
+const textoElement = document.getElementById('texto-pergunta');
+const opcoesElement = document.getElementById('opcoes');
+const perguntaIdInput = document.getElementById('pergunta_id');
+const tokenInput = document.getElementById('token');
+const tickSound = document.getElementById('tick-sound');
+const buzzerSound = document.getElementById('buzzer-sound');
+
+const urlQuiz = formElement.dataset.urlQuiz;
+const urlRespostas = formElement.dataset.urlRespostas;
+
+// Sem fetch, o formulário é enviado normalmente (POST /responder e redirect para /quiz).
+// O tempo que vale para os pontos é medido no servidor, a partir do token da pergunta;
+// o cronômetro da tela é só para o usuário.
+const usarApi = !!window.fetch;
+let timeLeft = 0;
+let timerInterval = null;
+let respondida = false;
+
+function iniciarTimer(tempoLimite) {
+    timeLeft = parseInt(tempoLimite);
+    timerElement.textContent = timeLeft;
+    timerInterval = setInterval(() => {
+        timeLeft--;
+        timerElement.textContent = timeLeft;
+
+        if (timeLeft > 0 && tickSound) {
+            tickSound.currentTime = 0;
+            tickSound.play().catch(e => console.log("Erro ao tocar som de tick:", e));
+        }
+
+        if (timeLeft <= 0) {
+            pararTimer();
+
+            timerElement.textContent = "Esgotado!";
+            if (buzzerSound) {
+                buzzerSound.play().catch(e => console.log("Erro ao tocar som de buzzer:", e));
+            }
+
+            document.querySelectorAll('#quiz-form button').forEach(button => {
+                button.disabled = true;
+            });
+
+            setTimeout(() => {
+                if (usarApi) responder('');
+                else formElement.submit();
+            }, 1200);
+        }
+    }, 1000);
+}
+
+function pararTimer() {
+    clearInterval(timerInterval);
+    if (tickSound) tickSound.pause();
+}
+
+function mostrarAlerta(mensagem, categoria) {
+    const alerta = document.createElement('div');
+    alerta.className = 'alert alert-' + categoria;
+    alerta.textContent = mensagem;
+    document.querySelector('.alert-container').appendChild(alerta);
+    setTimeout(() => {
+        alerta.classList.add('fade-out');
+        setTimeout(() => alerta.remove(), 500);
+    }, 3000);
+}
+
+function botao(valor, rotulo, texto) {
+    const b = document.createElement('button');
+    b.type = 'submit';
+    b.name = 'resposta';
+    b.value = valor;
+    b.className = 'option-btn';
+    if (rotulo) {
+        const negrito = document.createElement('b');
+        negrito.textContent = rotulo;
+        b.appendChild(negrito);
+        b.appendChild(document.createTextNode(' ' + texto));
+    } else {
+        b.textContent = texto;
+    }
+    return b;
+}
+
+function mostrarPergunta(p) {
+    perguntaIdInput.value = p.id;
+    tokenInput.value = p.token;
+    textoElement.textContent = p.texto;
+    opcoesElement.replaceChildren(...(p.tipo === 'multipla_escolha'
+        ? ['a', 'b', 'c', 'd'].map(l => botao(l, l.toUpperCase() + ')', p.opcoes[l]))
+        : [botao('v', null, '✔️ Verdadeiro'), botao('f', null, '❌ Falso')]));
+    respondida = false;
+    iniciarTimer(p.tempo_restante);
+}
+
+function responder(resposta) {
+    if (respondida) return;
+    respondida = true;
+    pararTimer();
+    document.querySelectorAll('#quiz-form button').forEach(button => { button.disabled = true; });
+    // A resposta volta com a próxima pergunta (e o token dela): uma ida e volta por pergunta
+    fetch(urlRespostas, {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({pergunta_id: parseInt(perguntaIdInput.value), resposta: resposta, token: tokenInput.value}),
+    }).then(r => r.json().then(dados => {
+        if (r.status === 201) {
+            if (dados.correta) mostrarAlerta(`Resposta correta! Você ganhou ${dados.pontos} pontos.`, 'success');
+            else mostrarAlerta('Resposta incorreta. Sem pontos desta vez.', 'danger');
+        } else if (r.status === 409) {
+            mostrarAlerta(dados.erro, 'warning');
+        } else {
+            return Promise.reject(r.status);
+        }
+        if (dados.proxima) mostrarPergunta(dados.proxima);
+        else window.location = urlQuiz; // acabou: o /quiz mostra a mensagem de fim
+    })).catch(() => { window.location = urlQuiz; }); // sessão expirada ou falha de rede: volta ao fluxo normal
+}
+
+formElement.addEventListener('submit', (evento) => {
+    pararTimer();
+    if (!usarApi) return;
+    evento.preventDefault();
+    responder(evento.submitter ? evento.submitter.value : '');
+});
+
+iniciarTimer(timerElement.textContent);
@@ -0,0 +1,105 @@
+# Configuração comum dos testes (pytest). Cada teste recebe um banco SQLite temporário vazio,
+# recriado pelas migrações, e o cache desligado: nada do quiz.db nem do instance/ é tocado.
+#
+#     python -m pytest -q
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+
+# O app lê o banco e o cache das variáveis de ambiente ao ser importado: elas vêm antes do import
+PASTA_TEMPORARIA = tempfile.mkdtemp(prefix='quiz-testes-')
+os.environ['DATABASE_URL_PYTHONANYWHERE'] = 'sqlite:///' + os.path.join(PASTA_TEMPORARIA, 'quiz.db')
+os.environ['CACHE'] = 'desligado'
+os.environ['JINJA_CACHE'] = ''
+os.environ.pop('TAREFAS_EM_SEGUNDO_PLANO', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import (app as aplicacao, db, Departamento, Usuario, Pergunta, PontuacaoUsuario, PontuacaoDepartamento,
+                 ResumoDiarioUsuario, reconstruir_placares, reconstruir_resumos_diarios)
+from migracoes import resetar_banco
+
+def recriar_banco():
+    """Apaga tudo e recria o esquema pelas migrações (que também invalidam as tags do cache)."""
+    resetar_banco()
+
+@pytest.fixture
+def app():
+    aplicacao.config.update(TESTING=True)
+    recriar_banco()
+    with aplicacao.app_context():
+        yield aplicacao
+        db.session.remove()
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
+
+def entrar_como_admin(cliente):
+    with cliente.session_transaction() as sessao:
+        sessao['admin_logged_in'] = True
+
+def entrar_como_usuario(cliente, usuario):
+    with cliente.session_transaction() as sessao:
+        sessao['usuario_id'], sessao['usuario_nome'] = usuario.id, usuario.nome
+
+@contextmanager
+def contar_consultas():
+    """Conta as instruções SQL enviadas ao banco dentro do bloco: 'with contar_consultas() as consultas: ...; len(consultas)'."""
+    consultas = []
+    def _registrar(conexao, cursor, instrucao, parametros, contexto, executemany):
+        consultas.append(instrucao)
+    with aplicacao.app_context():
+        motor = db.engine
+    event.listen(motor, 'before_cursor_execute', _registrar)
+    try:
+        yield consultas
+    finally:
+        event.remove(motor, 'before_cursor_execute', _registrar)
+
+def criar_massa(setores=3, usuarios_por_setor=4, objetivas=10, discursivas=3):
+    """Setores, usuários e perguntas liberadas hoje para todos; devolve (ids dos usuários, ids das objetivas, ids das discursivas)."""
+    usuarios = []
+    for s in range(setores):
+        departamento = Departamento(nome=f'Setor {s + 1}')
+        db.session.add(departamento)
+        for u in range(usuarios_por_setor):
+            numero = s * usuarios_por_setor + u
+            usuarios.append(Usuario(nome=f'Colaborador {numero + 1}', codigo_acesso=f'{numero:04d}', departamento=departamento))
+    db.session.add_all(usuarios)
+    perguntas_objetivas = [Pergunta(tipo='multipla_escolha', texto=f'Objetiva {i + 1}', opcao_a='A', opcao_b='B', opcao_c='C', opcao_d='D',
+                                    resposta_correta='abcd'[i % 4], data_liberacao=date.today(), tempo_limite=30, para_todos_setores=True)
+                           for i in range(objetivas)]
+    perguntas_discursivas = [Pergunta(tipo='discursiva', texto=f'Discursiva {i + 1}', data_liberacao=date.today(), para_todos_setores=True)
+                             for i in range(discursivas)]
+    db.session.add_all(perguntas_objetivas + perguntas_discursivas)
+    db.session.flush()
+    reconstruir_placares()
+    db.session.commit()
+    return [u.id for u in usuarios], [p.id for p in perguntas_objetivas], [p.id for p in perguntas_discursivas]
+
+def estado_dos_placares():
+    """Conteúdo das tabelas de placar e do resumo diário, ordenado, para comparar com a reconstrução."""
+    db.session.expire_all()
+    return {
+        'usuarios': sorted(db.session.query(PontuacaoUsuario.usuario_id, PontuacaoUsuario.pontos_totais,
+                                            PontuacaoUsuario.total_respostas, PontuacaoUsuario.total_acertos).all()),
+        'setores': sorted(db.session.query(PontuacaoDepartamento.departamento_id, PontuacaoDepartamento.pontos_totais,
+                                           PontuacaoDepartamento.num_usuarios).all()),
+        'resumo_diario': sorted(db.session.query(ResumoDiarioUsuario.usuario_id, ResumoDiarioUsuario.dia, ResumoDiarioUsuario.respostas,
+                                                 ResumoDiarioUsuario.corretas, ResumoDiarioUsuario.pontos).all()),
+    }
+
+def estado_reconstruido():
+    """O que as tabelas de placar deveriam conter, recalculado a partir das respostas (sem gravar)."""
+    reconstruir_placares()
+    reconstruir_resumos_diarios()
+    esperado = estado_dos_placares()
+    db.session.rollback()
+    return esperado
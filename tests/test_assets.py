@@ -0,0 +1,80 @@
+# Arquivos estáticos: nomes com hash pelo manifesto, versões pré-comprimidas com cache imutável
+# e o corte do tick.mp3 na fronteira de um quadro.
+
+import gzip
+import os
+
+import pytest
+
+import app as modulo_app
+import construir_assets
+from app import url_asset
+from construir_assets import cortar_mp3
+
+# MPEG-1 Layer III, 128 kbit/s, 44,1 kHz: 144 * 128000 // 44100 = 417 bytes por quadro (+1 com padding)
+CABECALHO = bytes([0xFF, 0xFB, 0x90, 0x64])
+CABECALHO_COM_PADDING = bytes([0xFF, 0xFB, 0x92, 0x64])
+QUADROS_POR_SEGUNDO = 44100 / 1152
+
+def _mp3(quadros):
+    """Tag ID3v2 de 20 bytes e 'quadros' quadros, um sim, um não com padding; devolve (dados, fim de cada quadro)."""
+    dados = bytearray(b'ID3\x03\x00\x00\x00\x00\x00\x14' + bytes(20))
+    fins = []
+    for i in range(quadros):
+        cabecalho = CABECALHO_COM_PADDING if i % 2 else CABECALHO
+        dados += cabecalho + bytes([i % 256]) * (417 + i % 2 - 4)
+        fins.append(len(dados))
+    return bytes(dados), fins
+
+def test_cortar_mp3_na_fronteira_do_quadro():
+    dados, fins = _mp3(100)
+    cortado = cortar_mp3(dados, 1.0)
+    # 1 s pede 39 quadros (38,3 arredondado para cima), inteiros, com a tag ID3 na frente
+    assert len(cortado) == fins[38]
+    assert cortado == dados[:fins[38]]
+    assert 38 / QUADROS_POR_SEGUNDO < 1.0 <= 39 / QUADROS_POR_SEGUNDO
+    assert cortar_mp3(dados, 10.0) == dados # mais curto que o pedido: inteiro
+    assert cortar_mp3(b'RIFF' + bytes(1000), 1.0) == b'RIFF' + bytes(1000) # não é MP3: sem mudança
+
+def test_tick_do_quiz_cortado_em_um_segundo():
+    with open(os.path.join(construir_assets.PASTA_STATIC, 'sounds', 'tick.mp3'), 'rb') as arquivo:
+        original = arquivo.read()
+    cortado = cortar_mp3(original, 1.0)
+    assert len(cortado) < len(original) and original.startswith(cortado)
+    # O corte cai no início de um quadro: depois dele vem um cabeçalho válido
+    assert original[len(cortado):len(cortado) + 2] in (b'\xff\xfb', b'\xff\xfa')
+
+@pytest.fixture
+def assets_construidos(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(construir_assets, 'PASTA_DIST', str(tmp_path))
+    construir_assets.construir()
+    monkeypatch.setattr(modulo_app, 'PASTA_ASSETS', str(tmp_path))
+    monkeypatch.setattr(modulo_app, 'manifesto_assets', modulo_app._carregar_manifesto_assets())
+    return tmp_path
+
+def test_url_asset_sem_manifesto_usa_o_original(app, monkeypatch):
+    monkeypatch.setattr(modulo_app, 'manifesto_assets', {})
+    with app.test_request_context():
+        assert url_asset('js/quiz.js') == '/static/js/quiz.js'
+
+def test_asset_com_hash_comprimido_e_imutavel(app, cliente, assets_construidos):
+    with open(os.path.join(construir_assets.PASTA_STATIC, 'js', 'quiz.js'), 'rb') as arquivo:
+        original = arquivo.read()
+    with app.test_request_context():
+        url = url_asset('js/quiz.js')
+    assert url.startswith('/static/dist/js/quiz.') and url.endswith('.js') and url != '/static/dist/js/quiz.js'
+
+    comprimido = cliente.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert comprimido.status_code == 200
+    assert comprimido.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in comprimido.headers['Cache-Control'] and 'max-age=31536000' in comprimido.headers['Cache-Control']
+    assert 'Accept-Encoding' in comprimido.headers['Vary']
+    assert comprimido.mimetype in ('text/javascript', 'application/javascript')
+    assert gzip.decompress(comprimido.data) == original
+
+    sem_compressao = cliente.get(url)
+    assert 'Content-Encoding' not in sem_compressao.headers
+    assert sem_compressao.data == original
+
+    # Conteúdo novo, nome novo: o arquivo guardado pelo navegador nunca fica velho
+    assert construir_assets._nome_com_hash('js/quiz.js', original + b'\n') != url.split('/static/dist/')[1]
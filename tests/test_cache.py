@@ -0,0 +1,48 @@
+# Cache com tags por tabela: páginas prontas com ETag/304 e invalidação automática no commit.
+
+import pytest
+
+from app import db, cache, Usuario, Departamento, emitir_token_pergunta, _lista_departamentos
+from cache import CacheMemoria
+from conftest import contar_consultas, criar_massa, entrar_como_usuario
+
+@pytest.fixture
+def cache_ligado(app, monkeypatch):
+    # Os testes rodam com CACHE=desligado; aqui o mesmo objeto passa a guardar em memória
+    monkeypatch.setattr(cache, 'backend', CacheMemoria())
+
+def test_dados_em_cache_mudam_no_commit_da_tabela(app, cache_ligado):
+    criar_massa(setores=2, usuarios_por_setor=1, objetivas=0, discursivas=0)
+    assert [d['nome'] for d in _lista_departamentos()] == ['Setor 1', 'Setor 2']
+    with contar_consultas() as consultas:
+        _lista_departamentos()
+    assert consultas == [] # segunda leitura: do cache
+
+    db.session.add(Departamento(nome='Setor 3'))
+    db.session.flush()
+    assert len(_lista_departamentos()) == 2 # antes do commit, outros ainda veem a versão anterior
+    db.session.commit()
+    assert [d['nome'] for d in _lista_departamentos()] == ['Setor 1', 'Setor 2', 'Setor 3']
+
+def test_pagina_em_cache_com_etag(app, cliente, cache_ligado):
+    usuario_ids, objetivas, _ = criar_massa(setores=2, usuarios_por_setor=1, objetivas=1, discursivas=0)
+    entrar_como_usuario(cliente, db.session.get(Usuario, usuario_ids[0]))
+
+    primeira = cliente.get('/ranking')
+    etag = primeira.headers['ETag']
+    assert primeira.status_code == 200 and primeira.headers['Cache-Control'] == 'private, no-cache'
+    with contar_consultas() as consultas:
+        segunda = cliente.get('/ranking')
+    assert consultas == [] and segunda.data == primeira.data and segunda.headers['ETag'] == etag
+
+    # Quem já tem a versão atual recebe 304, sem corpo
+    revalidada = cliente.get('/ranking', headers={'If-None-Match': etag})
+    assert revalidada.status_code == 304 and revalidada.data == b''
+
+    # Uma resposta muda o placar: ETag novo e a página com os pontos
+    cliente.post('/responder', data={'pergunta_id': objetivas[0], 'resposta': 'a',
+                                     'token': emitir_token_pergunta(objetivas[0], usuario_ids[0])})
+    cliente.get('/dashboard') # consome a mensagem flash da resposta
+    atualizada = cliente.get('/ranking', headers={'If-None-Match': etag})
+    assert atualizada.status_code == 200 and atualizada.headers['ETag'] != etag
+    assert atualizada.data != primeira.data
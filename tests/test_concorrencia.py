@@ -0,0 +1,72 @@
+# Carga concorrente no SQLite temporário (WAL e busy_timeout do perfil_banco.py): usuários
+# respondendo o quiz e as atividades enquanto o admin corrige em lote. Nenhuma requisição pode
+# falhar com "database is locked" e, no fim, placar e resumo diário têm de bater com a
+# reconstrução a partir das respostas: nada contado duas vezes, nada perdido.
+
+import random
+import threading
+
+from app import db, Usuario, Resposta
+from conftest import criar_massa, entrar_como_admin, entrar_como_usuario, estado_dos_placares, estado_reconstruido
+
+RODADAS_FINAIS = 5 # correções depois que todas as respostas chegaram
+
+def _em_paralelo(funcoes):
+    """Roda as funções em threads, todas liberadas ao mesmo tempo; devolve as exceções levantadas."""
+    largada = threading.Barrier(len(funcoes))
+    erros = []
+    def _rodar(funcao):
+        largada.wait()
+        try:
+            funcao()
+        except Exception as e:
+            erros.append(e)
+    threads = [threading.Thread(target=_rodar, args=(funcao,)) for funcao in funcoes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return erros
+
+def test_respostas_e_correcoes_simultaneas_mantem_o_placar(app):
+    usuario_ids, objetivas, discursivas = criar_massa(setores=3, usuarios_por_setor=4, objetivas=10, discursivas=3)
+    correcoes_feitas = []
+
+    def _usuario(usuario_id):
+        cliente = app.test_client()
+        with app.app_context():
+            entrar_como_usuario(cliente, db.session.get(Usuario, usuario_id))
+        sorteio = random.Random(usuario_id)
+        for pergunta_id in objetivas:
+            resposta = cliente.post('/responder', data={'pergunta_id': pergunta_id, 'resposta': sorteio.choice('abcd')})
+            assert resposta.status_code == 302, resposta.status_code
+        for pergunta_id in discursivas:
+            resposta = cliente.post(f'/atividade/{pergunta_id}', data={'texto_discursivo': 'Minha resposta.'})
+            assert resposta.status_code == 302, resposta.status_code
+
+    def _admin():
+        cliente = app.test_client()
+        entrar_como_admin(cliente)
+        sorteio = random.Random(0)
+        esperadas = len(usuario_ids) * len(discursivas)
+        rodadas_com_todas = 0
+        # Corrige (e recorrige) o que já chegou enquanto os usuários respondem, e mais algumas vezes no fim
+        while rodadas_com_todas < RODADAS_FINAIS:
+            with app.app_context():
+                ids = list(db.session.scalars(db.select(Resposta.id).where(Resposta.pergunta_id.in_(discursivas))))
+            if len(ids) == esperadas:
+                rodadas_com_todas += 1
+            if not ids:
+                continue
+            lote = sorteio.sample(ids, min(len(ids), 8))
+            correcoes = [{'resposta_id': i, 'status': sorteio.choice(['correto', 'parcialmente_correto', 'incorreto'])} for i in lote]
+            resposta = cliente.post('/api/admin/correcoes', json={'correcoes': correcoes})
+            assert resposta.status_code == 200, resposta.get_json()
+            correcoes_feitas.extend(c['resposta_id'] for c in correcoes)
+
+    erros = _em_paralelo([lambda u=u: _usuario(u) for u in usuario_ids] + [_admin, _admin])
+    assert not erros, erros
+    assert len(correcoes_feitas) > len(set(correcoes_feitas)), 'as correções deveriam incluir recorreções'
+
+    assert Resposta.query.count() == len(usuario_ids) * (len(objetivas) + len(discursivas))
+    assert estado_dos_placares() == estado_reconstruido()
@@ -0,0 +1,36 @@
+# Regressão de N+1: as páginas abaixo devem fazer o mesmo número de consultas com poucos ou
+# muitos dados. Se um número crescer com a massa, algum laço voltou a consultar por linha.
+
+from app import db, Usuario, Resposta
+from gerar_dados import gerar
+from conftest import contar_consultas, recriar_banco, entrar_como_admin, entrar_como_usuario
+
+# (usuarios, setores, perguntas, respostas)
+MASSA_PEQUENA = (10, 2, 20, 60)
+MASSA_GRANDE = (200, 8, 300, 6000)
+
+PAGINAS_ADMIN = ['/admin/analytics', '/admin/analytics?usuario_id={usuario_id}', '/admin/relatorios']
+PAGINAS_USUARIO = ['/dashboard', '/quiz', '/atividades', '/ranking', '/ranking/{departamento_id}']
+
+def _consultas_por_pagina(cliente, massa):
+    gerar(*massa, semente=7)
+    # O usuário com mais respostas: é o caso em que um N+1 por resposta apareceria
+    usuario = db.session.get(Usuario, db.session.query(Resposta.usuario_id).group_by(Resposta.usuario_id)
+                             .order_by(db.func.count().desc()).limit(1).scalar())
+    entrar_como_admin(cliente)
+    entrar_como_usuario(cliente, usuario)
+    contagens = {}
+    for modelo in PAGINAS_ADMIN + PAGINAS_USUARIO:
+        caminho = modelo.format(usuario_id=usuario.id, departamento_id=usuario.departamento_id)
+        cliente.get(caminho) # aquece índices em memória (visibilidade), montados uma vez por processo
+        with contar_consultas() as consultas:
+            resposta = cliente.get(caminho)
+        assert resposta.status_code in (200, 302), caminho
+        contagens[modelo] = len(consultas)
+    return contagens
+
+def test_numero_de_consultas_nao_cresce_com_os_dados(app):
+    com_poucos_dados = _consultas_por_pagina(app.test_client(), MASSA_PEQUENA)
+    recriar_banco()
+    com_muitos_dados = _consultas_por_pagina(app.test_client(), MASSA_GRANDE)
+    assert com_muitos_dados == com_poucos_dados
@@ -0,0 +1,57 @@
+# Correção em lote das atividades discursivas: página e API aplicam tudo numa transação, com um
+# UPDATE por avaliação, e o placar incremental tem de bater com reconstruir_placares().
+
+from app import db, Usuario, Resposta
+from conftest import contar_consultas, criar_massa, entrar_como_admin, entrar_como_usuario, estado_dos_placares, estado_reconstruido
+
+def _respostas_discursivas(app, usuario_ids, discursivas):
+    for usuario_id in usuario_ids:
+        cliente = app.test_client()
+        entrar_como_usuario(cliente, db.session.get(Usuario, usuario_id))
+        for pergunta_id in discursivas:
+            assert cliente.post(f'/atividade/{pergunta_id}', data={'texto_discursivo': 'Minha resposta.'}).status_code == 302
+    return list(db.session.scalars(db.select(Resposta.id).where(Resposta.pergunta_id.in_(discursivas)).order_by(Resposta.id)))
+
+def test_correcao_em_lote_pela_pagina(app, cliente):
+    usuario_ids, objetivas, discursivas = criar_massa(setores=2, usuarios_por_setor=2, objetivas=1, discursivas=2)
+    ids = _respostas_discursivas(app, usuario_ids, discursivas)
+    entrar_como_admin(cliente)
+
+    # Uma avaliação para todas as selecionadas: um UPDATE só nas respostas
+    with contar_consultas() as consultas:
+        resposta = cliente.post('/admin/correcoes/lote', data={'resposta_id': ids, 'status': 'correto', 'feedback_lote': 'Muito bem.'})
+    assert resposta.status_code == 302
+    assert len([c for c in consultas if c.lstrip().upper().startswith('UPDATE RESPOSTA')]) == 1
+
+    db.session.expire_all()
+    corrigidas = db.session.scalars(db.select(Resposta).where(Resposta.id.in_(ids))).all()
+    assert {(r.status_correcao, r.pontos, r.feedback_admin) for r in corrigidas} == {('correto', 100, 'Muito bem.')}
+    assert estado_dos_placares() == estado_reconstruido()
+
+    # Recorreção: o feedback próprio de uma resposta prevalece sobre o comum
+    cliente.post('/admin/correcoes/lote', data={'resposta_id': ids[:2], 'status': 'parcialmente_correto',
+                                                'feedback_lote': 'Incompleta.', f'feedback_{ids[0]}': 'Faltou o exemplo.'})
+    db.session.expire_all()
+    assert [(r.status_correcao, r.pontos, r.feedback_admin) for r in (db.session.get(Resposta, i) for i in ids[:3])] == [
+        ('parcialmente_correto', 50, 'Faltou o exemplo.'), ('parcialmente_correto', 50, 'Incompleta.'), ('correto', 100, 'Muito bem.')]
+    assert estado_dos_placares() == estado_reconstruido()
+
+def test_api_de_correcoes_ignora_objetivas_e_recusa_status_invalido(app, cliente):
+    usuario_ids, objetivas, discursivas = criar_massa(setores=1, usuarios_por_setor=2, objetivas=1, discursivas=1)
+    ids = _respostas_discursivas(app, usuario_ids, discursivas)
+    entrar_como_usuario(cliente, db.session.get(Usuario, usuario_ids[0]))
+    cliente.post('/responder', data={'pergunta_id': objetivas[0], 'resposta': 'a'})
+    objetiva = db.session.scalar(db.select(Resposta.id).where(Resposta.pergunta_id == objetivas[0]))
+    entrar_como_admin(cliente)
+
+    recusada = cliente.post('/api/admin/correcoes', json={'correcoes': [{'resposta_id': ids[0], 'status': 'otimo'}]})
+    assert recusada.status_code == 400
+
+    resposta = cliente.post('/api/admin/correcoes', json={'correcoes': [
+        {'resposta_id': ids[0], 'status': 'correto'}, {'resposta_id': ids[1], 'status': 'incorreto', 'feedback': 'Revise.'},
+        {'resposta_id': objetiva, 'status': 'incorreto'}]})
+    assert resposta.get_json() == {'corrigidas': ids, 'ignoradas': [objetiva]}
+    db.session.expire_all()
+    assert db.session.get(Resposta, objetiva).status_correcao == 'correto' # objetiva não passa pela correção manual
+    assert (db.session.get(Resposta, ids[1]).pontos, db.session.get(Resposta, ids[1]).feedback_admin) == (0, 'Revise.')
+    assert estado_dos_placares() == estado_reconstruido()
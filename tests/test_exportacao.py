@@ -0,0 +1,44 @@
+# Exportação detalhada: CSV (padrão) sai em fluxo na própria requisição; XLSX vira tarefa.
+
+import io
+
+import openpyxl
+
+import app as modulo_app
+from app import db, Tarefa, Resposta
+from conftest import criar_massa, entrar_como_admin
+
+def _com_respostas():
+    usuario_ids, objetivas, _ = criar_massa(setores=2, usuarios_por_setor=2, objetivas=3, discursivas=0)
+    db.session.add_all(Resposta(usuario_id=u, pergunta_id=p, resposta_dada='a', pontos=100, status_correcao='correto')
+                       for u in usuario_ids for p in objetivas)
+    db.session.commit()
+    return len(usuario_ids) * len(objetivas)
+
+def test_csv_e_o_padrao_e_sai_em_fluxo(app, cliente):
+    total = _com_respostas()
+    entrar_como_admin(cliente)
+    resposta = cliente.get('/admin/relatorios/exportar_detalhado?tipo=quiz')
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'text/csv'
+    assert resposta.is_streamed
+    linhas = resposta.get_data(as_text=True).lstrip('\ufeff').splitlines()
+    assert linhas[0].startswith('Colaborador')
+    assert len(linhas) == total + 1
+    assert Tarefa.query.count() == 0
+
+def test_xlsx_e_gerado_fora_da_requisicao(app, cliente, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'PASTA_RESULTADOS_TAREFAS', str(tmp_path))
+    total = _com_respostas()
+    entrar_como_admin(cliente)
+    resposta = cliente.get('/admin/relatorios/exportar_detalhado?tipo=quiz&formato=xlsx')
+    tarefa_id = Tarefa.query.filter_by(tipo='exportar_respostas_detalhado').one().id
+    assert resposta.status_code == 302
+    assert resposta.location.endswith(f'/admin/tarefas/{tarefa_id}')
+
+    modulo_app._executor().shutdown(wait=True) # espera a thread terminar
+    modulo_app._executor_arquivos = None
+    db.session.expire_all()
+    assert db.session.get(Tarefa, tarefa_id).status == 'concluida'
+    planilha = openpyxl.load_workbook(io.BytesIO(cliente.get(f'/admin/tarefas/{tarefa_id}/download').data)).active
+    assert planilha.max_row == total + 1
@@ -0,0 +1,81 @@
+# Importação de planilhas: pré-visualização guardada no servidor e gravação em lotes, em que uma
+# linha que o banco recusa derruba só o seu savepoint.
+
+import io
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from app import (db, Departamento, Pergunta, ImportacaoPlanilha, LinhaImportacaoPlanilha, LINHAS_POR_PAGINA_PREVIA,
+                 pergunta_departamento_association, importar_perguntas_em_massa)
+from conftest import entrar_como_admin
+
+LINHAS = 50_000
+LINHA_RECUSADA = 23_456 # passa na validação, mas o banco recusa (gatilho abaixo)
+LINHA_INVALIDA = 40_000 # barrada já na validação
+
+def _planilha():
+    linhas = [{
+        'tipo': 'multipla_escolha', 'texto': f'Pergunta {i}', 'opcao_a': 'A', 'opcao_b': 'B', 'opcao_c': 'C', 'opcao_d': 'D',
+        'resposta_correta': 'abcd'[i % 4], 'data_liberacao': '01/03/2025', 'tempo_limite': '30',
+        'setores': 'Vendas; RH' if i % 10 == 0 else 'todos',
+    } for i in range(LINHAS)]
+    linhas[LINHA_RECUSADA]['texto'] = 'Recusada pelo banco'
+    linhas[LINHA_INVALIDA]['tipo'] = 'enquete'
+    return pd.DataFrame(linhas)
+
+@pytest.fixture
+def banco_recusa_uma_linha(app):
+    db.session.add_all([Departamento(nome='Vendas'), Departamento(nome='RH')])
+    db.session.commit()
+    db.session.execute(text("CREATE TRIGGER recusa_pergunta BEFORE INSERT ON pergunta WHEN NEW.texto = 'Recusada pelo banco' "
+                            "BEGIN SELECT RAISE(ABORT, 'pergunta recusada'); END"))
+    db.session.commit()
+
+def test_linha_recusada_descarta_so_o_proprio_savepoint(app, banco_recusa_uma_linha):
+    gravadas, erros, _ = importar_perguntas_em_massa(_planilha())
+
+    assert (gravadas, erros) == (LINHAS - 2, 2)
+    assert Pergunta.query.count() == LINHAS - 2
+    textos = {t for t, in db.session.query(Pergunta.texto)}
+    assert 'Recusada pelo banco' not in textos
+    # As vizinhas da recusada, no mesmo lote de 1000, ficaram
+    assert {f'Pergunta {LINHA_RECUSADA - 1}', f'Pergunta {LINHA_RECUSADA + 1}'} <= textos
+    assert f'Pergunta {LINHA_INVALIDA}' not in textos
+    # Setores específicos de uma em cada dez linhas válidas, dois setores cada
+    com_setores = sum(1 for i in range(0, LINHAS, 10) if i != LINHA_INVALIDA)
+    assert db.session.query(pergunta_departamento_association).count() == 2 * com_setores
+    assert Pergunta.query.filter_by(para_todos_setores=False).count() == com_setores
+
+def test_previa_fica_no_servidor_e_a_sessao_guarda_so_o_token(app, cliente):
+    linhas = _planilha().head(3000).assign(setores='todos')
+    linhas.loc[10, 'resposta_correta'] = 'z' # inválida, corrigida na tela
+    arquivo = io.BytesIO()
+    linhas.to_excel(arquivo, index=False)
+    arquivo.seek(0)
+    entrar_como_admin(cliente)
+    resposta = cliente.post('/admin/upload_planilha', data={'arquivo_planilha': (arquivo, 'perguntas.xlsx')},
+                            content_type='multipart/form-data')
+    assert resposta.status_code == 302 and resposta.location.endswith('/admin/preview_csv')
+
+    # 3000 linhas no banco, e o cookie com só o token
+    with cliente.session_transaction() as sessao:
+        assert set(sessao) == {'admin_logged_in', 'importacao_token'}
+    assert all(len(cabecalho) < 200 for cabecalho in resposta.headers.getlist('Set-Cookie'))
+    assert LinhaImportacaoPlanilha.query.count() == 3000
+    assert LinhaImportacaoPlanilha.query.filter_by(valida=False).one().posicao == 10
+
+    # A pré-visualização mostra uma página por vez
+    pagina = cliente.get('/admin/preview_csv').get_data(as_text=True)
+    assert pagina.count('name="row-') == LINHAS_POR_PAGINA_PREVIA * len(linhas.columns)
+
+    # A correção vale para a linha guardada, e a importação grava todas
+    corrigida = {f'row-10-{coluna}': str(valor) for coluna, valor in linhas.loc[10].items()}
+    corrigida['row-10-resposta_correta'] = 'a'
+    resposta = cliente.post('/admin/processar_edicao_csv', data={**corrigida, 'acao': 'importar'})
+    assert resposta.status_code == 302
+    assert Pergunta.query.count() == 3000
+    assert ImportacaoPlanilha.query.count() == 0
+    with cliente.session_transaction() as sessao:
+        assert 'importacao_token' not in sessao
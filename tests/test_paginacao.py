@@ -0,0 +1,53 @@
+# Paginação por chave: percorrendo todas as páginas, cada linha aparece uma vez só.
+
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from app import db, Resposta, paginar_por_chave
+from conftest import criar_massa
+from migracoes import aplicar_migracoes, tabela_versao
+
+def _todas_as_paginas(query, por_pagina):
+    ids, cursor = [], None
+    while True:
+        pagina = paginar_por_chave(query, Resposta.data_resposta, Resposta.id, apos=cursor, por_pagina=por_pagina)
+        ids += [r.id for r in pagina.itens]
+        if not pagina.proxima:
+            return ids
+        cursor = pagina.proxima
+
+def test_resposta_antiga_sem_data_entra_na_paginacao(app):
+    usuario_ids, objetivas, _ = criar_massa(setores=1, usuarios_por_setor=2, objetivas=6, discursivas=0)
+    agora = datetime.utcnow()
+    db.session.add_all(Resposta(usuario_id=u, pergunta_id=p, resposta_dada='a', pontos=0, status_correcao='incorreto',
+                                data_resposta=agora - timedelta(minutes=i))
+                       for i, (u, p) in enumerate((u, p) for u in usuario_ids for p in objetivas[:-1]))
+    db.session.commit()
+    db.session.remove()
+
+    # Banco de antes da migração 10: coluna ainda aceita nulo, e uma resposta ficou sem data
+    with db.engine.begin() as conn:
+        metadados = sa.MetaData()
+        for nome in ('departamento', 'usuario', 'pergunta'): # só para as chaves estrangeiras; não são recriadas
+            db.metadata.tables[nome].to_metadata(metadados)
+        legado = Resposta.__table__.to_metadata(metadados)
+        legado.c.data_resposta.nullable = True
+        linhas = conn.execute(sa.select(Resposta.__table__)).mappings().all()
+        Resposta.__table__.drop(conn)
+        legado.create(conn)
+        conn.execute(legado.insert(), [dict(linha) for linha in linhas])
+        conn.execute(legado.insert().values(usuario_id=usuario_ids[0], pergunta_id=objetivas[-1], resposta_dada='a',
+                                            pontos=0, status_correcao='incorreto', feedback_visto=False, data_resposta=None))
+        conn.execute(tabela_versao.delete().where(tabela_versao.c.versao == 10))
+    assert [versao for versao, _ in aplicar_migracoes()] == [10]
+
+    total = Resposta.query.count()
+    assert total == 2 * 5 + 1
+    ids = _todas_as_paginas(Resposta.query, por_pagina=3)
+    assert len(ids) == total and len(set(ids)) == total
+    assert Resposta.query.filter(Resposta.data_resposta.is_(None)).count() == 0
+    # A tabela recriada pela migração (SQLite) volta com todos os índices do modelo
+    assert {i['name'] for i in sa.inspect(db.engine).get_indexes('resposta')} >= {i.name for i in Resposta.__table__.indexes}
+    # Só as respostas de um usuário, como em "Minhas Respostas"
+    assert len(_todas_as_paginas(Resposta.query.filter_by(usuario_id=usuario_ids[0]), por_pagina=2)) == 6
@@ -0,0 +1,56 @@
+# Fluxo do quiz: API JSON e cronômetro decidido no servidor, pela primeira entrega de cada pergunta.
+
+import re
+from datetime import timedelta
+
+from app import db, Usuario, EntregaPergunta, BONUS_POR_SEGUNDO
+from conftest import criar_massa, entrar_como_usuario
+
+def _token_da_pagina(html):
+    return re.search(r'name="token" value="([^"]+)"', html).group(1)
+
+def _timer_da_pagina(html):
+    return int(re.search(r'<div id="timer" class="timer">(\d+)</div>', html).group(1))
+
+def test_recarregar_a_pagina_nao_reinicia_o_cronometro(app, cliente):
+    usuario_ids, objetivas, _ = criar_massa(setores=1, usuarios_por_setor=1, objetivas=1, discursivas=0)
+    entrar_como_usuario(cliente, db.session.get(Usuario, usuario_ids[0]))
+
+    primeira = cliente.get('/quiz').get_data(as_text=True)
+    assert _timer_da_pagina(primeira) == 30
+    # 20 segundos lendo a pergunta...
+    entrega = db.session.get(EntregaPergunta, (usuario_ids[0], objetivas[0]))
+    entrega.entregue_em -= timedelta(seconds=20)
+    db.session.commit()
+
+    # ...e a página recarregada (ou a pergunta pedida de novo pela API) não devolve o tempo perdido
+    recarregada = cliente.get('/quiz').get_data(as_text=True)
+    assert _timer_da_pagina(recarregada) <= 10
+    pela_api = cliente.get('/api/quiz/perguntas?quantidade=1').get_json()['perguntas'][0]
+    assert pela_api['tempo_restante'] <= 10
+    assert EntregaPergunta.query.count() == 1
+
+    resposta = cliente.post('/api/quiz/respostas', json={'pergunta_id': objetivas[0], 'resposta': 'a',
+                                                         'token': _token_da_pagina(recarregada)})
+    assert resposta.status_code == 201
+    assert resposta.get_json()['pontos'] <= 100 + 10 * BONUS_POR_SEGUNDO
+
+def test_api_entrega_perguntas_em_lote_e_responde_com_a_proxima(app, cliente):
+    assert cliente.get('/api/quiz/perguntas').status_code == 401
+    usuario_ids, objetivas, _ = criar_massa(setores=1, usuarios_por_setor=1, objetivas=5, discursivas=1)
+    entrar_como_usuario(cliente, db.session.get(Usuario, usuario_ids[0]))
+
+    lote = cliente.get('/api/quiz/perguntas?quantidade=3').get_json()
+    assert lote['pendentes'] == 5
+    assert [p['id'] for p in lote['perguntas']] == objetivas[:3] # só objetivas, da mais antiga para a mais nova
+    assert all(p['token'] and p['opcoes'] for p in lote['perguntas'])
+    assert all('resposta_correta' not in p for p in lote['perguntas'])
+
+    primeira = lote['perguntas'][0]
+    resposta = cliente.post('/api/quiz/respostas', json={'pergunta_id': primeira['id'], 'resposta': 'a', 'token': primeira['token']})
+    assert resposta.status_code == 201
+    dados = resposta.get_json()
+    assert dados['correta'] and dados['pontos'] >= 100
+    assert dados['placar'] == {'pontos_totais': dados['pontos'], 'total_respostas': 1, 'total_acertos': 1}
+    assert dados['proxima']['id'] == objetivas[1] and dados['pendentes'] == 4
+    assert cliente.post('/api/quiz/respostas', json={'resposta': 'a'}).status_code == 400
@@ -0,0 +1,91 @@
+# Relatórios do admin: resumo diário por usuário (desempenho por período) e análises por período.
+
+from datetime import date, datetime, timedelta
+
+import app as modulo_app
+from app import (db, Usuario, Resposta, BONUS_POR_SEGUNDO, corrigir_respostas, emitir_token_pergunta, reconstruir_placares,
+                 reconstruir_resumos_diarios, _calcular_dados_relatorio, _calcular_analises_periodo)
+from conftest import criar_massa, entrar_como_admin, entrar_como_usuario, estado_dos_placares, estado_reconstruido
+
+def _esperado(inicio, fim):
+    """Totais por usuário calculados direto das respostas, sem o resumo diário."""
+    totais = {u.nome: [0, 0, 0] for u in Usuario.query}
+    for resposta in Resposta.query:
+        dia = resposta.data_resposta.date()
+        if (inicio and dia < inicio) or (fim and dia > fim):
+            continue
+        linha = totais[db.session.get(Usuario, resposta.usuario_id).nome]
+        linha[0] += 1
+        linha[1] += (resposta.pontos or 0) > 0 or resposta.status_correcao in ('correto', 'parcialmente_correto')
+        linha[2] += resposta.pontos or 0
+    return totais
+
+def test_relatorio_por_periodo_soma_o_resumo_diario(app):
+    usuario_ids, objetivas, discursivas = criar_massa(setores=2, usuarios_por_setor=2, objetivas=4, discursivas=1)
+    agora = datetime.utcnow()
+    # Histórico de dias anteriores, como numa base migrada: placar e resumo vêm da reconstrução
+    for i, usuario_id in enumerate(usuario_ids):
+        for d, pergunta_id in enumerate(objetivas[:3]):
+            acertou = (i + d) % 2 == 0
+            db.session.add(Resposta(usuario_id=usuario_id, pergunta_id=pergunta_id, resposta_dada='a', pontos=150 if acertou else 0,
+                                    status_correcao='correto' if acertou else 'incorreto', data_resposta=agora - timedelta(days=10 * d + 1)))
+    db.session.flush()
+    reconstruir_placares()
+    reconstruir_resumos_diarios()
+    db.session.commit()
+
+    # Hoje, pelos caminhos incrementais: quiz pelo formulário e atividade discursiva corrigida pelo admin
+    for usuario_id in usuario_ids[:2]:
+        cliente = app.test_client()
+        entrar_como_usuario(cliente, db.session.get(Usuario, usuario_id))
+        cliente.post('/responder', data={'pergunta_id': objetivas[3], 'resposta': 'a', 'token': emitir_token_pergunta(objetivas[3], usuario_id)})
+        cliente.post(f'/atividade/{discursivas[0]}', data={'texto_discursivo': 'Minha resposta.'})
+    pendentes = [r.id for r in Resposta.query.filter_by(status_correcao='pendente')]
+    assert len(pendentes) == 2
+    corrigir_respostas({pendentes[0]: ('correto', 'Muito bem.'), pendentes[1]: ('parcialmente_correto', None)})
+    db.session.commit()
+
+    assert estado_dos_placares() == estado_reconstruido()
+    hoje = agora.date() # as respostas e o resumo usam o dia em UTC
+    for inicio, fim in [(None, None), (hoje, hoje), (hoje - timedelta(days=15), None), (None, hoje - timedelta(days=5))]:
+        relatorio = {linha['nome']: [linha['total_respostas'], linha['respostas_corretas'], linha['pontuacao_total']]
+                     for linha in _calcular_dados_relatorio(None, inicio, fim)}
+        assert relatorio == _esperado(inicio, fim), (inicio, fim)
+    assert sum(linha[0] for linha in _esperado(hoje, hoje).values()) == 4
+
+def test_analises_por_periodo(app, cliente, monkeypatch):
+    usuario_ids, objetivas, _ = criar_massa(setores=2, usuarios_por_setor=5, objetivas=3, discursivas=0)
+    setor_1, setor_2 = usuario_ids[:5], usuario_ids[5:]
+    # Objetiva 1 em janeiro: setor 1 acerta em 10 s, setor 2 erra. Objetiva 2 em fevereiro: todos
+    # acertam em 20 s. Objetiva 3 em março, fora do período.
+    def _responder(usuarios, pergunta_id, quando, segundos=None):
+        for usuario_id in usuarios:
+            pontos = 0 if segundos is None else 100 + (30 - segundos) * BONUS_POR_SEGUNDO
+            db.session.add(Resposta(usuario_id=usuario_id, pergunta_id=pergunta_id, resposta_dada='a', pontos=pontos,
+                                    status_correcao='correto' if pontos else 'incorreto', data_resposta=quando))
+    _responder(setor_1, objetivas[0], datetime(2025, 1, 15, 12), segundos=10)
+    _responder(setor_2, objetivas[0], datetime(2025, 1, 16, 12))
+    _responder(usuario_ids, objetivas[1], datetime(2025, 2, 10, 12), segundos=20)
+    _responder(usuario_ids, objetivas[2], datetime(2025, 3, 5, 12), segundos=5)
+    db.session.commit()
+    inicio, fim = date(2025, 1, 1), date(2025, 2, 28)
+
+    analises = _calcular_analises_periodo(inicio, fim)
+    assert analises['total_respostas'] == 20
+    assert analises['periodos'] == ['01/2025', '02/2025']
+    assert analises['tendencias'] == [{'setor': 'Todos os setores', 'valores': [50.0, 100.0]},
+                                      {'setor': 'Setor 1', 'valores': [100.0, 100.0]},
+                                      {'setor': 'Setor 2', 'valores': [0.0, 100.0]}]
+    assert [(d['texto'], d['total'], d['percentual_erro']) for d in analises['dificuldade']] == [('Objetiva 1', 10, 50.0), ('Objetiva 2', 10, 0.0)]
+    assert [(t['faixa'], t['quantidade']) for t in analises['tempos'] if t['quantidade']] == [('10–15 s', 5), ('20–25 s', 10)]
+    assert (analises['tempo_p50'], analises['tempo_p90']) == (20, 20)
+
+    # Lido em blocos pequenos, o resultado é o mesmo; com filtro de setor, só as respostas dele
+    monkeypatch.setattr(modulo_app, 'LINHAS_POR_BLOCO_ANALISES', 3)
+    assert _calcular_analises_periodo(inicio, fim) == analises
+    setor_2_id = db.session.get(Usuario, setor_2[0]).departamento_id
+    assert _calcular_analises_periodo(inicio, fim, setor_2_id)['total_respostas'] == 10
+
+    entrar_como_admin(cliente)
+    pagina = cliente.get('/admin/analytics/periodo?inicio=2025-01-01&fim=2025-02-28')
+    assert pagina.status_code == 200 and 'Objetiva 1' in pagina.get_data(as_text=True)
@@ -0,0 +1,106 @@
+# Teste de estresse do registro idempotente das respostas do quiz: várias threads enviando a
+# mesma resposta ao mesmo tempo (duplo clique, POST reenviado, duas abas). Tem de sobrar uma
+# resposta por usuário e pergunta, contada uma vez só no placar.
+
+import threading
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from app import db, Departamento, Usuario, Pergunta, Resposta, PontuacaoUsuario, emitir_token_pergunta
+from conftest import criar_massa, entrar_como_usuario, estado_dos_placares, estado_reconstruido
+
+ENVIOS_SIMULTANEOS = 4 # cópias de cada resposta, disputando a mesma linha
+
+def test_envios_repetidos_gravam_uma_resposta_so(app):
+    usuario_ids, objetivas, _ = criar_massa(setores=2, usuarios_por_setor=4, objetivas=10, discursivas=0)
+    # Metade dos usuários responde pelo formulário (/responder), metade pela API JSON
+    pela_api = set(usuario_ids[::2])
+    status_api = defaultdict(Counter) # (usuario, pergunta) -> {status HTTP: quantidade}
+    pontos_api = {}
+    trava = threading.Lock()
+    largada = threading.Barrier(len(usuario_ids) * ENVIOS_SIMULTANEOS)
+    erros = []
+
+    def _enviar(usuario_id):
+        try:
+            cliente = app.test_client()
+            with app.app_context():
+                entrar_como_usuario(cliente, db.session.get(Usuario, usuario_id))
+            largada.wait()
+            # Todas as cópias seguem a mesma ordem, então disputam cada pergunta juntas
+            for i, pergunta_id in enumerate(objetivas):
+                dados = {'pergunta_id': pergunta_id, 'resposta': 'abcd'[(usuario_id + i) % 4],
+                         'token': emitir_token_pergunta(pergunta_id, usuario_id)}
+                if usuario_id in pela_api:
+                    resposta = cliente.post('/api/quiz/respostas', json=dados)
+                    with trava:
+                        status_api[usuario_id, pergunta_id][resposta.status_code] += 1
+                        if resposta.status_code == 201:
+                            pontos_api[usuario_id, pergunta_id] = resposta.get_json()['pontos']
+                else:
+                    resposta = cliente.post('/responder', data=dados)
+                    assert resposta.status_code == 302, resposta.status_code
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=_enviar, args=(u,)) for u in usuario_ids for _ in range(ENVIOS_SIMULTANEOS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not erros, erros
+
+    # Uma resposta por usuário e pergunta
+    linhas = Counter(db.session.query(Resposta.usuario_id, Resposta.pergunta_id).all())
+    assert len(linhas) == len(usuario_ids) * len(objetivas)
+    assert set(linhas.values()) == {1}
+
+    # Pela API, exatamente um envio de cada resposta é aceito (201); os outros recebem 409
+    for par, contagem in status_api.items():
+        assert contagem == Counter({201: 1, 409: ENVIOS_SIMULTANEOS - 1}), (par, contagem)
+    gravados = dict(((r.usuario_id, r.pergunta_id), r.pontos) for r in Resposta.query.filter(Resposta.usuario_id.in_(pela_api)))
+    assert pontos_api == gravados
+
+    # Placar: cada resposta contada uma vez
+    for placar in PontuacaoUsuario.query:
+        assert placar.total_respostas == len(objetivas)
+    assert estado_dos_placares() == estado_reconstruido()
+
+def _objetiva(**campos):
+    pergunta = Pergunta(tipo='verdadeiro_falso', texto='Extra', resposta_correta='v', tempo_limite=30,
+                        data_liberacao=date.today(), para_todos_setores=True)
+    for campo, valor in campos.items():
+        setattr(pergunta, campo, valor)
+    db.session.add(pergunta)
+    db.session.commit()
+    return pergunta.id
+
+def test_pergunta_indisponivel_nao_e_confundida_com_resposta_repetida(app, cliente):
+    usuario_ids, objetivas, discursivas = criar_massa(setores=2, usuarios_por_setor=1, objetivas=1, discursivas=1)
+    usuario = db.session.get(Usuario, usuario_ids[0])
+    outro_setor = db.session.get(Departamento, db.session.get(Usuario, usuario_ids[1]).departamento_id)
+    indisponiveis = {
+        'inexistente': 999999,
+        'discursiva': discursivas[0],
+        'futura': _objetiva(data_liberacao=date.today() + timedelta(days=1)),
+        'de outro setor': _objetiva(para_todos_setores=False, departamentos=[outro_setor]),
+    }
+    entrar_como_usuario(cliente, usuario)
+
+    def _responder(pergunta_id):
+        return cliente.post('/api/quiz/respostas', json={'pergunta_id': pergunta_id, 'resposta': 'v',
+                                                         'token': emitir_token_pergunta(pergunta_id, usuario.id)})
+
+    for caso, pergunta_id in indisponiveis.items():
+        assert _responder(pergunta_id).status_code == 404, caso
+    assert Resposta.query.count() == 0
+
+    assert _responder(objetivas[0]).status_code == 201
+    assert _responder(objetivas[0]).status_code == 409
+
+    # Pelo formulário, o aviso também diz o que aconteceu
+    pagina = cliente.post('/responder', data={'pergunta_id': indisponiveis['futura'], 'resposta': 'v'}, follow_redirects=True)
+    assert 'Pergunta não disponível para você.' in pagina.get_data(as_text=True)
+    pagina = cliente.post('/responder', data={'pergunta_id': objetivas[0], 'resposta': 'a'}, follow_redirects=True)
+    assert 'Esta pergunta já foi respondida.' in pagina.get_data(as_text=True)
+    assert Resposta.query.count() == 1
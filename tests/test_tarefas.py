@@ -0,0 +1,45 @@
+# Fila de tarefas: recuperação das tarefas presas em 'executando' quando o worker morre no meio.
+
+from datetime import datetime, timedelta
+
+from app import db, Tarefa, recuperar_tarefas_interrompidas
+
+def _tarefa_presa(tentativas, max_tentativas=3):
+    tarefa_presa = Tarefa(tipo='exportar_relatorios', status='executando', tentativas=tentativas, max_tentativas=max_tentativas)
+    db.session.add(tarefa_presa)
+    db.session.commit()
+    # O worker parou de atualizar a tarefa há duas horas
+    db.session.execute(db.update(Tarefa).where(Tarefa.id == tarefa_presa.id).values(atualizada_em=datetime.utcnow() - timedelta(hours=2)))
+    db.session.commit()
+    return tarefa_presa.id
+
+def test_interrupcao_conta_como_tentativa_e_esgota_no_limite(app):
+    volta_para_fila = _tarefa_presa(tentativas=0)
+    ultima_tentativa = _tarefa_presa(tentativas=2)
+    sem_worker = _tarefa_presa(tentativas=0, max_tentativas=1) # executada na própria requisição
+
+    assert recuperar_tarefas_interrompidas() == 1
+    db.session.expire_all()
+    assert (db.session.get(Tarefa, volta_para_fila).status, db.session.get(Tarefa, volta_para_fila).tentativas) == ('pendente', 1)
+    assert (db.session.get(Tarefa, ultima_tentativa).status, db.session.get(Tarefa, ultima_tentativa).tentativas) == ('falhou', 3)
+    assert db.session.get(Tarefa, sem_worker).status == 'falhou'
+
+def test_tarefa_que_derruba_o_worker_para_de_voltar(app):
+    tarefa_id = _tarefa_presa(tentativas=0)
+    for _ in range(5):
+        # Cada volta: o worker reserva a tarefa, morre no meio e a manutenção a recupera
+        db.session.execute(db.update(Tarefa).where(Tarefa.id == tarefa_id, Tarefa.status == 'pendente').values(
+            status='executando', atualizada_em=datetime.utcnow() - timedelta(hours=2)))
+        db.session.commit()
+        recuperar_tarefas_interrompidas()
+    db.session.expire_all()
+    tarefa_final = db.session.get(Tarefa, tarefa_id)
+    assert (tarefa_final.status, tarefa_final.tentativas) == ('falhou', 3)
+
+def test_tarefa_ainda_ativa_nao_e_recuperada(app):
+    ativa = Tarefa(tipo='exportar_relatorios', status='executando')
+    db.session.add(ativa)
+    db.session.commit()
+    assert recuperar_tarefas_interrompidas() == 0
+    db.session.expire_all()
+    assert (db.session.get(Tarefa, ativa.id).status, db.session.get(Tarefa, ativa.id).tentativas) == ('executando', 0)
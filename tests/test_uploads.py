@@ -0,0 +1,69 @@
+# Envio de anexos em segundo plano: registrado como tarefa, para não se perder se o processo cair.
+
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as modulo_app
+from app import db, Tarefa, Resposta, agendar_upload, reservar_proxima_tarefa, executar_tarefa, retomar_uploads_interrompidos
+from armazenamento import ArmazenamentoLocal
+from conftest import criar_massa
+
+@pytest.fixture
+def armazenamento(app, tmp_path, monkeypatch):
+    destino = ArmazenamentoLocal(str(tmp_path / 'armazenamento'))
+    monkeypatch.setattr(modulo_app, 'armazenamento', destino)
+    monkeypatch.setitem(app.config, 'PASTA_UPLOADS_PENDENTES', str(tmp_path / 'pendentes'))
+    return destino
+
+def _resposta_com_anexo_pendente(app):
+    usuario_ids, _, discursivas = criar_massa(setores=1, usuarios_por_setor=1, objetivas=0, discursivas=1)
+    resposta = Resposta(usuario_id=usuario_ids[0], pergunta_id=discursivas[0], texto_discursivo='Segue anexo.', status_correcao='pendente')
+    db.session.add(resposta)
+    db.session.commit()
+    os.makedirs(app.config['PASTA_UPLOADS_PENDENTES'], exist_ok=True)
+    caminho = os.path.join(app.config['PASTA_UPLOADS_PENDENTES'], 'abc_relatorio.pdf')
+    with open(caminho, 'wb') as arquivo:
+        arquivo.write(b'%PDF-1.4 teste')
+    return resposta.id, caminho
+
+def test_sem_worker_envia_pela_thread_e_registra_a_tarefa(app, armazenamento):
+    resposta_id, caminho = _resposta_com_anexo_pendente(app)
+    agendar_upload(caminho, 'relatorio.pdf', 'anexos', Resposta, resposta_id, 'anexo_resposta')
+    modulo_app._executor().shutdown(wait=True) # espera a thread terminar
+    modulo_app._executor_arquivos = None
+
+    db.session.expire_all()
+    tarefa_upload = Tarefa.query.filter_by(tipo='enviar_upload').one()
+    assert tarefa_upload.status == 'concluida'
+    assert db.session.get(Resposta, resposta_id).anexo_resposta.startswith('/static/uploads/anexos/')
+    assert not os.path.exists(caminho)
+
+def test_com_worker_o_envio_vai_para_a_fila(app, armazenamento, monkeypatch):
+    monkeypatch.setitem(app.config, 'TAREFAS_EM_SEGUNDO_PLANO', True)
+    resposta_id, caminho = _resposta_com_anexo_pendente(app)
+    agendar_upload(caminho, 'relatorio.pdf', 'anexos', Resposta, resposta_id, 'anexo_resposta')
+    assert db.session.get(Resposta, resposta_id).anexo_resposta is None # nada enviado antes do worker
+
+    executar_tarefa(reservar_proxima_tarefa())
+    db.session.expire_all()
+    assert db.session.get(Resposta, resposta_id).anexo_resposta is not None
+    assert not os.path.exists(caminho)
+
+def test_envio_interrompido_e_retomado(app, armazenamento):
+    resposta_id, caminho = _resposta_com_anexo_pendente(app)
+    # Processo encerrado com o envio em andamento: a tarefa ficou em 'executando' e o arquivo no disco
+    parametros = dict(caminho=caminho, nome_original='relatorio.pdf', pasta='anexos', modelo='Resposta',
+                      registro_id=resposta_id, coluna='anexo_resposta')
+    interrompida = Tarefa(tipo='enviar_upload', parametros=json.dumps(parametros), status='executando',
+                          atualizada_em=datetime.utcnow() - timedelta(hours=1))
+    db.session.add(interrompida)
+    db.session.commit()
+
+    assert retomar_uploads_interrompidos() == 1
+    db.session.expire_all()
+    assert db.session.get(Tarefa, interrompida.id).status == 'concluida'
+    assert db.session.get(Resposta, resposta_id).anexo_resposta is not None
+    assert retomar_uploads_interrompidos() == 0
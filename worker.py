@@ -0,0 +1,53 @@
+# Worker da fila de tarefas (exportações, importações e e-mails).
+#
+# Rode em um processo separado do gunicorn, com a mesma configuração do app:
+#
+#     TAREFAS_EM_SEGUNDO_PLANO=1 python worker.py
+#
+# Mais de um worker pode rodar ao mesmo tempo; cada tarefa é reservada por apenas um deles.
+
+import logging
+import signal
+import time
+from datetime import datetime, timedelta
+
+from app import app, reservar_proxima_tarefa, executar_tarefa, recuperar_tarefas_interrompidas, limpar_tarefas_antigas, limpar_importacoes_expiradas
+import enviar_notificacoes  # Registra a tarefa 'enviar_notificacoes'
+
+INTERVALO_SEM_TAREFAS = 2 # segundos entre consultas quando a fila está vazia
+INTERVALO_MANUTENCAO = timedelta(hours=1)
+
+encerrar = False
+
+def _pedir_encerramento(signum, frame):
+    # Termina a tarefa atual antes de sair
+    global encerrar
+    encerrar = True
+
+def executar_worker():
+    signal.signal(signal.SIGTERM, _pedir_encerramento)
+    signal.signal(signal.SIGINT, _pedir_encerramento)
+    proxima_manutencao = datetime.utcnow()
+
+    app.logger.info("Worker iniciado. Aguardando tarefas...")
+    while not encerrar:
+        with app.app_context():
+            if datetime.utcnow() >= proxima_manutencao:
+                recuperadas = recuperar_tarefas_interrompidas()
+                apagadas = limpar_tarefas_antigas()
+                previas = limpar_importacoes_expiradas()
+                app.logger.info(f"Manutenção da fila: {recuperadas} tarefa(s) recuperada(s), {apagadas} apagada(s), {previas} pré-visualização(ões) expirada(s) removida(s).")
+                proxima_manutencao = datetime.utcnow() + INTERVALO_MANUTENCAO
+
+            tarefa_atual = reservar_proxima_tarefa()
+            if tarefa_atual:
+                app.logger.info(f"Executando tarefa {tarefa_atual.id} ({tarefa_atual.tipo})")
+                executar_tarefa(tarefa_atual)
+                continue
+        time.sleep(INTERVALO_SEM_TAREFAS)
+    app.logger.info("Worker encerrado.")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    app.logger.setLevel(logging.INFO)
+    executar_worker()